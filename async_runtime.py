@@ -0,0 +1,269 @@
+"""
+asyncio runtime (RUNTIME=asyncio).
+
+Update polling, the price-check scheduler and product page downloads share one
+event loop. Pages are fetched with aiohttp, so an in-flight check costs a socket
+and a small coroutine instead of a thread; parsing is CPU-bound and runs in a
+thread pool. Telegram handlers keep running on python-telegram-bot's dispatcher
+threads, which receive the updates this loop polls.
+"""
+
+import asyncio
+import logging
+import signal
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from telegram import Update
+
+from config import USER_AGENT, STREAM_FETCH, STREAM_CHUNK_SIZE, ASYNC_MAX_INFLIGHT, ASYNC_PARSE_WORKERS
+from egress import NoEndpointAvailable, BLOCK_STATUSES
+from scraper import (
+    is_valid_trendyol_url, parse_page, record_stream_stats, record_probe_stats, get_archive, get_egress,
+    split_variant, variant_result, StreamingExtractor, StockProbe, EGRESS_WAIT
+)
+
+logger = logging.getLogger(__name__)
+
+# getUpdates long-poll timeout and retry delay after a failed poll (seconds)
+POLL_TIMEOUT = 10
+POLL_RETRY_DELAY = 5
+
+# Per-read timeout of page downloads, like the requests-based fetcher
+FETCH_TIMEOUT = 10
+
+class AsyncFetcher:
+    """Download product pages with aiohttp and parse them in a thread pool."""
+
+    def __init__(self, max_inflight=ASYNC_MAX_INFLIGHT, parse_workers=ASYNC_PARSE_WORKERS):
+        self.max_inflight = max_inflight
+        self._parse_pool = ThreadPoolExecutor(parse_workers, thread_name_prefix='parse')
+        self._session = None
+
+    async def __aenter__(self):
+        # trust_env picks up HTTP_PROXY/NO_PROXY like requests does
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.max_inflight),
+            headers={'User-Agent': USER_AGENT},
+            timeout=aiohttp.ClientTimeout(total=None, sock_connect=FETCH_TIMEOUT, sock_read=FETCH_TIMEOUT),
+            trust_env=True,
+        )
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self._session.close()
+        self._parse_pool.shutdown(wait=False)
+
+    async def fetch_page(self, url, with_variants=False):
+        """Download a page, following redirects; returns (status_code, final_url, html)."""
+        archive = get_archive()
+        if archive and archive.replaying:
+            status_code, html = archive.replay(url)
+            return status_code, url, html
+
+        # Same routing as scraper.http_request: one retry on another free endpoint
+        egress = get_egress()
+        result, error = None, None
+        tried = []
+        for wait in ((EGRESS_WAIT, 0) if len(egress) > 1 else (EGRESS_WAIT,)):
+            try:
+                async with egress.lease_async(wait, tried) as lease:
+                    tried.append(lease.endpoint)
+                    result = await self._download(url, lease, with_variants)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                result, error = None, e
+                continue
+            except NoEndpointAvailable:
+                if not tried:
+                    raise
+                break
+            if result[0] not in BLOCK_STATUSES and result[0] < 500:
+                return result
+        if result is not None:
+            return result
+        raise error
+
+    async def _download(self, url, lease, with_variants=False):
+        """Download through a leased endpoint; returns (status_code, final_url, html)."""
+        endpoint = lease.endpoint
+        async with self._session.get(url, proxy=endpoint.proxy, headers=endpoint.headers) as response:
+            lease.status = response.status
+            full_url = str(response.url)
+            if response.status != 200 or not is_valid_trendyol_url(full_url):
+                return response.status, full_url, None
+
+            if not STREAM_FETCH:
+                return response.status, full_url, await response.text(errors='replace')
+
+            extractor = StreamingExtractor(with_variants)
+            early_closed = False
+            async for chunk in response.content.iter_chunked(STREAM_CHUNK_SIZE):
+                extractor.feed(chunk)
+                if extractor.complete:
+                    early_closed = True
+                    response.close()
+                    break
+
+            # aiohttp decompresses before handing out chunks, so these are decoded bytes;
+            # Content-Length only measures the savings of uncompressed responses
+            compressed = response.headers.get('Content-Encoding', 'identity') != 'identity'
+            record_stream_stats(len(extractor.buffer), early_closed,
+                                None if compressed else response.content_length)
+
+            html = bytes(extractor.buffer).decode(response.charset or 'utf-8', errors='replace')
+            return response.status, full_url, html
+
+    async def probe_stock(self, url):
+        """Async counterpart of scraper.probe_stock."""
+        probe = StockProbe()
+        archive = get_archive()
+        if archive and archive.replaying:
+            status_code, html = archive.replay(url)
+            if status_code == 200:
+                probe.feed(html.encode('utf-8'))
+            record_probe_stats(probe)
+            return probe.in_stock
+
+        try:
+            async with get_egress().lease_async(EGRESS_WAIT) as lease:
+                endpoint = lease.endpoint
+                async with self._session.get(url, proxy=endpoint.proxy, headers=endpoint.headers) as response:
+                    lease.status = response.status
+                    if response.status == 200 and is_valid_trendyol_url(str(response.url)):
+                        async for chunk in response.content.iter_chunked(STREAM_CHUNK_SIZE):
+                            probe.feed(chunk)
+                            if probe.in_stock is not None:
+                                response.close()
+                                break
+        except (aiohttp.ClientError, asyncio.TimeoutError, NoEndpointAvailable) as e:
+            logger.warning(f"Stock probe failed for {url}: {str(e) or type(e).__name__}")
+            return None
+
+        record_probe_stats(probe)
+        return probe.in_stock
+
+    async def scrape_product_info(self, url):
+        """Async counterpart of scraper.scrape_product_info."""
+        page_url, variant = split_variant(url)
+        result = await self.scrape_product_page(page_url, with_variants=bool(variant))
+        return variant_result(result, variant) if variant else result[:3]
+
+    async def scrape_product_page(self, url, with_variants=False):
+        """Async counterpart of scraper.scrape_product_page."""
+        if not is_valid_trendyol_url(url):
+            return None, None, "URL does not belong to Trendyol", {}
+        try:
+            status_code, full_url, html = await self.fetch_page(url, with_variants)
+            if not is_valid_trendyol_url(full_url):
+                return None, None, "URL does not belong to Trendyol", {}
+            if status_code != 200:
+                return None, None, f"Failed to access the product page. Status code: {status_code}", {}
+
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._parse_pool, parse_page, full_url, html, with_variants)
+        except (aiohttp.ClientError, asyncio.TimeoutError, NoEndpointAvailable) as e:
+            return None, None, f"Request error: {str(e) or type(e).__name__}", {}
+        except Exception as e:
+            logger.error(f"Error scraping {url}: {e}")
+            return None, None, f"Error scraping product: {str(e)}", {}
+
+async def _wait(event, timeout):
+    """Sleep for timeout seconds or until event is set; True if it was set."""
+    try:
+        await asyncio.wait_for(event.wait(), timeout)
+        return True
+    except asyncio.TimeoutError:
+        return False
+
+async def poll_updates(bot, update_queue, stop):
+    """Long-poll getUpdates and hand updates to the dispatcher thread."""
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=POLL_TIMEOUT + 10)) as session:
+        # A webhook left over from webhook mode would make getUpdates fail
+        try:
+            async with session.post(f'{bot.base_url}/deleteWebhook') as response:
+                await response.read()
+        except aiohttp.ClientError as e:
+            logger.error(f"Could not delete webhook: {e}")
+
+        offset = 0
+        while not stop.is_set():
+            try:
+                async with session.post(f'{bot.base_url}/getUpdates',
+                                        json={'offset': offset, 'timeout': POLL_TIMEOUT}) as response:
+                    payload = await response.json(content_type=None)
+                if not payload.get('ok'):
+                    raise aiohttp.ClientError(payload.get('description', 'getUpdates failed'))
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                logger.error(f"Error polling updates: {e}")
+                await _wait(stop, POLL_RETRY_DELAY)
+                continue
+
+            for data in payload['result']:
+                offset = data['update_id'] + 1
+                update_queue.put(Update.de_json(data, bot))
+
+async def run_periodic(job, interval, stop, first_delay=None):
+    """Run job every interval seconds (measured from the end of the previous run) until stop is set.
+
+    job may be a plain function or a coroutine function; returning False ends the loop.
+    The task sleeps until the next run instead of polling a schedule.
+    """
+    delay = interval if first_delay is None else first_delay
+    while not await _wait(stop, delay):
+        try:
+            result = job()
+            if asyncio.iscoroutine(result):
+                result = await result
+        except Exception as e:
+            logger.error(f"Error in scheduled job {getattr(job, '__name__', job)}: {e}")
+            result = None
+        if result is False:
+            return
+        delay = interval
+
+async def _serve(updater, fetcher, jobs, shutdown_event, drain_timeout):
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+
+    def on_signal(sig):
+        logger.info(f"Received signal {sig}, shutting down gracefully...")
+        shutdown_event.set()
+        stop.set()
+
+    for sig in (signal.SIGINT, signal.SIGTERM, signal.SIGABRT):
+        loop.add_signal_handler(sig, on_signal, sig)
+
+    async with fetcher:
+        poller = asyncio.create_task(poll_updates(updater.bot, updater.update_queue, stop))
+        tasks = [asyncio.create_task(run_periodic(job, interval, stop, first_delay))
+                 for job, interval, first_delay in jobs]
+        logger.info("Bot started (asyncio runtime)!")
+
+        await stop.wait()
+
+        # Drain: let an in-flight check cycle finish its current products
+        poller.cancel()
+        done, pending = await asyncio.wait(tasks, timeout=drain_timeout)
+        if pending:
+            logger.warning("Scheduler did not finish its in-flight check in time")
+            for task in pending:
+                task.cancel()
+        await asyncio.gather(poller, *tasks, return_exceptions=True)
+
+def run(updater, fetcher, jobs, shutdown_event, drain_timeout):
+    """Serve updates and run jobs until a shutdown signal sets shutdown_event.
+
+    jobs is a list of (job, interval, first_delay) for run_periodic; fetcher is the
+    AsyncFetcher they share, opened for the lifetime of the loop. Handlers run on
+    the dispatcher thread started here; the caller stops the updater afterwards.
+    """
+    if aiohttp is None:
+        raise RuntimeError("RUNTIME=asyncio requires aiohttp (pip install aiohttp)")
+
+    threading.Thread(target=updater.dispatcher.start, name='dispatcher', daemon=True).start()
+    asyncio.run(_serve(updater, fetcher, jobs, shutdown_event, drain_timeout))
@@ -1,23 +1,85 @@
 import os
 import logging
 from dotenv import load_dotenv
-
-# Configure logging
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
-logger = logging.getLogger(__name__)
+from log_setup import setup_logging
 
 # Load environment variables
 load_dotenv()
 
+# Logging: written by a background thread; optional size-rotated file, 'text' or
+# 'json' format, and 1-in-N sampling of repetitive INFO lines ("prefix:N,...")
+LOG_FILE = os.getenv('LOG_FILE', '')
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text').lower()
+LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', str(5 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', '3'))
+LOG_SAMPLE = {
+    prefix: int(rate)
+    for prefix, rate in (
+        item.rsplit(':', 1) for item in os.getenv(
+            'LOG_SAMPLE', 'Checking price for:20,No price change for:20,Product still sold out:20'
+        ).split(',') if ':' in item
+    )
+}
+
+# Configure logging
+setup_logging(LOG_FILE, LOG_FORMAT, LOG_MAX_BYTES, LOG_BACKUP_COUNT, LOG_SAMPLE)
+logger = logging.getLogger(__name__)
+
 # Telegram bot token
 TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
 
+# Telegram Bot API base URL; override only to point the bot at a local fake API
+TELEGRAM_API_BASE_URL = os.getenv('TELEGRAM_API_BASE_URL') or None
+TELEGRAM_API_BASE_FILE_URL = TELEGRAM_API_BASE_URL.replace('/bot', '/file/bot') if TELEGRAM_API_BASE_URL else None
+
+# Update ingestion: 'polling' (default) or 'webhook'
+UPDATE_MODE = os.getenv('UPDATE_MODE', 'polling').lower()
+
+# Webhook settings; the local server sits behind a reverse proxy serving WEBHOOK_URL
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '127.0.0.1')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8443'))
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/telegram')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')
+WEBHOOK_HEALTH_INTERVAL = int(os.getenv('WEBHOOK_HEALTH_INTERVAL', '60'))
+
+# Worker threads for handlers that scrape (/ekle, links, /yenile)
+DISPATCHER_WORKERS = int(os.getenv('DISPATCHER_WORKERS', '4'))
+
+# Runtime: 'threads' (default) or 'asyncio', which runs update polling, the check
+# scheduler and page fetches on one event loop (requires aiohttp)
+RUNTIME = os.getenv('RUNTIME', 'threads').lower()
+
+# asyncio runtime: page fetches in flight per cycle and threads parsing fetched pages
+ASYNC_MAX_INFLIGHT = int(os.getenv('ASYNC_MAX_INFLIGHT', '50'))
+ASYNC_PARSE_WORKERS = int(os.getenv('ASYNC_PARSE_WORKERS', str(os.cpu_count() or 2)))
+
+# Batch import: max links per message/file, concurrent scrapes and progress edit interval (seconds)
+BATCH_MAX_LINKS = int(os.getenv('BATCH_MAX_LINKS', '500'))
+BATCH_SCRAPE_WORKERS = int(os.getenv('BATCH_SCRAPE_WORKERS', '4'))
+BATCH_PROGRESS_INTERVAL = float(os.getenv('BATCH_PROGRESS_INTERVAL', '3'))
+
+# Products per /listele page
+LIST_PAGE_SIZE = int(os.getenv('LIST_PAGE_SIZE', '10'))
+
 # Check interval in minutes
 CHECK_INTERVAL = int(os.getenv('CHECK_INTERVAL', '30'))
 
+# Fair scheduling across chats: relative weights ("chat_id:weight,..."; default 1),
+# max products checked per chat per window (0 = unlimited) and the window in minutes
+CHAT_WEIGHTS = {
+    chat_id.strip(): float(weight)
+    for chat_id, weight in (item.split(':', 1) for item in os.getenv('CHAT_WEIGHTS', '').split(',') if ':' in item)
+}
+CHAT_CHECK_CAP = int(os.getenv('CHAT_CHECK_CAP', '0'))
+CHAT_CAP_WINDOW = int(os.getenv('CHAT_CAP_WINDOW', str(CHECK_INTERVAL)))
+
+# Sold-out products: optionally check them with a cheap stock probe instead of a full scrape,
+# and double their check interval after every sold-out check up to this many minutes
+# (0 = no backoff). Both are off by default; the cap is also the longest a restock alert can wait
+STOCK_PROBE = os.getenv('STOCK_PROBE', 'false').lower() == 'true'
+SOLD_OUT_MAX_INTERVAL = int(os.getenv('SOLD_OUT_MAX_INTERVAL', '0'))
+
 # Allowed Group IDs
 ALLOWED_GROUP_IDS_STR = os.getenv('ALLOWED_GROUP_IDS', '')
 ALLOWED_GROUP_IDS = [int(group_id.strip()) for group_id in ALLOWED_GROUP_IDS_STR.split(',') if group_id.strip()]
@@ -32,8 +94,70 @@ if not ADMIN_CHAT_ID:
     logger.warning("No ADMIN_CHAT_ID set in .env file. Error notifications will not be sent.")
 
 # File to store tracked product data
-DATA_FILE = 'tracked_products.json'
+DATA_FILE = os.getenv('DATA_FILE', 'tracked_products.json')
+
+# Per-product check state checkpointed for warm restarts
+CHECK_STATE_FILE = os.getenv('CHECK_STATE_FILE', 'check_state.json')
+CHECKPOINT_EVERY = int(os.getenv('CHECKPOINT_EVERY', '20'))
+
+# Append-only log of observed prices (JSON Lines, empty = off), read by /disa_aktar.
+# Past PRICE_HISTORY_MAX_MB it is moved to <file>.1, replacing the previous one (0 = no limit)
+PRICE_HISTORY_FILE = os.getenv('PRICE_HISTORY_FILE', '')
+PRICE_HISTORY_MAX_MB = float(os.getenv('PRICE_HISTORY_MAX_MB', '10'))
+
+# Seconds to wait for an in-flight check to finish on shutdown
+SHUTDOWN_DRAIN_TIMEOUT = int(os.getenv('SHUTDOWN_DRAIN_TIMEOUT', '20'))
+
+# Liveness files read by the watchdog
+PID_FILE = os.getenv('PID_FILE', 'bot.pid')
+HEARTBEAT_FILE = os.getenv('HEARTBEAT_FILE', 'bot.heartbeat')
+
+# Seconds between dispatcher heartbeat ticks
+HEARTBEAT_INTERVAL = int(os.getenv('HEARTBEAT_INTERVAL', '30'))
+
+# Active/passive pair: SQLite lease file on storage both instances share (empty = off),
+# lease lifetime in seconds and this instance's name in it (default hostname:pid)
+HA_LEASE_FILE = os.getenv('HA_LEASE_FILE', '')
+HA_LEASE_TTL = float(os.getenv('HA_LEASE_TTL', '15'))
+HA_NODE_ID = os.getenv('HA_NODE_ID', '')
 
 # User agent for requests
 USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
 
+# Streaming page download: stop reading once name, price and stock are known
+STREAM_FETCH = os.getenv('STREAM_FETCH', 'false').lower() == 'true'
+STREAM_CHUNK_SIZE = int(os.getenv('STREAM_CHUNK_SIZE', '16384'))
+
+# Listing/search/brand pages used as a bulk price source before per-product checks
+LISTING_URLS = [url.strip() for url in os.getenv('LISTING_URLS', '').split(',') if url.strip()]
+LISTING_PAGES = int(os.getenv('LISTING_PAGES', '1'))
+
+# Archive of fetched product pages (empty directory = off): 'record' keeps failing
+# pages and a sample of successful ones, 'replay' serves pages from the archive
+HTTP_ARCHIVE_DIR = os.getenv('HTTP_ARCHIVE_DIR', '')
+HTTP_ARCHIVE_MODE = os.getenv('HTTP_ARCHIVE_MODE', 'record').lower()
+HTTP_ARCHIVE_MAX_MB = float(os.getenv('HTTP_ARCHIVE_MAX_MB', '200'))
+HTTP_ARCHIVE_MAX_AGE_DAYS = float(os.getenv('HTTP_ARCHIVE_MAX_AGE_DAYS', '30'))
+HTTP_ARCHIVE_SAMPLE = float(os.getenv('HTTP_ARCHIVE_SAMPLE', '0.02'))
+
+# Shadow parser comparison: fraction of parsed pages also run through the candidate
+# parser (0 = off), share of one CPU core it may use, and where disagreeing pages are
+# kept (at most SHADOW_MAX_CASES, oldest dropped first)
+SHADOW_SAMPLE = float(os.getenv('SHADOW_SAMPLE', '0'))
+SHADOW_CPU_BUDGET = float(os.getenv('SHADOW_CPU_BUDGET', '0.1'))
+if not 0 < SHADOW_CPU_BUDGET <= 1:
+    logger.warning(f"SHADOW_CPU_BUDGET must be above 0 and at most 1, got {SHADOW_CPU_BUDGET}. Using 0.1.")
+    SHADOW_CPU_BUDGET = 0.1
+SHADOW_DIR = os.getenv('SHADOW_DIR', 'shadow_cases')
+SHADOW_MAX_CASES = int(os.getenv('SHADOW_MAX_CASES', '200'))
+
+# Egress pool for page downloads: comma-separated HTTP proxies ('direct' = the bot's
+# own connection), user agents ('|'-separated) assigned to them in turn, requests at
+# once per endpoint and the base cooldown (seconds) of a blocked endpoint
+EGRESS_PROXIES = [proxy.strip() for proxy in os.getenv('EGRESS_PROXIES', '').split(',') if proxy.strip()]
+EGRESS_USER_AGENTS = [agent.strip() for agent in os.getenv('EGRESS_USER_AGENTS', '').split('|') if agent.strip()] or [USER_AGENT]
+EGRESS_MAX_INFLIGHT = int(os.getenv('EGRESS_MAX_INFLIGHT', '4'))
+EGRESS_BLOCK_COOLDOWN = float(os.getenv('EGRESS_BLOCK_COOLDOWN', '30'))
+
+# /disa_aktar: exports larger than this many bytes are sent gzip-compressed
+EXPORT_GZIP_BYTES = int(os.getenv('EXPORT_GZIP_BYTES', str(1024 * 1024)))
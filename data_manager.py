@@ -1,15 +1,103 @@
+import bisect
+import heapq
 import json
 import os
+import re
+import sys
+import time
+import unicodedata
+from itertools import chain, islice
 import logging
-from config import DATA_FILE
+import threading
+from config import DATA_FILE, CHECK_STATE_FILE, PRICE_HISTORY_FILE, PRICE_HISTORY_MAX_MB
+from scraper import normalize_product_url
 
-# Configure logging
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
 logger = logging.getLogger(__name__)
 
+# Serialises read-modify-write cycles from concurrent handlers and the scheduler
+_lock = threading.RLock()
+
+# Serialises check state checkpoints, which share one temporary file
+_check_state_lock = threading.Lock()
+
+# In-memory registry, loaded on first use and written through on every change:
+# {chat_id (int): {product_url: ProductRecord}}
+_data = None
+
+# Store format version, kept under _VERSION_KEY next to the chats; stores from before
+# it existed are version 1 and get their keys migrated once (migrate_product_keys)
+STORE_VERSION = 2
+_VERSION_KEY = '_version'
+_store_version = STORE_VERSION
+
+# Secondary index per chat: {chat_id: {product_id: product_url}}
+_product_index = {}
+
+# Name search index per chat: {chat_id: {token: {product_url}}} for whole tokens,
+# and the same shape for every token prefix (including the whole token) so partial
+# words match without a scan. Built for a chat on its first search.
+_name_tokens = {}
+_name_prefixes = {}
+
+# Shortest prefix indexed and accepted as a query term
+MIN_PREFIX_LENGTH = 2
+
+# Turkish letters that do not decompose into ASCII + combining mark
+_TURKISH_FOLD = str.maketrans({'ı': 'i', 'İ': 'i', 'I': 'i'})
+
+_TOKEN_RE = re.compile(r'\w+')
+
+def _intern(value):
+    """Share one copy of repeated strings (URLs, IDs, names tracked by several chats)."""
+    return sys.intern(value) if isinstance(value, str) else value
+
+def _chat_key(chat_id):
+    return int(chat_id)
+
+class ProductRecord:
+    """One tracked product of a chat.
+
+    Reads like the stored dict (record['current_price'], record.get('target_prices'))
+    and dict(record) gives the stored form. last_checked, next_due and
+    sold_out_checks (consecutive sold-out checks, for the backoff) are the
+    checkpointed check state and are not part of the product store.
+    """
+
+    __slots__ = ('product_name', 'product_id', 'initial_price', 'current_price', 'target_prices',
+                 'last_checked', 'next_due', 'sold_out_checks')
+
+    # Keys of the stored form, in file order
+    FIELDS = ('initial_price', 'current_price', 'product_name', 'product_id', 'target_prices')
+
+    def __init__(self, product_name, price, product_id, initial_price=None, target_prices=None):
+        self.product_name = _intern(product_name)
+        self.product_id = _intern(product_id)
+        self.initial_price = price if initial_price is None else initial_price
+        self.current_price = price
+        self.target_prices = target_prices or None
+        self.last_checked = 0.0
+        self.next_due = 0.0
+        self.sold_out_checks = 0
+
+    @classmethod
+    def from_dict(cls, info):
+        return cls(info.get("product_name"), info.get("current_price"), info.get("product_id"),
+                   info.get("initial_price"), info.get("target_prices"))
+
+    def keys(self):
+        return [key for key in self.FIELDS if key != "target_prices" or self.target_prices]
+
+    def __getitem__(self, key):
+        if key not in self.FIELDS or (key == "target_prices" and not self.target_prices):
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
 def load_data():
     """Load tracked products data from JSON file."""
     if not os.path.exists(DATA_FILE):
@@ -25,72 +113,545 @@ def load_data():
         logger.error(f"Error loading data from {DATA_FILE}: {e}")
         return {}
 
+def _dump_by_chat(f, chats, indent=None):
+    """Write (chat_id, dict) pairs as one JSON object, serialising one chat at a time."""
+    pad = ' ' * indent if indent else ''
+    separator = ',\n' if indent else ', '
+    f.write('{')
+    first = True
+    for chat_key, products in chats:
+        body = json.dumps(products, ensure_ascii=False, indent=indent)
+        if indent:
+            body = body.replace('\n', '\n' + pad)
+        f.write(('\n' if indent and first else '' if first else separator) + pad + json.dumps(str(chat_key)) + ': ' + body)
+        first = False
+    f.write('\n}' if indent and not first else '}')
+
 def save_data(data):
     """Save tracked products data to JSON file."""
     try:
         with open(DATA_FILE, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=4)
+            _dump_by_chat(f, chain([(_VERSION_KEY, _store_version)], (
+                (chat_key, {product_url: dict(product_info) for product_url, product_info in products.items()})
+                for chat_key, products in data.items()
+            )), indent=4)
         return True
     except Exception as e:
         logger.error(f"Error saving data to {DATA_FILE}: {e}")
         return False
 
-def add_product(chat_id, product_url, product_name, price):
-    """Add a product to tracked products."""
-    data = load_data()
-    
-    # Create chat_id entry if it doesn't exist
-    if str(chat_id) not in data:
-        data[str(chat_id)] = {}
+def _get_data():
+    """Return the in-memory registry, loading it from disk on first use."""
+    global _data, _store_version
     
-    # Add or update the product
-    data[str(chat_id)][product_url] = {
-        "initial_price": price,
-        "current_price": price,
-        "product_name": product_name
-    }
-    
-    return save_data(data)
+    with _lock:
+        if _data is None:
+            stored = load_data()
+            _store_version = stored.pop(_VERSION_KEY, 1)
+            _data = {
+                _chat_key(chat_key): {_intern(product_url): ProductRecord.from_dict(product_info)
+                                      for product_url, product_info in products.items()}
+                for chat_key, products in stored.items()
+            }
+            _rebuild_index()
+        return _data
 
-def remove_product(chat_id, product_url):
-    """Remove a product from tracked products."""
-    data = load_data()
-    
-    # Check if chat_id exists
-    if str(chat_id) not in data:
-        return False
-    
-    # Check if product_url exists in chat_id
-    if product_url not in data[str(chat_id)]:
-        return False
+def _product_id_for(product_url, product_info=None):
+    """Product ID of an entry, computed from its URL for entries saved before IDs existed."""
+    if product_info and product_info.get("product_id"):
+        return product_info["product_id"]
+    return normalize_product_url(product_url)[1]
+
+def _rebuild_index():
+    """Rebuild the product ID index from the registry; name indexes are rebuilt on demand."""
+    _product_index.clear()
+    _name_tokens.clear()
+    _name_prefixes.clear()
+    for chat_id, products in _data.items():
+        chat_index = _product_index[chat_id] = {}
+        for product_url, record in products.items():
+            product_id = _product_id_for(product_url, record)
+            if product_id:
+                chat_index[_intern(product_id)] = product_url
+
+def _unindex(chat_id, product_url, record):
+    product_id = _product_id_for(product_url, record)
+    chat_index = _product_index.get(chat_id, {})
+    if chat_index.get(product_id) == product_url:
+        del chat_index[product_id]
+    _unindex_name(chat_id, product_url, record.product_name)
+
+def tokenize(text):
+    """Split text into search tokens, folding case and Turkish diacritics (İ/ı, ş, ğ, ç, ö, ü)."""
+    text = unicodedata.normalize('NFKD', (text or '').translate(_TURKISH_FOLD).lower())
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return _TOKEN_RE.findall(text.translate(_TURKISH_FOLD))
+
+def _prefixes(token):
+    return (token[:length] for length in range(MIN_PREFIX_LENGTH, len(token) + 1))
+
+def _ensure_name_index(chat_id):
+    """Build a chat's name index if it has not been searched before."""
+    if chat_id in _name_tokens:
+        return
+    _name_tokens[chat_id] = {}
+    _name_prefixes[chat_id] = {}
+    for product_url, record in _get_data().get(chat_id, {}).items():
+        _index_name(chat_id, product_url, record.product_name)
+
+def _index_name(chat_id, product_url, product_name):
+    tokens = _name_tokens.get(chat_id)
+    if tokens is None:
+        return
+    prefixes = _name_prefixes[chat_id]
+    for token in set(tokenize(product_name)):
+        tokens.setdefault(token, set()).add(product_url)
+        for prefix in _prefixes(token):
+            prefixes.setdefault(prefix, set()).add(product_url)
+
+def _unindex_name(chat_id, product_url, product_name):
+    if chat_id not in _name_tokens:
+        return
+    for index, keys in ((_name_tokens, lambda token: [token]), (_name_prefixes, _prefixes)):
+        chat_index = index[chat_id]
+        for token in set(tokenize(product_name)):
+            for key in keys(token):
+                urls = chat_index.get(key)
+                if urls:
+                    urls.discard(product_url)
+                    if not urls:
+                        del chat_index[key]
+
+def search_products(chat_id, query, limit=20):
+    """Return up to limit (product_url, product_info) matches for query, best first.
+
+    Every query word must match a whole word or the start of a word in the product
+    name. Products matching every word exactly rank first, then by name.
+    """
+    terms = set(term for term in tokenize(query) if len(term) >= MIN_PREFIX_LENGTH)
+    if not terms:
+        return []
     
-    # Remove the product
-    del data[str(chat_id)][product_url]
+    with _lock:
+        chat_key = _chat_key(chat_id)
+        products = _get_data().get(chat_key, {})
+        _ensure_name_index(chat_key)
+        tokens = _name_tokens[chat_key]
+        prefixes = _name_prefixes[chat_key]
+        
+        # Intersect from the smallest posting set so the work is bounded by the rarest term
+        candidate_sets = sorted((prefixes.get(term, set()) for term in terms), key=len)
+        matches = candidate_sets[0].intersection(*candidate_sets[1:])
+        if not matches:
+            return []
+        
+        exact_sets = sorted((tokens.get(term, set()) for term in terms), key=len)
+        exact = exact_sets[0].intersection(*exact_sets[1:])
+        
+        def by_name(product_url):
+            return products[product_url].product_name or ""
+        
+        ranked = heapq.nsmallest(limit, exact, key=by_name)
+        if len(ranked) < limit:
+            ranked += heapq.nsmallest(limit - len(ranked), matches - exact, key=by_name)
+        return [(product_url, dict(products[product_url])) for product_url in ranked]
+
+def find_product(chat_id, product_id):
+    """Return the URL a chat tracks a product ID under, or None."""
+    with _lock:
+        _get_data()
+        return _product_index.get(_chat_key(chat_id), {}).get(product_id)
+
+def _put_product(chat_key, chat_products, product_url, product_name, price, product_id):
+    """Insert or replace a product in a chat's registry and indexes."""
+    product_url = _intern(product_url)
+    chat_index = _product_index.setdefault(chat_key, {})
     
-    # Remove the chat_id if there are no products left
-    if not data[str(chat_id)]:
-        del data[str(chat_id)]
+    # Replace an entry for the same product stored under another URL
+    existing_url = chat_index.get(product_id) if product_id else None
+    if existing_url and existing_url != product_url:
+        _unindex_name(chat_key, existing_url, chat_products[existing_url].product_name)
+        del chat_products[existing_url]
+    if product_url in chat_products:
+        _unindex_name(chat_key, product_url, chat_products[product_url].product_name)
     
-    return save_data(data)
+    record = ProductRecord(product_name, price, product_id)
+    chat_products[product_url] = record
+    if product_id:
+        chat_index[record.product_id] = product_url
+    _index_name(chat_key, product_url, record.product_name)
+    return record
+
+def add_product(chat_id, product_url, product_name, price, product_id=None):
+    """Add a product to tracked products."""
+    with _lock:
+        data = _get_data()
+        chat_key = _chat_key(chat_id)
+        
+        if product_id is None:
+            product_id = normalize_product_url(product_url)[1]
+        
+        # Create chat_id entry if it doesn't exist
+        record = _put_product(chat_key, data.setdefault(chat_key, {}), product_url, product_name, price, product_id)
+        
+        saved = save_data(data)
+        _record_prices([(chat_key, product_url, record.product_id, price)])
+        return saved
+
+def add_products(chat_id, products):
+    """Add many products with a single store write.
+
+    products is an iterable of (product_url, product_name, price, product_id) tuples.
+    """
+    with _lock:
+        data = _get_data()
+        chat_key = _chat_key(chat_id)
+        chat_products = data.setdefault(chat_key, {})
+        
+        observations = []
+        for product_url, product_name, price, product_id in products:
+            record = _put_product(chat_key, chat_products, product_url, product_name, price, product_id)
+            observations.append((chat_key, product_url, record.product_id, price))
+        
+        if not chat_products:
+            del data[chat_key]
+        
+        saved = save_data(data)
+        _record_prices(observations)
+        return saved
+
+def remove_product(chat_id, product_url, product_id=None):
+    """Remove a product from tracked products, matching on product ID when available."""
+    with _lock:
+        data = _get_data()
+        chat_key = _chat_key(chat_id)
+        
+        # Check if chat_id exists
+        if chat_key not in data:
+            return False
+        
+        if product_id is None:
+            product_id = normalize_product_url(product_url)[1]
+        if product_id:
+            product_url = _product_index.get(chat_key, {}).get(product_id, product_url)
+        
+        # Check if product_url exists in chat_id
+        if product_url not in data[chat_key]:
+            return False
+        
+        # Remove the product
+        _unindex(chat_key, product_url, data[chat_key][product_url])
+        del data[chat_key][product_url]
+        
+        # Remove the chat_id if there are no products left
+        if not data[chat_key]:
+            del data[chat_key]
+            _product_index.pop(chat_key, None)
+            _name_tokens.pop(chat_key, None)
+            _name_prefixes.pop(chat_key, None)
+        
+        return save_data(data)
 
 def get_all_products(chat_id=None):
-    """Get all tracked products, optionally filtered by chat_id."""
-    data = load_data()
-    
-    if chat_id is not None:
-        return data.get(str(chat_id), {})
+    """Get all tracked products, optionally filtered by chat_id.
+
+    Copies the containers; loops over every product should use iter_products.
+    """
+    with _lock:
+        data = _get_data()
+        
+        # Copy the containers so callers can iterate while handlers add or remove products
+        if chat_id is not None:
+            return dict(data.get(_chat_key(chat_id), {}))
+        
+        return {chat_key: dict(products) for chat_key, products in data.items()}
+
+def iter_products(chat_id=None):
+    """Yield (chat_id, product_url, record) for tracked products without copying the registry.
+
+    A chat's URLs are snapshotted when the iterator reaches it: products removed
+    after that are skipped, products added after that are not yielded.
+    """
+    with _lock:
+        data = _get_data()
+        chat_keys = [_chat_key(chat_id)] if chat_id is not None else list(data)
     
-    return data
+    for chat_key in chat_keys:
+        with _lock:
+            products = data.get(chat_key, {})
+            product_urls = list(products)
+        for product_url in product_urls:
+            record = products.get(product_url)
+            if record is not None:
+                yield chat_key, product_url, record
+
+def product_count(chat_id=None):
+    """Number of tracked products, optionally of one chat."""
+    with _lock:
+        data = _get_data()
+        if chat_id is not None:
+            return len(data.get(_chat_key(chat_id), {}))
+        return sum(len(products) for products in data.values())
+
+def get_products_page(chat_id, offset, limit):
+    """Return (total, [(product_url, product_info), ...]) for one page of a chat's products."""
+    with _lock:
+        products = _get_data().get(_chat_key(chat_id), {})
+        page = [(product_url, dict(record))
+                for product_url, record in islice(products.items(), offset, offset + limit)]
+        return len(products), page
+
+def _get_record(chat_id, product_url):
+    """Return a product's record, or None if the chat does not track it. Call with _lock held."""
+    return _get_data().get(_chat_key(chat_id), {}).get(product_url)
 
 def update_product_price(chat_id, product_url, new_price):
     """Update current price of a product."""
-    data = load_data()
+    with _lock:
+        record = _get_record(chat_id, product_url)
+        
+        # Check if chat_id and product_url exist
+        if record is None:
+            return False
+        
+        # Update the current price
+        record.current_price = new_price
+        
+        saved = save_data(_data)
+        _record_prices([(_chat_key(chat_id), product_url, record.product_id, new_price)])
+        return saved
+
+def _record_prices(observations):
+    """Append (chat_id, product_url, product_id, price) observations to the price history."""
+    if not PRICE_HISTORY_FILE or not observations:
+        return
     
-    # Check if chat_id and product_url exist
-    if str(chat_id) not in data or product_url not in data[str(chat_id)]:
-        return False
+    now = round(time.time(), 3)
+    try:
+        with open(PRICE_HISTORY_FILE, 'a', encoding='utf-8') as f:
+            f.writelines(
+                json.dumps({'time': now, 'chat_id': chat_key, 'product_id': product_id, 'url': product_url,
+                            'price': price}, ensure_ascii=False) + '\n'
+                for chat_key, product_url, product_id, price in observations
+            )
+            size = f.tell()
+        # Keep at most two files' worth of history on disk
+        if PRICE_HISTORY_MAX_MB and size > PRICE_HISTORY_MAX_MB * 1024 * 1024:
+            os.replace(PRICE_HISTORY_FILE, f'{PRICE_HISTORY_FILE}.1')
+            logger.info(f"Price history reached {size / 1024 / 1024:.1f} MB, rotated to {PRICE_HISTORY_FILE}.1")
+    except OSError as e:
+        logger.error(f"Error writing price history: {e}")
+
+def iter_price_history(chat_id=None):
+    """Yield recorded price observations, oldest first, optionally of one chat.
+
+    Each is a dict with time, chat_id, product_id, url and price (0 = sold out).
+    The rotated file comes first, then the current one, read line by line.
+    """
+    if not PRICE_HISTORY_FILE:
+        return
+    
+    chat_key = _chat_key(chat_id) if chat_id is not None else None
+    for path in (f'{PRICE_HISTORY_FILE}.1', PRICE_HISTORY_FILE):
+        try:
+            f = open(path, 'r', encoding='utf-8')
+        except FileNotFoundError:
+            continue
+        with f:
+            for line in f:
+                try:
+                    observation = json.loads(line)
+                except ValueError:
+                    # A line cut short by a crash mid-write
+                    continue
+                if chat_key is None or observation.get('chat_id') == chat_key:
+                    yield observation
+
+def add_target_price(chat_id, product_url, target_price):
+    """Add a target price to a tracked product, keeping its targets sorted."""
+    with _lock:
+        record = _get_record(chat_id, product_url)
+        
+        if record is None:
+            return False
+        
+        targets = record.target_prices = record.target_prices or []
+        index = bisect.bisect_left(targets, target_price)
+        if index < len(targets) and targets[index] == target_price:
+            return True
+        targets.insert(index, target_price)
+        
+        return save_data(_data)
+
+def clear_target_prices(chat_id, product_url):
+    """Remove all target prices of a tracked product."""
+    with _lock:
+        record = _get_record(chat_id, product_url)
+        
+        if record is None:
+            return False
+        
+        record.target_prices = None
+        
+        return save_data(_data)
+
+def crossed_target_prices(product_info, old_price, new_price):
+    """Return the targets reached by a price drop from old_price to new_price.
+
+    A target is reached when the new price is at or below it and the old price was
+    above it; a sold-out product (old price 0) reaches every target above the new
+    price. Found by binary search on the product's sorted targets.
+    """
+    targets = product_info.get("target_prices")
+    if not targets or not new_price:
+        return []
+    
+    low = bisect.bisect_left(targets, new_price)
+    high = len(targets) if not old_price else bisect.bisect_left(targets, old_price)
+    return targets[low:high]
+
+def update_product_name(chat_id, product_url, product_name):
+    """Update the stored name of a product and its search index entries."""
+    with _lock:
+        record = _get_record(chat_id, product_url)
+        
+        if record is None:
+            return False
+        
+        chat_key = _chat_key(chat_id)
+        _unindex_name(chat_key, product_url, record.product_name)
+        record.product_name = _intern(product_name)
+        _index_name(chat_key, product_url, record.product_name)
+        
+        return save_data(_data)
+
+def migrate_product_keys(resolve=None):
+    """Re-key stored products by canonical URL with a product ID, merging duplicates.
+
+    Runs once per store: the store is then saved as STORE_VERSION. resolve is called
+    for links without a content ID (e.g. ty.gl short links), outside the store lock,
+    and should return the full URL. Returns the number of entries changed or removed.
+    """
+    global _store_version
+    
+    data = _get_data()
+    with _lock:
+        if _store_version >= STORE_VERSION:
+            return 0
+        unresolved = {product_url for products in data.values() for product_url in products
+                      if not normalize_product_url(product_url)[1]}
+    
+    # Short links are followed over the network without blocking store access
+    resolved = {product_url: resolve(product_url) for product_url in unresolved} if resolve else {}
+    
+    with _lock:
+        changed = 0
+        for chat_key, products in data.items():
+            migrated = {}
+            seen = set()
+            for product_url, record in products.items():
+                canonical_url, product_id = normalize_product_url(product_url)
+                if not product_id and product_url in resolved:
+                    canonical_url, product_id = normalize_product_url(resolved[product_url])
+                
+                if not product_id:
+                    migrated[product_url] = record
+                    continue
+                
+                if product_id in seen:
+                    logger.info(f"Removing duplicate of product {product_id} in chat {chat_key}: {product_url}")
+                    changed += 1
+                    continue
+                
+                if canonical_url != product_url or record.product_id != product_id:
+                    changed += 1
+                record.product_id = _intern(product_id)
+                seen.add(product_id)
+                migrated[_intern(canonical_url)] = record
+            
+            data[chat_key] = migrated
+        
+        if changed:
+            logger.info(f"Migrated {changed} product entries to canonical product IDs")
+            _rebuild_index()
+        _store_version = STORE_VERSION
+        save_data(data)
+        return changed
+
+def record_check(chat_id, product_url, checked_at, interval, max_sold_out_interval=0):
+    """Remember when a product was checked and schedule its next check interval seconds later.
+
+    With max_sold_out_interval, a sold-out product's interval doubles with every
+    consecutive sold-out check, up to max_sold_out_interval seconds.
+    """
+    record = _get_data().get(_chat_key(chat_id), {}).get(product_url)
+    if record is None:
+        return
+    if record.current_price == 0 and max_sold_out_interval and interval:
+        cap = max(max_sold_out_interval, interval)
+        interval = min(interval * 2 ** record.sold_out_checks, cap)
+        if interval < cap:
+            record.sold_out_checks += 1
+    else:
+        record.sold_out_checks = 0
+    record.last_checked = checked_at
+    record.next_due = checked_at + interval
+
+def load_check_state():
+    """Restore the per-product check state checkpoint; returns the number of products restored."""
+    if not os.path.exists(CHECK_STATE_FILE):
+        return 0
     
-    # Update the current price
-    data[str(chat_id)][product_url]["current_price"] = new_price
+    try:
+        with open(CHECK_STATE_FILE, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+    except Exception as e:
+        logger.error(f"Error loading check state from {CHECK_STATE_FILE}: {e}")
+        return 0
     
-    return save_data(data)
+    restored = 0
+    with _lock:
+        data = _get_data()
+        for chat_key, products in state.items():
+            chat_products = data.get(_chat_key(chat_key), {})
+            for product_url, product_state in products.items():
+                record = chat_products.get(product_url)
+                if record is not None:
+                    record.last_checked = product_state.get("last_checked", 0.0)
+                    record.next_due = product_state.get("next_due", 0.0)
+                    record.sold_out_checks = product_state.get("sold_out_checks", 0)
+                    restored += 1
+    return restored
+
+def _check_state(record):
+    state = {"last_checked": record.last_checked, "next_due": record.next_due}
+    if record.sold_out_checks:
+        state["sold_out_checks"] = record.sold_out_checks
+    return state
+
+def _check_state_by_chat():
+    """Yield (chat_id, {product_url: state}) for checked products, copying one chat at a time."""
+    with _lock:
+        chat_keys = list(_get_data())
+    for chat_key in chat_keys:
+        with _lock:
+            products = _data.get(chat_key, {})
+            state = {
+                product_url: _check_state(record)
+                for product_url, record in products.items() if record.last_checked
+            }
+        if state:
+            yield chat_key, state
+
+def save_check_state():
+    """Atomically save the per-product check state checkpoint."""
+    tmp_file = f"{CHECK_STATE_FILE}.tmp"
+    try:
+        with _check_state_lock:
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                _dump_by_chat(f, _check_state_by_chat())
+            os.replace(tmp_file, CHECK_STATE_FILE)
+        return True
+    except Exception as e:
+        logger.error(f"Error saving check state to {CHECK_STATE_FILE}: {e}")
+        return False
@@ -0,0 +1,240 @@
+"""
+Pool of egress endpoints (HTTP proxies) for page downloads.
+
+Every endpoint has a client profile (user agent) and a rolling health record:
+latency and error rate as moving averages, plus a cooldown after Trendyol blocks
+it (403/429) or it fails several times in a row. Requests go to the endpoint
+with the lowest expected cost, latency times queue depth over success rate, and
+each endpoint serves at most max_inflight requests at once, so once the fast
+endpoints are busy the rest of the pool takes the overflow.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from contextlib import contextmanager, asynccontextmanager
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+# Statuses Trendyol answers a throttled or banned client with
+BLOCK_STATUSES = (403, 429)
+
+# Weight of the newest sample in the latency and error-rate averages
+HEALTH_ALPHA = 0.2
+
+# Consecutive failures after which an endpoint is rested like a blocked one
+MAX_CONSECUTIVE_FAILURES = 3
+
+# Longest cooldown, as a multiple of the base cooldown (which doubles per repeat)
+MAX_COOLDOWN_FACTOR = 8
+
+# Added to latency when ranking, so unmeasured endpoints do not look free
+LATENCY_FLOOR = 0.05
+
+class NoEndpointAvailable(Exception):
+    """Every endpoint stayed busy or cooling down for the whole wait."""
+
+class Endpoint:
+    """One egress route and its health record."""
+
+    __slots__ = ('proxy', 'label', 'headers', 'inflight', 'latency', 'error_rate', 'requests', 'errors',
+                 'blocks', 'failure_streak', 'cooldowns', 'cooldown_until')
+
+    def __init__(self, proxy, user_agent):
+        self.proxy = proxy
+        self.label = _label(proxy)
+        self.headers = {'User-Agent': user_agent}
+        self.inflight = 0
+        self.latency = None
+        self.error_rate = 0.0
+        self.requests = 0
+        self.errors = 0
+        self.blocks = 0
+        self.failure_streak = 0
+        self.cooldowns = 0
+        self.cooldown_until = 0.0
+
+    @property
+    def proxies(self):
+        """requests' proxies argument; None lets the environment (HTTP_PROXY) decide."""
+        return {'http': self.proxy, 'https': self.proxy} if self.proxy else None
+
+    def cost(self):
+        """Expected wait for one more request here; lower is better."""
+        latency = (self.latency or 0.0) + LATENCY_FLOOR
+        return latency * (self.inflight + 1) / max(1.0 - self.error_rate, 0.05)
+
+    def score(self):
+        """Health score in requests per second of a single connection (0 while cooling down)."""
+        if self.cooldown_until > time.monotonic():
+            return 0.0
+        return (1.0 - self.error_rate) / ((self.latency or 0.0) + LATENCY_FLOOR)
+
+def _label(proxy):
+    """Proxy URL without credentials, for logs."""
+    if not proxy:
+        return 'direct'
+    parts = urlsplit(proxy)
+    return f'{parts.hostname}:{parts.port}' if parts.port else parts.hostname or proxy
+
+class Lease:
+    """An endpoint checked out for one request; set status before the lease ends."""
+
+    __slots__ = ('endpoint', 'status')
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.status = None
+
+class EgressPool:
+    """Route requests over several endpoints by health, with per-endpoint concurrency limits."""
+
+    def __init__(self, proxies, user_agents, max_inflight=None, cooldown=0.0):
+        self.endpoints = [Endpoint(None if proxy == 'direct' else proxy, user_agents[index % len(user_agents)])
+                          for index, proxy in enumerate(proxies)]
+        self.max_inflight = max_inflight
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._released = threading.Condition(self._lock)
+        self._async_waiters = []
+
+    def __len__(self):
+        return len(self.endpoints)
+
+    def _pick(self, exclude=()):
+        """Cheapest endpoint with a free slot that is not cooling down; call with the lock held."""
+        now = time.monotonic()
+        candidates = [
+            endpoint for endpoint in self.endpoints
+            if endpoint not in exclude and endpoint.cooldown_until <= now
+            and (self.max_inflight is None or endpoint.inflight < self.max_inflight)
+        ]
+        if not candidates:
+            return None
+        endpoint = min(candidates, key=Endpoint.cost)
+        endpoint.inflight += 1
+        return endpoint
+
+    def _next_change(self, exclude=()):
+        """Seconds until a cooling endpoint comes back, or None; call with the lock held."""
+        now = time.monotonic()
+        waits = [endpoint.cooldown_until - now for endpoint in self.endpoints
+                 if endpoint not in exclude and endpoint.cooldown_until > now]
+        return min(waits) if waits else None
+
+    def acquire(self, timeout=None, exclude=()):
+        """Check out the healthiest free endpoint, waiting up to timeout seconds for one."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            while True:
+                endpoint = self._pick(exclude)
+                if endpoint:
+                    return endpoint
+                wait = self._next_change(exclude)
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise NoEndpointAvailable("No healthy egress endpoint available")
+                    wait = remaining if wait is None else min(wait, remaining)
+                self._released.wait(wait)
+
+    async def acquire_async(self, timeout=None, exclude=()):
+        """acquire for the asyncio runtime; waits without blocking the event loop."""
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        while True:
+            with self._lock:
+                endpoint = self._pick(exclude)
+                if endpoint:
+                    return endpoint
+                wait = self._next_change(exclude)
+                released = loop.create_future()
+                self._async_waiters.append((loop, released))
+            if deadline is not None:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    raise NoEndpointAvailable("No healthy egress endpoint available")
+                wait = remaining if wait is None else min(wait, remaining)
+            try:
+                await asyncio.wait_for(released, wait)
+            except asyncio.TimeoutError:
+                pass
+
+    def release(self, endpoint, elapsed, status=None, failed=False):
+        """Return an endpoint and record the request's outcome.
+
+        failed marks a connection error or timeout; 5xx statuses count as errors and
+        BLOCK_STATUSES as blocks. Other statuses (404 included) count as healthy.
+        """
+        blocked = status in BLOCK_STATUSES
+        failed = failed or blocked or (status is not None and status >= 500)
+        with self._lock:
+            endpoint.inflight -= 1
+            endpoint.requests += 1
+            endpoint.error_rate += HEALTH_ALPHA * (failed - endpoint.error_rate)
+            if failed:
+                endpoint.errors += 1
+                endpoint.blocks += blocked
+                endpoint.failure_streak += 1
+                if self.cooldown and (blocked or endpoint.failure_streak >= MAX_CONSECUTIVE_FAILURES):
+                    factor = min(2 ** endpoint.cooldowns, MAX_COOLDOWN_FACTOR)
+                    endpoint.cooldowns += 1
+                    endpoint.failure_streak = 0
+                    endpoint.cooldown_until = time.monotonic() + self.cooldown * factor
+                    logger.warning(f"Egress {endpoint.label} {'blocked' if blocked else 'failing'}, "
+                                   f"resting it for {self.cooldown * factor:.0f}s")
+            else:
+                endpoint.failure_streak = 0
+                endpoint.cooldowns = 0
+                endpoint.latency = elapsed if endpoint.latency is None else \
+                    endpoint.latency + HEALTH_ALPHA * (elapsed - endpoint.latency)
+
+            self._released.notify_all()
+            waiters, self._async_waiters = self._async_waiters, []
+        for loop, released in waiters:
+            loop.call_soon_threadsafe(_resolve, released)
+
+    @contextmanager
+    def lease(self, timeout=None, exclude=()):
+        """Check out an endpoint for one request; the caller sets lease.status."""
+        lease = Lease(self.acquire(timeout, exclude))
+        started = time.monotonic()
+        try:
+            yield lease
+        except BaseException:
+            self.release(lease.endpoint, time.monotonic() - started, failed=True)
+            raise
+        self.release(lease.endpoint, time.monotonic() - started, lease.status)
+
+    @asynccontextmanager
+    async def lease_async(self, timeout=None, exclude=()):
+        """lease for the asyncio runtime."""
+        lease = Lease(await self.acquire_async(timeout, exclude))
+        started = time.monotonic()
+        try:
+            yield lease
+        except BaseException:
+            self.release(lease.endpoint, time.monotonic() - started, failed=True)
+            raise
+        self.release(lease.endpoint, time.monotonic() - started, lease.status)
+
+    def stats(self):
+        """Per-endpoint health, healthiest first."""
+        with self._lock:
+            rows = [{
+                'endpoint': endpoint.label,
+                'score': round(endpoint.score(), 2),
+                'latency_ms': round(endpoint.latency * 1000) if endpoint.latency is not None else None,
+                'error_rate': round(endpoint.error_rate, 3),
+                'requests': endpoint.requests,
+                'errors': endpoint.errors,
+                'blocks': endpoint.blocks,
+                'cooling': endpoint.cooldown_until > time.monotonic(),
+            } for endpoint in self.endpoints]
+        return sorted(rows, key=lambda row: -row['score'])
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Export of tracked products and price history as CSV or JSON Lines.
+
+Rows come from generators over the registry and the price history file and are
+encoded in small batches, so an export never holds the whole document in memory.
+/disa_aktar uses this for one chat; run directly for offline dumps of the whole
+store:
+
+    python export.py products --format csv --output products.csv.gz
+    python export.py history --chat -1001234567890 --format jsonl
+"""
+
+import argparse
+import csv
+import io
+import itertools
+import json
+import sys
+import zlib
+from datetime import datetime
+
+from data_manager import iter_products, iter_price_history, load_check_state
+
+PRODUCT_FIELDS = ('chat_id', 'product_id', 'product_name', 'url', 'initial_price', 'current_price',
+                  'target_prices', 'last_checked')
+HISTORY_FIELDS = ('time', 'chat_id', 'product_id', 'url', 'price')
+
+FORMATS = ('csv', 'jsonl')
+
+# Rows encoded per chunk
+BATCH_ROWS = 500
+
+def _timestamp(value):
+    return datetime.fromtimestamp(value).isoformat(timespec='seconds') if value else None
+
+def _flat(row):
+    """CSV form of a row: target price lists become space-separated numbers."""
+    targets = row.get('target_prices')
+    if targets is None:
+        return row
+    return dict(row, target_prices=' '.join(f'{price:g}' for price in targets))
+
+def product_rows(chat_id=None):
+    """Yield tracked products as export rows."""
+    for chat_key, product_url, record in iter_products(chat_id):
+        yield {
+            'chat_id': chat_key,
+            'product_id': record.product_id,
+            'product_name': record.product_name,
+            'url': product_url,
+            'initial_price': record.initial_price,
+            'current_price': record.current_price,
+            'target_prices': record.target_prices or [],
+            'last_checked': _timestamp(record.last_checked),
+        }
+
+def history_rows(chat_id=None):
+    """Yield recorded price observations as export rows."""
+    for observation in iter_price_history(chat_id):
+        yield dict(observation, time=_timestamp(observation['time']))
+
+def encode(rows, fields, fmt):
+    """Yield the rows as CSV (with a header) or JSON Lines text, BATCH_ROWS rows per chunk."""
+    rows = iter(rows)
+    if fmt == 'csv':
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fields, extrasaction='ignore', lineterminator='\n')
+        writer.writeheader()
+        while True:
+            writer.writerows(map(_flat, itertools.islice(rows, BATCH_ROWS)))
+            chunk = buffer.getvalue()
+            if not chunk:
+                return
+            yield chunk
+            buffer.seek(0)
+            buffer.truncate()
+    else:
+        while True:
+            batch = list(itertools.islice(rows, BATCH_ROWS))
+            if not batch:
+                return
+            yield ''.join(json.dumps(row, ensure_ascii=False) + '\n' for row in batch)
+
+def gzip_chunks(chunks):
+    """gzip a stream of byte chunks."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+def compress_if_large(chunks, threshold):
+    """Return (gzipped, byte chunks); the output is gzipped once it grows past threshold bytes.
+
+    At most threshold bytes are held back while deciding.
+    """
+    chunks = (chunk.encode('utf-8') for chunk in chunks)
+    head, size = [], 0
+    for chunk in chunks:
+        head.append(chunk)
+        size += len(chunk)
+        if size > threshold:
+            return True, gzip_chunks(itertools.chain(head, chunks))
+    return False, iter(head)
+
+class RowCounter:
+    """Pass rows through, counting them."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.count = 0
+
+    def __iter__(self):
+        for row in self.rows:
+            self.count += 1
+            yield row
+
+def export(kind, fmt, chat_id=None):
+    """Return (row counter, text chunks) for 'products' or 'history'."""
+    rows, fields = (product_rows(chat_id), PRODUCT_FIELDS) if kind == 'products' else \
+        (history_rows(chat_id), HISTORY_FIELDS)
+    counter = RowCounter(rows)
+    return counter, encode(counter, fields, fmt)
+
+def main():
+    parser = argparse.ArgumentParser(description='Export tracked products or price history.')
+    parser.add_argument('kind', choices=('products', 'history'))
+    parser.add_argument('--chat', type=int, help='only this chat (default: every chat)')
+    parser.add_argument('--format', choices=FORMATS, default='csv')
+    parser.add_argument('--output', help='file to write, gzipped if it ends in .gz (default: stdout)')
+    args = parser.parse_args()
+
+    if args.kind == 'products':
+        # Include when each product was last checked
+        load_check_state()
+
+    counter, chunks = export(args.kind, args.format, args.chat)
+    if not args.output:
+        for chunk in chunks:
+            sys.stdout.write(chunk)
+    else:
+        data = (chunk.encode('utf-8') for chunk in chunks)
+        if args.output.endswith('.gz'):
+            data = gzip_chunks(data)
+        with open(args.output, 'wb') as f:
+            for chunk in data:
+                f.write(chunk)
+    print(f"{counter.count} rows exported", file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
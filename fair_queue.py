@@ -0,0 +1,64 @@
+import heapq
+import threading
+import time
+from collections import deque
+
+def fair_order(items_by_chat, weights=None, default_weight=1.0):
+    """Yield (chat_id, item) pairs interleaving chats by weighted fair queuing.
+
+    The n-th item of a chat gets the virtual finish time n / weight and items are
+    served in finish-time order. While it has work, a chat gets weight / total
+    weight of the checks, so a chat with k products is finished after at most about
+    k * total_weight / weight checks, however large the other chats are.
+    """
+    weights = weights or {}
+    heap = []
+    queues = {}
+    for seq, (chat_id, items) in enumerate(items_by_chat.items()):
+        if not items:
+            continue
+        weight = weights.get(str(chat_id), default_weight)
+        if weight <= 0:
+            continue
+        queues[chat_id] = deque(items)
+        heap.append((1 / weight, seq, chat_id, weight))
+    heapq.heapify(heap)
+
+    while heap:
+        finish, seq, chat_id, weight = heapq.heappop(heap)
+        queue = queues[chat_id]
+        yield chat_id, queue.popleft()
+        if queue:
+            heapq.heappush(heap, (finish + 1 / weight, seq, chat_id, weight))
+
+class ChatCheckCap:
+    """Cap on products checked per chat within a sliding time window (cap 0 = unlimited)."""
+
+    def __init__(self, cap, window):
+        self.cap = cap
+        self.window = window
+        self._checks = {}
+        self._lock = threading.Lock()
+
+    def allowance(self, chat_id, now=None):
+        """Number of checks a chat may still make in the current window, or None if unlimited."""
+        if not self.cap:
+            return None
+        now = time.time() if now is None else now
+        with self._lock:
+            checks = self._expire(str(chat_id), now)
+            return max(0, self.cap - len(checks))
+
+    def record(self, chat_id, now=None):
+        """Count one check for a chat."""
+        if not self.cap:
+            return
+        now = time.time() if now is None else now
+        with self._lock:
+            self._expire(str(chat_id), now).append(now)
+
+    def _expire(self, chat_id, now):
+        checks = self._checks.setdefault(chat_id, deque())
+        while checks and checks[0] <= now - self.window:
+            checks.popleft()
+        return checks
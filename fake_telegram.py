@@ -0,0 +1,406 @@
+#!/usr/bin/env python3
+"""
+Local fake Telegram Bot API for end-to-end tests and benchmarks.
+
+Implements the subset of the Bot API the bot uses (getUpdates long polling,
+webhooks with secret tokens, sendMessage, editMessageText, ...), records every
+outgoing message and lets callers inject user messages.
+
+Run directly to compare command round-trip latency of polling mode, webhook mode
+and the asyncio runtime:
+
+    python fake_telegram.py --rounds 50 --latency-ms 50 --spacing-ms 30
+"""
+
+import argparse
+import itertools
+import json
+import os
+import queue
+import random
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+FAKE_TOKEN = '123456:FAKE-TOKEN'
+FAKE_CHAT_ID = -1001000000001
+
+class FakeTelegramAPI:
+    """In-process fake of api.telegram.org."""
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0):
+        # One-way network delay in seconds added to API responses and webhook pushes
+        self.latency = latency
+        self.httpd = ThreadingHTTPServer((host, port), _FakeApiHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.api = self
+        self._cond = threading.Condition()
+        self._updates = []
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._webhook_queue = queue.Queue()
+        self.webhook_url = None
+        self.webhook_secret = None
+        self.sent = []
+        self.calls = {}
+        self.documents = {}
+        self._thread = None
+
+    @property
+    def base_url(self):
+        """Value for TELEGRAM_API_BASE_URL."""
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}/bot'
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        threading.Thread(target=self._deliver_webhooks, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    # Injection -----------------------------------------------------------
+
+    def inject_message(self, text, chat_id=FAKE_CHAT_ID, document=None):
+        """Queue a user message for getUpdates or push it to the webhook."""
+        message = {
+            'message_id': next(self._message_ids),
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'supergroup', 'title': 'Fake Group'},
+            'from': {'id': 42, 'is_bot': False, 'first_name': 'Tester'},
+        }
+        if text is not None:
+            message['text'] = text
+            if text.startswith('/'):
+                command = text.split()[0]
+                message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(command)}]
+        if document is not None:
+            file_name, content = document
+            file_id = f'file-{len(self.documents) + 1}'
+            self.documents[file_id] = content
+            message['document'] = {
+                'file_id': file_id,
+                'file_unique_id': file_id,
+                'file_name': file_name,
+                'file_size': len(content),
+            }
+        return self._push_update({'message': message})
+
+    def inject_callback(self, data, message_id, chat_id=FAKE_CHAT_ID):
+        """Simulate a press on an inline keyboard button."""
+        callback = {
+            'id': str(next(self._message_ids)),
+            'from': {'id': 42, 'is_bot': False, 'first_name': 'Tester'},
+            'chat_instance': 'fake',
+            'data': data,
+            'message': {
+                'message_id': message_id,
+                'date': int(time.time()),
+                'chat': {'id': chat_id, 'type': 'supergroup', 'title': 'Fake Group'},
+                'text': '',
+            },
+        }
+        return self._push_update({'callback_query': callback})
+
+    def _push_update(self, payload):
+        update = dict(payload, update_id=next(self._update_ids))
+        with self._cond:
+            if self.webhook_url:
+                self._webhook_queue.put(update)
+            else:
+                self._updates.append(update)
+                self._cond.notify_all()
+        return update
+
+    # Observation ---------------------------------------------------------
+
+    def wait_for(self, predicate, timeout=10, start=0):
+        """Wait for a recorded outgoing call matching predicate, searching from index start."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                for record in self.sent[start:]:
+                    if predicate(record):
+                        return record
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+
+    def wait_for_call(self, method, timeout=10):
+        """Wait until the bot has called the given API method at least once."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while not self.calls.get(method):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    # API -----------------------------------------------------------------
+
+    def handle(self, method, params):
+        with self._cond:
+            self.calls[method] = self.calls.get(method, 0) + 1
+            self._cond.notify_all()
+
+        if method == 'getMe':
+            return {'id': 1, 'is_bot': True, 'first_name': 'FakeBot', 'username': 'fake_bot'}
+        if method == 'getUpdates':
+            return self._get_updates(params)
+        if method == 'setWebhook':
+            with self._cond:
+                self.webhook_url = params.get('url') or None
+                self.webhook_secret = params.get('secret_token')
+                pending, self._updates = self._updates, []
+            for update in pending:
+                self._webhook_queue.put(update)
+            return True
+        if method == 'deleteWebhook':
+            with self._cond:
+                self.webhook_url = None
+            return True
+        if method == 'getWebhookInfo':
+            return {'url': self.webhook_url or '', 'has_custom_certificate': False,
+                    'pending_update_count': self._webhook_queue.qsize()}
+        if method == 'getFile':
+            file_id = params.get('file_id')
+            return {'file_id': file_id, 'file_unique_id': file_id,
+                    'file_size': len(self.documents.get(file_id, b'')), 'file_path': file_id}
+        if method in ('sendMessage', 'editMessageText', 'sendDocument', 'editMessageReplyMarkup'):
+            return self._record_message(method, params)
+        return True
+
+    def _get_updates(self, params):
+        offset = int(params.get('offset') or 0)
+        timeout = float(params.get('timeout') or 0)
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self._updates = [u for u in self._updates if u['update_id'] >= offset]
+            while not self._updates:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            return list(self._updates)
+
+    def _record_message(self, method, params):
+        chat_id = int(params.get('chat_id') or FAKE_CHAT_ID)
+        message_id = int(params.get('message_id') or next(self._message_ids))
+        record = {
+            'method': method,
+            'chat_id': chat_id,
+            'message_id': message_id,
+            'text': params.get('text') or params.get('caption') or '',
+            'params': params,
+            'time': time.monotonic(),
+        }
+        with self._cond:
+            self.sent.append(record)
+            self._cond.notify_all()
+        return {
+            'message_id': message_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'supergroup', 'title': 'Fake Group'},
+            'text': record['text'],
+        }
+
+    def _deliver_webhooks(self):
+        while True:
+            update = self._webhook_queue.get()
+            url = self.webhook_url
+            if not url:
+                with self._cond:
+                    self._updates.append(update)
+                    self._cond.notify_all()
+                continue
+            request = urllib.request.Request(
+                url,
+                data=json.dumps(update).encode('utf-8'),
+                headers={'Content-Type': 'application/json',
+                         'X-Telegram-Bot-Api-Secret-Token': self.webhook_secret or ''},
+            )
+            if self.latency:
+                time.sleep(self.latency)
+            try:
+                urllib.request.urlopen(request, timeout=10).close()
+            except Exception:
+                # Telegram would retry; keep the update for the next attempt
+                time.sleep(0.5)
+                self._webhook_queue.put(update)
+
+class _FakeApiHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        self._dispatch(b'')
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        self._dispatch(self.rfile.read(length) if length else b'')
+
+    def _dispatch(self, body):
+        api = self.server.api
+        parts = urlsplit(self.path)
+        segments = parts.path.strip('/').split('/')
+
+        # File downloads: /file/bot<token>/<file_path>
+        if segments[0] == 'file':
+            content = api.documents.get(segments[-1])
+            if content is None:
+                self.send_error(404)
+                return
+            self._send(200, content, 'application/octet-stream')
+            return
+
+        method = segments[-1]
+        params = dict(parse_qsl(parts.query))
+        params.update(self._parse_body(body))
+        # Simulate the request and response legs of the round trip
+        if api.latency:
+            time.sleep(api.latency)
+        result = api.handle(method, params)
+        if api.latency:
+            time.sleep(api.latency)
+        self._send(200, json.dumps({'ok': True, 'result': result}).encode('utf-8'), 'application/json')
+
+    def _parse_body(self, body):
+        if not body:
+            return {}
+        content_type = self.headers.get('Content-Type', '')
+        if content_type.startswith('application/json'):
+            return json.loads(body)
+        if content_type.startswith('multipart/form-data'):
+            message = BytesParser(policy=HTTP).parsebytes(
+                f'Content-Type: {content_type}\r\n\r\n'.encode('latin-1') + body
+            )
+            params = {}
+            for part in message.iter_parts():
+                name = part.get_param('name', header='content-disposition')
+                payload = part.get_payload(decode=True)
+                if part.get_filename():
+                    params[name] = {'file_name': part.get_filename(), 'content': payload}
+                else:
+                    params[name] = payload.decode('utf-8')
+            return params
+        return dict(parse_qsl(body.decode('utf-8')))
+
+    def _send(self, status, payload, content_type):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def start_bot_process(api, workdir, extra_env=None):
+    """Run main.py as a subprocess wired to the fake API."""
+    env = dict(os.environ)
+    env.update({
+        'TELEGRAM_BOT_TOKEN': FAKE_TOKEN,
+        'TELEGRAM_API_BASE_URL': api.base_url,
+        'ALLOWED_GROUP_IDS': str(FAKE_CHAT_ID),
+        'ADMIN_CHAT_ID': '',
+        'DATA_FILE': os.path.join(workdir, 'tracked_products.json'),
+        'CHECK_STATE_FILE': os.path.join(workdir, 'check_state.json'),
+        'PID_FILE': os.path.join(workdir, 'bot.pid'),
+        'HEARTBEAT_FILE': os.path.join(workdir, 'bot.heartbeat'),
+    })
+    env.update(extra_env or {})
+    main_script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')
+    return subprocess.Popen([sys.executable, main_script], cwd=workdir, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+def stop_bot_process(process):
+    process.send_signal(signal.SIGTERM)
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+def measure_round_trips(mode, rounds, latency=0.0, spacing=None):
+    """Send /start repeatedly and return the reply latencies in milliseconds.
+
+    Without spacing each command waits for its reply. With spacing (seconds)
+    commands arrive at exponentially distributed intervals with that mean,
+    regardless of replies, like a busy group.
+    """
+    api = FakeTelegramAPI(latency=latency).start()
+    extra_env = {'RUNTIME': 'asyncio'} if mode == 'asyncio' else {'UPDATE_MODE': mode}
+    if mode == 'webhook':
+        port = _free_port()
+        extra_env.update({
+            'WEBHOOK_URL': f'http://127.0.0.1:{port}/telegram',
+            'WEBHOOK_PORT': str(port),
+            'WEBHOOK_SECRET': 'fake-secret',
+        })
+
+    with tempfile.TemporaryDirectory() as workdir:
+        process = start_bot_process(api, workdir, extra_env)
+        try:
+            ready_call = 'setWebhook' if mode == 'webhook' else 'getUpdates'
+            if not api.wait_for_call(ready_call, timeout=60):
+                raise RuntimeError(f'Bot did not start in {mode} mode')
+            time.sleep(1)
+
+            start_index = len(api.sent)
+            sent_at = []
+            for _ in range(rounds):
+                sent_at.append(time.monotonic())
+                api.inject_message('/start')
+                if spacing is None:
+                    if not api.wait_for(lambda r: r['method'] == 'sendMessage', timeout=10,
+                                        start=start_index + len(sent_at) - 1):
+                        raise RuntimeError(f'No reply to /start in {mode} mode')
+                else:
+                    time.sleep(random.expovariate(1 / spacing))
+
+            # /start runs on the dispatcher thread, so replies come back in order
+            if not api.wait_for(lambda r: r['method'] == 'sendMessage', timeout=30,
+                                start=start_index + rounds - 1):
+                raise RuntimeError(f'Missing replies to /start in {mode} mode')
+            replies = [r for r in api.sent[start_index:] if r['method'] == 'sendMessage']
+            return [(reply['time'] - started) * 1000 for reply, started in zip(replies, sent_at)]
+        finally:
+            stop_bot_process(process)
+            api.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare /start round-trip latency of polling, webhook and asyncio runtime.')
+    parser.add_argument('--rounds', type=int, default=30)
+    parser.add_argument('--latency-ms', type=float, default=50.0,
+                        help='simulated one-way network delay to the Telegram API')
+    parser.add_argument('--spacing-ms', type=float, default=None,
+                        help='send commands at this mean interval instead of one at a time')
+    args = parser.parse_args()
+    spacing = args.spacing_ms / 1000 if args.spacing_ms is not None else None
+
+    for mode in ('polling', 'webhook', 'asyncio'):
+        latencies = measure_round_trips(mode, args.rounds, args.latency_ms / 1000, spacing)
+        latencies.sort()
+        p95 = latencies[max(0, int(len(latencies) * 0.95) - 1)]
+        print(f'{mode:8s} median {statistics.median(latencies):7.2f} ms   p95 {p95:7.2f} ms   '
+              f'max {latencies[-1]:7.2f} ms   ({len(latencies)} rounds)')
+
+if __name__ == '__main__':
+    main()
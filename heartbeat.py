@@ -0,0 +1,138 @@
+import mmap
+import os
+import struct
+import threading
+import time
+import logging
+from config import HEARTBEAT_FILE, PID_FILE
+
+logger = logging.getLogger(__name__)
+
+# Fixed-size status record shared with the watchdog through a memory-mapped file:
+# magic, version, pid, started_at, scheduler_beat, dispatcher_beat,
+# cycle_started_at (0 when idle), cycle_checked, cycle_total
+_RECORD = struct.Struct('<4sIIddddII')
+_MAGIC = b'TYHB'
+_VERSION = 1
+
+# Byte offsets of the individual fields inside the record
+_OFFSETS = {
+    'scheduler_beat': 20,
+    'dispatcher_beat': 28,
+    'cycle_started_at': 36,
+}
+_PROGRESS_OFFSET = 44
+
+class HeartbeatWriter:
+    """Publish the bot's PID and liveness timestamps for the watchdog."""
+
+    def __init__(self, path=HEARTBEAT_FILE, pid_path=PID_FILE):
+        self.path = path
+        self.pid_path = pid_path
+        self._lock = threading.Lock()
+        self._file = None
+        self._map = None
+
+    def start(self):
+        """Write the PID file and initialise the status record."""
+        now = time.time()
+        pid = os.getpid()
+
+        with open(self.pid_path, 'w') as f:
+            f.write(str(pid))
+
+        self._file = open(self.path, 'a+b')
+        self._file.truncate(_RECORD.size)
+        self._map = mmap.mmap(self._file.fileno(), _RECORD.size)
+        _RECORD.pack_into(self._map, 0, _MAGIC, _VERSION, pid, now, now, now, 0.0, 0, 0)
+        logger.info(f"Heartbeat published at {self.path} (PID {pid})")
+
+    def beat(self, component):
+        """Update the timestamp of 'scheduler' or 'dispatcher'."""
+        self._write_double(f'{component}_beat', time.time())
+
+    def cycle_started(self, total):
+        """Mark the start of a price check cycle."""
+        now = time.time()
+        with self._lock:
+            if self._map is None:
+                return
+            struct.pack_into('<d', self._map, _OFFSETS['scheduler_beat'], now)
+            struct.pack_into('<d', self._map, _OFFSETS['cycle_started_at'], now)
+            struct.pack_into('<II', self._map, _PROGRESS_OFFSET, 0, total)
+
+    def cycle_progress(self, checked):
+        """Record progress inside a cycle; also counts as a scheduler beat."""
+        with self._lock:
+            if self._map is None:
+                return
+            struct.pack_into('<d', self._map, _OFFSETS['scheduler_beat'], time.time())
+            struct.pack_into('<I', self._map, _PROGRESS_OFFSET, checked)
+
+    def cycle_finished(self):
+        """Mark the scheduler as idle again."""
+        self._write_double('cycle_started_at', 0.0)
+        self.beat('scheduler')
+
+    def stop(self):
+        """Remove the PID file and release the mapping."""
+        with self._lock:
+            if self._map is not None:
+                self._map.close()
+                self._map = None
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+        try:
+            os.remove(self.pid_path)
+        except OSError:
+            pass
+
+    def _write_double(self, field, value):
+        with self._lock:
+            if self._map is None:
+                return
+            struct.pack_into('<d', self._map, _OFFSETS[field], value)
+
+def read_pid(pid_path=PID_FILE):
+    """Return the PID from the PID file, or None."""
+    try:
+        with open(pid_path) as f:
+            return int(f.read().strip())
+    except (OSError, ValueError):
+        return None
+
+def read_heartbeat(path=HEARTBEAT_FILE):
+    """Read the status record, returning a dict or None if unavailable."""
+    try:
+        with open(path, 'rb') as f:
+            with mmap.mmap(f.fileno(), _RECORD.size, access=mmap.ACCESS_READ) as m:
+                values = _RECORD.unpack_from(m, 0)
+    except (OSError, ValueError, struct.error):
+        return None
+
+    magic, version, pid, started_at, scheduler_beat, dispatcher_beat, cycle_started_at, checked, total = values
+    if magic != _MAGIC or version != _VERSION:
+        return None
+
+    return {
+        'pid': pid,
+        'started_at': started_at,
+        'scheduler_beat': scheduler_beat,
+        'dispatcher_beat': dispatcher_beat,
+        'cycle_started_at': cycle_started_at,
+        'cycle_checked': checked,
+        'cycle_total': total,
+    }
+
+def is_process_alive(pid):
+    """Check whether a process with the given PID exists."""
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
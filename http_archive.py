@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Archive of fetched product pages for debugging extraction failures.
+
+Pages are stored gzip-compressed under HTTP_ARCHIVE_DIR, one blob per content
+hash, with an index of URL, outcome and timestamps. Every page that failed to
+parse is kept, plus HTTP_ARCHIVE_SAMPLE of the successful ones; entries older
+than HTTP_ARCHIVE_MAX_AGE_DAYS and, beyond HTTP_ARCHIVE_MAX_MB, the least
+recently used ones (successful pages first) are evicted.
+
+With HTTP_ARCHIVE_MODE=replay the scraper serves pages from the archive and
+makes no requests. Run directly to re-parse archived pages with the current
+parser and see which failures a fix resolves:
+
+    python http_archive.py stats
+    python http_archive.py replay --failures
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Outcomes that mean the parser did its job
+OK_OUTCOMES = (None, "Tükendi")
+
+class HttpArchive:
+    """Content-addressed store of fetched pages with an LRU/age-evicted index."""
+
+    def __init__(self, directory, max_bytes, max_age, sample_rate, replaying=False):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.sample_rate = sample_rate
+        self.replaying = replaying
+        self._index_file = os.path.join(directory, 'index.json')
+        self._lock = threading.Lock()
+        self._entries = None
+        self._by_url = {}
+
+    def _blob_path(self, digest):
+        return os.path.join(self.directory, 'blobs', digest[:2], f'{digest}.html.gz')
+
+    def _load(self):
+        if self._entries is not None:
+            return self._entries
+        self._entries = {}
+        if os.path.exists(self._index_file):
+            try:
+                with open(self._index_file, 'r', encoding='utf-8') as f:
+                    self._entries = json.load(f)
+            except Exception as e:
+                logger.error(f"Error loading HTTP archive index {self._index_file}: {e}")
+        for digest, entry in sorted(self._entries.items(), key=lambda item: item[1]['recorded_at']):
+            self._by_url[entry['url']] = digest
+        return self._entries
+
+    def _save(self):
+        tmp_file = f'{self._index_file}.tmp'
+        try:
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(self._entries, f)
+            os.replace(tmp_file, self._index_file)
+        except Exception as e:
+            logger.error(f"Error saving HTTP archive index {self._index_file}: {e}")
+
+    def record(self, url, html, error):
+        """Archive a parsed page if it failed or falls in the success sample; True if stored."""
+        if self.replaying or html is None:
+            return False
+        if error in OK_OUTCOMES and random.random() >= self.sample_rate:
+            return False
+
+        body = html.encode('utf-8')
+        digest = hashlib.sha256(body).hexdigest()
+        now = time.time()
+
+        with self._lock:
+            entries = self._load()
+            entry = entries.get(digest)
+            if entry is None:
+                path = self._blob_path(digest)
+                try:
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    with open(f'{path}.tmp', 'wb') as f:
+                        f.write(gzip.compress(body))
+                    os.replace(f'{path}.tmp', path)
+                except OSError as e:
+                    logger.error(f"Error archiving page {url}: {e}")
+                    return False
+                entry = entries[digest] = {'url': url, 'size': os.path.getsize(path)}
+            entry.update(error=error, recorded_at=now, last_used=now)
+            self._by_url[url] = digest
+            self._evict(now)
+            self._save()
+        return True
+
+    def _evict(self, now):
+        """Drop expired entries, then least recently used ones (successes first) beyond the cap."""
+        evicted = {digest for digest, entry in self._entries.items() if now - entry['recorded_at'] > self.max_age}
+        kept = [digest for digest in self._entries if digest not in evicted]
+        total = sum(self._entries[digest]['size'] for digest in kept)
+        if total > self.max_bytes:
+            kept.sort(key=lambda digest: (self._entries[digest]['error'] not in OK_OUTCOMES,
+                                          self._entries[digest]['last_used']))
+            for digest in kept:
+                if total <= self.max_bytes:
+                    break
+                evicted.add(digest)
+                total -= self._entries[digest]['size']
+
+        for digest in evicted:
+            entry = self._entries.pop(digest)
+            if self._by_url.get(entry['url']) == digest:
+                del self._by_url[entry['url']]
+            try:
+                os.remove(self._blob_path(digest))
+            except OSError:
+                pass
+
+    def read(self, digest):
+        """Return an archived page's HTML."""
+        with gzip.open(self._blob_path(digest), 'rb') as f:
+            return f.read().decode('utf-8')
+
+    def replay(self, url):
+        """Return (status_code, html) of the latest archived page for url; 404 if none."""
+        with self._lock:
+            self._load()
+            digest = self._by_url.get(url)
+            if digest is None:
+                return 404, None
+            self._entries[digest]['last_used'] = time.time()
+        try:
+            return 200, self.read(digest)
+        except OSError as e:
+            logger.error(f"Error reading archived page {url}: {e}")
+            return 404, None
+
+    def entries(self, failures_only=False):
+        """Return [(digest, entry)] sorted by recording time, newest first."""
+        with self._lock:
+            items = list(self._load().items())
+        if failures_only:
+            items = [(digest, entry) for digest, entry in items if entry['error'] not in OK_OUTCOMES]
+        return sorted(items, key=lambda item: item[1]['recorded_at'], reverse=True)
+
+def replay_archive(archive, failures_only=False, limit=None):
+    """Re-parse archived pages and compare outcomes with the recorded ones."""
+    from scraper import parse_product_page
+
+    counts = {'fixed': 0, 'still_failing': 0, 'regressed': 0, 'unchanged_ok': 0}
+    entries = archive.entries(failures_only)[:limit]
+    started = time.perf_counter()
+    for digest, entry in entries:
+        try:
+            _, price, error = parse_product_page(entry['url'], archive.read(digest))
+        except Exception as e:
+            price, error = None, f"Error scraping product: {e}"
+        was_ok, now_ok = entry['error'] in OK_OUTCOMES, error in OK_OUTCOMES
+        if was_ok and now_ok:
+            counts['unchanged_ok'] += 1
+            continue
+        status = 'fixed' if now_ok else 'regressed' if was_ok else 'still_failing'
+        counts[status] += 1
+        print(f"{status:14s} {entry['url']}  was: {entry['error'] or 'ok'}  now: {error or f'ok {price}'}")
+    elapsed = time.perf_counter() - started
+
+    print(f"\n{len(entries)} pages in {elapsed:.2f}s ({len(entries) / elapsed if elapsed else 0:.0f} pages/s): "
+          + ', '.join(f"{name} {count}" for name, count in counts.items()))
+    return counts
+
+def main():
+    from config import HTTP_ARCHIVE_DIR
+    from scraper import get_archive
+
+    parser = argparse.ArgumentParser(description='Inspect and replay the HTTP archive.')
+    parser.add_argument('command', choices=('stats', 'replay'))
+    parser.add_argument('--failures', action='store_true', help='replay only pages that failed to parse')
+    parser.add_argument('--limit', type=int, help='replay at most this many pages, newest first')
+    args = parser.parse_args()
+
+    archive = get_archive()
+    if archive is None:
+        parser.error('HTTP_ARCHIVE_DIR is not set')
+
+    if args.command == 'stats':
+        entries = archive.entries()
+        failures = [entry for _, entry in entries if entry['error'] not in OK_OUTCOMES]
+        print(f"{HTTP_ARCHIVE_DIR}: {len(entries)} pages, {len(failures)} failures, "
+              f"{sum(entry['size'] for _, entry in entries) / 1024 / 1024:.1f} MB")
+        reasons = {}
+        for entry in failures:
+            reasons[entry['error']] = reasons.get(entry['error'], 0) + 1
+        for reason, count in sorted(reasons.items(), key=lambda item: -item[1]):
+            print(f"  {count:6d}  {reason}")
+    else:
+        replay_archive(archive, args.failures, args.limit)
+
+if __name__ == '__main__':
+    main()
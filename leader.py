@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Leader lease for running two bot instances as active/passive (HA_LEASE_FILE).
+
+The lease is a row in an SQLite database on storage both machines share. The
+instance holding an unexpired lease is the leader: it polls Telegram, runs the
+price checks and sends notifications, and renews the lease every third of its
+TTL. The other instance waits as standby and takes the lease over once it has
+expired, or right away when the leader releases it on shutdown. Every change of
+holder increments the lease term.
+
+Expiry times are wall-clock timestamps, so both machines need synchronised
+clocks (NTP). Inspect the lease with:
+
+    python leader.py status
+"""
+
+import argparse
+import logging
+import os
+import socket
+import sqlite3
+import time
+from contextlib import closing
+
+logger = logging.getLogger(__name__)
+
+# Seconds between a standby's attempts to take the lease
+RETRY_INTERVAL = 1.0
+
+# Lease name of the scheduler and notifier
+LEASE_NAME = 'scheduler'
+
+_SCHEMA = 'CREATE TABLE IF NOT EXISTS lease (name TEXT PRIMARY KEY, holder TEXT, expires_at REAL, term INTEGER)'
+
+def default_node_id(pid=None):
+    """Lease holder name of a process on this machine (default: this one): hostname and PID."""
+    return f'{socket.gethostname()}:{pid or os.getpid()}'
+
+def _connect(path, timeout):
+    conn = sqlite3.connect(path, timeout=timeout, isolation_level=None)
+    conn.execute(_SCHEMA)
+    return conn
+
+def read_lease(path, name=LEASE_NAME):
+    """Return the lease as {'holder', 'expires_at', 'term'}, or None if never taken or unreadable."""
+    try:
+        with closing(_connect(path, 5)) as conn:
+            row = conn.execute('SELECT holder, expires_at, term FROM lease WHERE name = ?', (name,)).fetchone()
+    except sqlite3.Error as e:
+        logger.error(f"Error reading leader lease {path}: {e}")
+        return None
+    return {'holder': row[0], 'expires_at': row[1], 'term': row[2]} if row else None
+
+class LeaderLease:
+    """This instance's side of the lease: take, renew and release it."""
+
+    def __init__(self, path, node_id, ttl, name=LEASE_NAME):
+        self.path = path
+        self.node_id = node_id
+        self.ttl = ttl
+        self.name = name
+        # Latest holder seen, the one we took over from and our term while leader
+        self.holder = None
+        self.previous_holder = None
+        self.term = 0
+        self._valid_until = 0.0
+
+    def acquire(self):
+        """Take the lease if it is free or expired, or renew it if ours; True while we lead.
+
+        If the database cannot be reached, leadership lasts until our own last
+        renewal expires.
+        """
+        now = time.time()
+        try:
+            with closing(_connect(self.path, self.ttl / 3)) as conn:
+                conn.execute('BEGIN IMMEDIATE')
+                row = conn.execute('SELECT holder, expires_at, term FROM lease WHERE name = ?',
+                                   (self.name,)).fetchone()
+                if row and row[0] != self.node_id and row[1] > now:
+                    conn.execute('ROLLBACK')
+                    self.holder = row[0]
+                    self._valid_until = 0.0
+                    return False
+
+                taking_over = not row or row[0] != self.node_id
+                term = (row[2] if row else 0) + taking_over
+                conn.execute('INSERT OR REPLACE INTO lease (name, holder, expires_at, term) VALUES (?, ?, ?, ?)',
+                             (self.name, self.node_id, now + self.ttl, term))
+                conn.execute('COMMIT')
+        except sqlite3.Error as e:
+            logger.error(f"Error renewing leader lease {self.path}: {e}")
+            return self.held()
+
+        if taking_over:
+            self.previous_holder = row[0] if row else None
+        self.holder = self.node_id
+        self.term = term
+        self._valid_until = now + self.ttl
+        return True
+
+    def held(self):
+        """True until our last successful renewal expires."""
+        return time.time() < self._valid_until
+
+    def release(self):
+        """Give the lease up so a standby can take over without waiting for it to expire."""
+        if not self.held():
+            return
+        self._valid_until = 0.0
+        try:
+            with closing(_connect(self.path, 5)) as conn:
+                conn.execute('UPDATE lease SET expires_at = 0 WHERE name = ? AND holder = ?', (self.name, self.node_id))
+            logger.info(f"Released the leader lease (term {self.term})")
+        except sqlite3.Error as e:
+            logger.error(f"Error releasing leader lease {self.path}: {e}")
+
+def main():
+    from config import HA_LEASE_FILE
+
+    parser = argparse.ArgumentParser(description='Show the leader lease of an active/passive bot pair.')
+    parser.add_argument('command', choices=('status',))
+    parser.parse_args()
+
+    if not HA_LEASE_FILE:
+        parser.error('HA_LEASE_FILE is not set')
+
+    lease = read_lease(HA_LEASE_FILE)
+    if lease is None:
+        print(f"{HA_LEASE_FILE}: no leader yet")
+        return
+    remaining = lease['expires_at'] - time.time()
+    state = f"expires in {remaining:.1f}s" if remaining > 0 else "expired" if lease['expires_at'] else "released"
+    print(f"{HA_LEASE_FILE}: {lease['holder']} (term {lease['term']}), {state}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,539 @@
+#!/usr/bin/env python3
+"""
+End-to-end load simulator for the price checker.
+
+Starts a local fake Trendyol (an HTTP proxy serving templated product pages with
+configurable latency, error rate and price churn) and the fake Telegram Bot API,
+seeds the store with synthetic chats and products, then runs real check_prices
+cycles from main.py against them (check_prices_async with --env RUNTIME=asyncio).
+
+    python loadtest.py --products 5000 --chats 40 --cycles 2 --output run.json
+    python loadtest.py --products 5000 --chats 40 --baseline run.json
+
+The report covers throughput, cycle duration, notification latency, memory and
+store I/O, and can be compared against a previous run with --baseline.
+--proxies N routes page downloads through N stand-in egress proxies
+(EGRESS_PROXIES), optionally rate-limited per proxy (--proxy-rate) and with
+--bad-proxies of them failing half their requests. --variants N tracks N sizes of
+every product instead of the whole product.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import resource
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qsl
+
+import psutil
+
+PRODUCT_ID_RE = re.compile(r'-p-(\d+)')
+
+PAGE_TEMPLATE = '''<!DOCTYPE html>
+<html lang="tr"><head><meta charset="utf-8">
+<title>{brand} {name} Fiyatı, Yorumları - Trendyol</title>
+<script type="application/ld+json">{{"@type":"Product","name":"{name}","offers":{{"@type":"Offer","price":"{price_raw}","priceCurrency":"TRY"}}}}</script>
+</head><body>
+<div class="product-container">
+<h1 class="pr-new-br"><a class="product-brand-name-with-link" href="/{brand_slug}">{brand}</a><span>{name}</span></h1>
+<div class="product-price-container"><span class="prc-dsc">{price_text} TL</span></div>
+<div class="product-button-container">{button}</div>
+</div>
+<script>window.__PRODUCT_DETAIL_APP_INITIAL_STATE__={{"product":{{"id":{product_id},"winnerVariant":{{"price":{{"value":{price_raw}}}}},"allVariants":{variants}}}}}</script>
+{filler}
+</body></html>'''
+
+LISTING_TEMPLATE = '''<!DOCTYPE html>
+<html lang="tr"><head><meta charset="utf-8"><title>Arama Sonuçları - Trendyol</title></head><body>
+<div class="prdct-cntnr-wrppr">
+{cards}
+</div>
+</body></html>'''
+
+LISTING_CARD = (
+    '<div class="p-card-wrppr" data-id="{product_id}"><div class="p-card-chldrn-cntnr">'
+    '<a href="/{brand_slug}/urun-p-{product_id}"><h3 class="prdct-desc-cntnr-ttl-w">'
+    '<span class="prdct-desc-cntnr-ttl">{brand}</span> <span class="prdct-desc-cntnr-name">{name}</span></h3>'
+    '<div class="prc-box-dscntd">{price_text} TL</div>{sold_out}</a></div></div>'
+)
+
+# Cards per listing page, as on trendyol.com search results
+LISTING_PAGE_SIZE = 24
+
+# Sizes every product page offers, tracked with --variants
+SIZES = ('XS', 'S', 'M', 'L', 'XL', 'XXL', '36', '38', '40', '42')
+
+IN_STOCK_BUTTON = '<button class="add-to-basket">Sepete Ekle</button>'
+SOLD_OUT_BUTTON = '<button class="add-to-basket sold-out" disabled>Tükendi</button>'
+
+def format_price(price):
+    """Format a price the way Trendyol does (1.234,56)."""
+    text = f'{price:,.2f}'
+    return text.replace(',', 'X').replace('.', ',').replace('X', '.')
+
+class FakeTrendyol:
+    """Fake trendyol.com reachable as an HTTP proxy."""
+
+    def __init__(self, latency=0.0, error_rate=0.0, churn=0.0, sold_out_rate=0.0, page_kb=150, seed=1,
+                 restock_rate=1.0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.churn = churn
+        self.sold_out_rate = sold_out_rate
+        self.restock_rate = restock_rate
+        self.filler = '<div class="filler">' + ('<p>Ürün açıklaması ve yorumlar.</p>' * (page_kb * 1024 // 40)) + '</div>'
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.products = {}
+        # product id -> monotonic time the latest change was first served
+        self.changed_at = {}
+        self.stats = {'get': 0, 'head': 0, 'errors': 0, 'bytes_sent': 0, 'changes': 0}
+        self.httpd = self._server()
+        self.egresses = []
+
+    def _server(self):
+        httpd = ThreadingHTTPServer(('127.0.0.1', 0), _FakeTrendyolHandler)
+        httpd.daemon_threads = True
+        httpd.request_queue_size = 128
+        httpd.fake = self
+        httpd.egress = None
+        return httpd
+
+    @staticmethod
+    def _url(httpd):
+        host, port = httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    @property
+    def proxy_url(self):
+        return self._url(self.httpd)
+
+    def start(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        for httpd in [self.httpd] + self.egresses:
+            httpd.shutdown()
+            httpd.server_close()
+
+    def add_egress(self, rate=None, error_rate=0.0):
+        """Open another proxy port standing in for a separate egress IP; returns its URL.
+
+        Beyond rate requests per second the shop answers this IP with 429, and
+        error_rate of its requests fail with 503 on top of the shop's own errors.
+        """
+        httpd = self._server()
+        httpd.egress = {'rate': rate, 'error_rate': error_rate, 'tokens': rate or 0.0,
+                        'refilled': time.monotonic(), 'get': 0, 'throttled': 0, 'errors': 0}
+        self.egresses.append(httpd)
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+        return self._url(httpd)
+
+    def refuse(self, httpd):
+        """Status to turn a request through this proxy away with, or None to serve it."""
+        egress = httpd.egress
+        if egress is None:
+            return None
+        with self.lock:
+            egress['get'] += 1
+            if egress['rate']:
+                now = time.monotonic()
+                egress['tokens'] = min(egress['rate'], egress['tokens'] + (now - egress['refilled']) * egress['rate'])
+                egress['refilled'] = now
+                if egress['tokens'] < 1:
+                    egress['throttled'] += 1
+                    return 429
+                egress['tokens'] -= 1
+            if self.random.random() < egress['error_rate']:
+                egress['errors'] += 1
+                return 503
+        return None
+
+    def egress_stats(self):
+        return {self._url(httpd): {key: httpd.egress[key] for key in ('get', 'throttled', 'errors')}
+                for httpd in self.egresses}
+
+    def add_product(self, product_id, name, brand, price):
+        self.products[product_id] = {'name': name, 'brand': brand, 'price': price, 'sold_out': False}
+
+    def _advance(self, product_id):
+        """Apply churn to a product as it is served and return a copy of its state."""
+        product = self.products[product_id]
+        roll = self.random.random()
+        if roll < self.sold_out_rate:
+            changed = not product['sold_out']
+            product['sold_out'] = True
+        elif product['sold_out'] and self.random.random() >= self.restock_rate:
+            changed = False
+        elif roll < self.sold_out_rate + self.churn or product['sold_out']:
+            changed = True
+            product['sold_out'] = False
+            factor = 1 + self.random.choice((-1, 1)) * self.random.uniform(0.01, 0.2)
+            product['price'] = round(max(1.0, product['price'] * factor), 2)
+        else:
+            changed = False
+        if changed:
+            self.stats['changes'] += 1
+            self.changed_at[product_id] = time.monotonic()
+        return dict(product)
+
+    def render(self, product_id):
+        """Return (status, body) for a product page, applying churn and errors."""
+        with self.lock:
+            if product_id not in self.products:
+                return 404, b'Not found'
+            if self.random.random() < self.error_rate:
+                self.stats['errors'] += 1
+                return 503, b'Service unavailable'
+            product = self._advance(product_id)
+
+        page = PAGE_TEMPLATE.format(
+            brand=product['brand'],
+            brand_slug=product['brand'].lower(),
+            name=product['name'],
+            product_id=product_id,
+            price_raw=f"{product['price']:.2f}",
+            price_text=format_price(product['price']),
+            button=SOLD_OUT_BUTTON if product['sold_out'] else IN_STOCK_BUTTON,
+            variants=json.dumps([{'value': size, 'inStock': not product['sold_out'], 'price': product['price']}
+                                 for size in SIZES]),
+            filler=self.filler,
+        )
+        return 200, page.encode('utf-8')
+
+    def render_listing(self, page):
+        """Return (status, body) for a search page listing every product, LISTING_PAGE_SIZE per page."""
+        with self.lock:
+            if self.random.random() < self.error_rate:
+                self.stats['errors'] += 1
+                return 503, b'Service unavailable'
+            product_ids = sorted(self.products)[(page - 1) * LISTING_PAGE_SIZE:page * LISTING_PAGE_SIZE]
+            products = [(product_id, self._advance(product_id)) for product_id in product_ids]
+
+        cards = ''.join(
+            LISTING_CARD.format(
+                product_id=product_id,
+                brand=product['brand'],
+                brand_slug=product['brand'].lower(),
+                name=product['name'],
+                price_text=format_price(product['price']),
+                sold_out='<div class="sold-out-label">Tükendi</div>' if product['sold_out'] else '',
+            )
+            for product_id, product in products
+        )
+        return 200, LISTING_TEMPLATE.format(cards=cards).encode('utf-8')
+
+class _FakeTrendyolHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def handle(self):
+        try:
+            super().handle()
+        except ConnectionResetError:
+            # A client that hung up mid-page resets the kept-alive connection
+            pass
+
+    def _product_id(self):
+        match = PRODUCT_ID_RE.search(urlsplit(self.path).path)
+        return int(match.group(1)) if match else None
+
+    def do_HEAD(self):
+        fake = self.server.fake
+        with fake.lock:
+            fake.stats['head'] += 1
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_GET(self):
+        fake = self.server.fake
+        if fake.latency:
+            time.sleep(fake.random.expovariate(1 / fake.latency))
+        parts = urlsplit(self.path)
+        refused = fake.refuse(self.server)
+        if refused:
+            status, body = refused, b'Too many requests' if refused == 429 else b'Service unavailable'
+        elif parts.path == '/sr':
+            page = int(dict(parse_qsl(parts.query)).get('pi', '1'))
+            status, body = fake.render_listing(page)
+        else:
+            status, body = fake.render(self._product_id())
+        with fake.lock:
+            fake.stats['get'] += not refused
+            fake.stats['bytes_sent'] += len(body)
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # Streaming clients may hang up once they have what they need
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+def chat_sizes(products, chats):
+    """Split products over chats with a Zipf-like skew (one big group, many small)."""
+    weights = [1 / (i + 1) for i in range(chats)]
+    total = sum(weights)
+    sizes = [max(1, int(products * w / total)) for w in weights]
+    sizes[0] += products - sum(sizes)
+    return sizes
+
+def seed_store(fake, products, chats, seed, variants=0):
+    """Build synthetic tracked products and register them with the fake shop.
+
+    With variants, each product is tracked as that many size subscriptions.
+    """
+    rng = random.Random(seed)
+    data = {}
+    product_id = 100000
+    for index, size in enumerate(chat_sizes(products, chats)):
+        chat_id = str(-1001000000000 - index)
+        data[chat_id] = {}
+        for _ in range(size):
+            product_id += 1
+            brand = rng.choice(('Nike', 'Adidas', 'Koton', 'Mavi', 'LCW', 'Philips', 'Arzum'))
+            name = f'Ürün {product_id} {rng.choice(("Tişört", "Ayakkabı", "Kulaklık", "Çanta", "Mont"))}'
+            price = round(rng.uniform(20, 5000), 2)
+            fake.add_product(product_id, name, brand, price)
+            url = f'http://www.trendyol.com/{brand.lower()}/urun-p-{product_id}'
+            subscriptions = [(url, f'{brand} {name}', str(product_id))] if not variants else [
+                (f'{url}?v={size}', f'{brand} {name} ({size})', f'{product_id}-v{size}') for size in SIZES[:variants]
+            ]
+            for product_url, product_name, key in subscriptions:
+                data[chat_id][product_url] = {
+                    'initial_price': price,
+                    'current_price': price,
+                    'product_name': product_name,
+                    'product_id': key,
+                }
+    return data
+
+class StoreIOCounter:
+    """Count load/save calls and bytes of the JSON store."""
+
+    def __init__(self, data_manager):
+        self.data_manager = data_manager
+        self.loads = 0
+        self.saves = 0
+        self.io_seconds = 0.0
+        self._load = data_manager.load_data
+        self._save = data_manager.save_data
+
+    def install(self):
+        def load_data():
+            started = time.perf_counter()
+            try:
+                return self._load()
+            finally:
+                self.loads += 1
+                self.io_seconds += time.perf_counter() - started
+
+        def save_data(data):
+            started = time.perf_counter()
+            try:
+                return self._save(data)
+            finally:
+                self.saves += 1
+                self.io_seconds += time.perf_counter() - started
+
+        self.data_manager.load_data = load_data
+        self.data_manager.save_data = save_data
+
+    def snapshot(self):
+        return {'loads': self.loads, 'saves': self.saves, 'io_seconds': round(self.io_seconds, 3)}
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix='trendyol-loadtest-')
+    fake = FakeTrendyol(args.latency_ms / 1000, args.error_rate, args.churn, args.sold_out_rate,
+                        args.page_kb, args.seed, args.restock_rate).start()
+
+    # Configure the bot before importing it; product URLs go through the fake shop
+    os.environ.update({
+        'DATA_FILE': os.path.join(workdir, 'tracked_products.json'),
+        'CHECK_STATE_FILE': os.path.join(workdir, 'check_state.json'),
+        'PRICE_HISTORY_FILE': os.path.join(workdir, 'price_history.jsonl'),
+        'CHECK_INTERVAL': '0',
+        'ADMIN_CHAT_ID': '',
+        'HTTP_PROXY': fake.proxy_url,
+        'http_proxy': fake.proxy_url,
+        'NO_PROXY': '127.0.0.1,localhost',
+        'no_proxy': '127.0.0.1,localhost',
+    })
+    if args.proxies:
+        os.environ['EGRESS_PROXIES'] = ','.join(
+            fake.add_egress(args.proxy_rate, 0.5 if index < args.bad_proxies else 0.0)
+            for index in range(args.proxies)
+        )
+    os.environ.update(dict(item.split('=', 1) for item in args.env))
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    from fake_telegram import FakeTelegramAPI, FAKE_TOKEN
+    from telegram import Bot
+    import data_manager
+    import main
+
+    api = FakeTelegramAPI().start()
+    main._bot_instance = Bot(FAKE_TOKEN, base_url=api.base_url)
+
+    seed_chats = seed_store(fake, args.products, args.chats, args.seed, args.variants)
+    data_manager.save_data(seed_chats)
+    io_counter = StoreIOCounter(data_manager)
+    io_counter.install()
+
+    process = psutil.Process()
+    io_before = process.io_counters() if hasattr(process, 'io_counters') else None
+    rss_before = process.memory_info().rss
+
+    # Time into the cycle at which each chat's last product was checked
+    chat_finished = {}
+    record_check = main._record_check
+
+    def timed_record_check(chat_id, url):
+        chat_finished[chat_id] = time.monotonic()
+        record_check(chat_id, url)
+
+    main._record_check = timed_record_check
+    largest_chat = int(max(seed_chats, key=lambda chat_id: len(seed_chats[chat_id])))
+
+    check_prices = main.check_prices
+    if main.RUNTIME == 'asyncio':
+        from async_runtime import AsyncFetcher
+
+        async def check_prices_async():
+            async with AsyncFetcher() as fetcher:
+                await main.check_prices_async(fetcher)
+
+        check_prices = lambda: asyncio.run(check_prices_async())
+
+    cycles = []
+    for cycle in range(args.cycles):
+        sent_before = len(api.sent)
+        get_before = fake.stats['get']
+        chat_finished.clear()
+        started = time.monotonic()
+        check_prices()
+        duration = time.monotonic() - started
+        small_finish = [finished - started for chat_id, finished in chat_finished.items() if chat_id != largest_chat]
+
+        latencies = []
+        for record in api.sent[sent_before:]:
+            match = PRODUCT_ID_RE.search(record['text'] + json.dumps(record['params'], ensure_ascii=False))
+            changed = fake.changed_at.get(int(match.group(1))) if match else None
+            if changed is not None and record['time'] >= changed:
+                latencies.append(record['time'] - changed)
+
+        checked = fake.stats['get'] - get_before
+        cycles.append({
+            'cycle': cycle + 1,
+            'duration_s': round(duration, 2),
+            'page_requests': checked,
+            'throughput_per_s': round(checked / duration, 2) if duration else None,
+            'notifications': len(api.sent) - sent_before,
+            'notification_latency_p50_s': round(percentile(latencies, 0.5), 3) if latencies else None,
+            'notification_latency_p95_s': round(percentile(latencies, 0.95), 3) if latencies else None,
+            'small_chats_done_p50_s': round(percentile(small_finish, 0.5), 2) if small_finish else None,
+            'small_chats_done_max_s': round(max(small_finish), 2) if small_finish else None,
+        })
+        print(f"cycle {cycle + 1}: {duration:.1f}s, {checked} pages, "
+              f"{len(api.sent) - sent_before} notifications, "
+              f"small chats done by {max(small_finish) if small_finish else 0:.1f}s", file=sys.stderr)
+
+    io_after = process.io_counters() if hasattr(process, 'io_counters') else None
+    report = {
+        'params': {key: value for key, value in vars(args).items() if key not in ('output', 'baseline')},
+        'cycles': cycles,
+        'summary': {
+            'mean_cycle_s': round(sum(c['duration_s'] for c in cycles) / len(cycles), 2),
+            'mean_throughput_per_s': round(sum(c['throughput_per_s'] or 0 for c in cycles) / len(cycles), 2),
+            'rss_mb': round(process.memory_info().rss / 1024 / 1024, 1),
+            'rss_growth_mb': round((process.memory_info().rss - rss_before) / 1024 / 1024, 1),
+            'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+            'store': io_counter.snapshot(),
+            'store_file_kb': round(os.path.getsize(data_manager.DATA_FILE) / 1024, 1),
+            'disk_write_mb': round((io_after.write_bytes - io_before.write_bytes) / 1024 / 1024, 1) if io_before else None,
+            'shop': dict(fake.stats),
+        },
+    }
+
+    if fake.egresses:
+        report['summary']['egress'] = fake.egress_stats()
+
+    api.stop()
+    fake.stop()
+    return report
+
+def compare(report, baseline):
+    """Print relative change of the headline numbers against a baseline report."""
+    rows = [
+        ('mean_cycle_s', lambda r: r['summary']['mean_cycle_s']),
+        ('mean_throughput_per_s', lambda r: r['summary']['mean_throughput_per_s']),
+        ('peak_rss_mb', lambda r: r['summary']['peak_rss_mb']),
+        ('store_saves', lambda r: r['summary']['store']['saves']),
+        ('store_io_seconds', lambda r: r['summary']['store']['io_seconds']),
+        ('page_requests', lambda r: r['summary']['shop']['get']),
+        ('small_chats_done_max_s', lambda r: max(c['small_chats_done_max_s'] or 0 for c in r['cycles'])),
+    ]
+    print(f"{'metric':24s} {'baseline':>12s} {'current':>12s} {'change':>9s}")
+    for name, getter in rows:
+        old, new = getter(baseline), getter(report)
+        change = f'{(new - old) / old * 100:+.1f}%' if old else 'n/a'
+        print(f'{name:24s} {old:12} {new:12} {change:>9s}')
+
+def main():
+    parser = argparse.ArgumentParser(description='Run check cycles against fake Trendyol and Telegram servers.')
+    parser.add_argument('--products', type=int, default=500)
+    parser.add_argument('--chats', type=int, default=10)
+    parser.add_argument('--cycles', type=int, default=2)
+    parser.add_argument('--latency-ms', type=float, default=20.0, help='mean page latency')
+    parser.add_argument('--error-rate', type=float, default=0.01, help='share of page requests answered with 503')
+    parser.add_argument('--churn', type=float, default=0.05, help='chance a page shows a new price')
+    parser.add_argument('--sold-out-rate', type=float, default=0.01, help='chance a page shows the product sold out')
+    parser.add_argument('--restock-rate', type=float, default=1.0,
+                        help='chance a sold-out page is back in stock the next time it is served')
+    parser.add_argument('--variants', type=int, default=0, choices=range(len(SIZES) + 1), metavar='N',
+                        help=f'track N sizes of every product (at most {len(SIZES)}) instead of the product')
+    parser.add_argument('--page-kb', type=int, default=150, help='approximate product page size')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--proxies', type=int, default=0,
+                        help='stand-in egress proxies to route through (sets EGRESS_PROXIES)')
+    parser.add_argument('--proxy-rate', type=float, help='requests per second the shop accepts per proxy')
+    parser.add_argument('--bad-proxies', type=int, default=0, help='proxies that fail half their requests')
+    parser.add_argument('--env', action='append', default=[], metavar='KEY=VALUE',
+                        help='extra bot setting for this run, e.g. --env STREAM_FETCH=true')
+    parser.add_argument('--output', help='write the JSON report to this file')
+    parser.add_argument('--baseline', help='compare against a previous JSON report')
+    args = parser.parse_args()
+
+    report = run(args)
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    print(text)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            compare(report, json.load(f))
+
+if __name__ == '__main__':
+    main()
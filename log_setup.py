@@ -0,0 +1,126 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Records waiting for the writer thread; beyond this, new records are dropped
+# instead of blocking the caller
+QUEUE_SIZE = 10000
+
+_listener = None
+_queue_handler = None
+_setup_lock = threading.Lock()
+
+class JsonFormatter(logging.Formatter):
+    """Format records as one JSON object per line."""
+
+    def format(self, record):
+        entry = {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(record.created)) + f'.{int(record.msecs):03d}',
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'message': record.getMessage(),
+        }
+        if getattr(record, 'sampled', None):
+            entry['sampled'] = record.sampled
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+class SamplingFilter(logging.Filter):
+    """Keep one in N records whose message starts with a configured prefix.
+
+    Only records below WARNING are sampled. A kept record carries the number of
+    records it stands for in its 'sampled' attribute.
+    """
+
+    def __init__(self, rules):
+        super().__init__()
+        self.rules = {prefix: rate for prefix, rate in rules.items() if rate > 1}
+        self._counts = dict.fromkeys(self.rules, 0)
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or not self.rules:
+            return True
+        message = record.getMessage()
+        for prefix, rate in self.rules.items():
+            if message.startswith(prefix):
+                with self._lock:
+                    self._counts[prefix] += 1
+                    keep = self._counts[prefix] % rate == 1
+                if keep:
+                    record.sampled = rate
+                    record.msg, record.args = f'{message} [1/{rate} sampled]', None
+                return keep
+        return True
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that drops records when the writer thread falls behind."""
+
+    dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            type(self).dropped += 1
+
+def setup_logging(log_file='', log_format='text', max_bytes=5 * 1024 * 1024, backup_count=3,
+                  sample_rules=None, level=logging.INFO):
+    """Route all logging through a queue drained by a background writer thread.
+
+    Output goes to stderr and, when log_file is set, to a size-rotated file. Calling
+    it again replaces the previous configuration (e.g. the watchdog's own log file).
+    """
+    global _listener, _queue_handler
+
+    with _setup_lock:
+        root = logging.getLogger()
+        if _listener is not None:
+            _listener.stop()
+            root.removeHandler(_queue_handler)
+            for handler in _listener.handlers:
+                handler.close()
+
+        formatter = JsonFormatter() if log_format == 'json' else logging.Formatter(TEXT_FORMAT)
+        handlers = [logging.StreamHandler(sys.stderr)]
+        if log_file:
+            handlers.append(logging.handlers.RotatingFileHandler(
+                log_file, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8'
+            ))
+        for handler in handlers:
+            handler.setFormatter(formatter)
+
+        _queue_handler = _DroppingQueueHandler(queue.Queue(QUEUE_SIZE))
+        _queue_handler.addFilter(SamplingFilter(sample_rules or {}))
+
+        # Replace handlers installed by earlier basicConfig calls
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(_queue_handler)
+        root.setLevel(level)
+
+        _listener = logging.handlers.QueueListener(_queue_handler.queue, *handlers, respect_handler_level=True)
+        _listener.start()
+
+def stop_logging():
+    """Flush queued records and stop the writer thread."""
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            _listener.stop()
+            for handler in _listener.handlers:
+                handler.close()
+            _listener = None
+        if _DroppingQueueHandler.dropped:
+            sys.stderr.write(f'{_DroppingQueueHandler.dropped} log records dropped (writer behind)\n')
+
+atexit.register(stop_logging)
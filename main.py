@@ -1,26 +1,81 @@
+import asyncio
+import functools
+import html
+import os
 import logging
 import re
 import time
 import threading
+import signal
 import schedule
+import tempfile
 import traceback
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
-from telegram import Update, ParseMode
-from telegram.ext import Updater, CommandHandler, MessageHandler, Filters, CallbackContext
-from scraper import scrape_product_info, is_valid_trendyol_url
-from data_manager import add_product, remove_product, get_all_products, update_product_price
-from config import TELEGRAM_BOT_TOKEN, CHECK_INTERVAL, ALLOWED_GROUP_IDS, ADMIN_CHAT_ID
-
-# Configure logging
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
+from telegram import Update, ParseMode, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest
+from telegram.ext import (
+    Updater, CommandHandler, MessageHandler, CallbackQueryHandler, TypeHandler, Filters, CallbackContext
 )
+from scraper import (
+    scrape_product_info, is_valid_trendyol_url, get_stream_stats, resolve_product_url, get_full_url, scrape_listings,
+    get_strategy_stats, get_egress, probe_stock, get_probe_stats, scrape_product_page, split_variant, variant_url,
+    variant_result, get_shadow_stats
+)
+from data_manager import (
+    add_product, add_products, remove_product, get_all_products, get_products_page, update_product_price, find_product,
+    update_product_name, search_products, add_target_price, clear_target_prices, crossed_target_prices,
+    migrate_product_keys, load_check_state, save_check_state, iter_products, product_count, record_check
+)
+from heartbeat import HeartbeatWriter
+from fair_queue import fair_order, ChatCheckCap
+from webhook_server import WebhookServer
+from export import export, compress_if_large
+from leader import LeaderLease, default_node_id, RETRY_INTERVAL
+from shadow import summary as shadow_summary
+from config import (
+    TELEGRAM_BOT_TOKEN, CHECK_INTERVAL, ALLOWED_GROUP_IDS, ADMIN_CHAT_ID, STREAM_FETCH, HEARTBEAT_INTERVAL,
+    CHECKPOINT_EVERY, SHUTDOWN_DRAIN_TIMEOUT, TELEGRAM_API_BASE_URL, UPDATE_MODE, WEBHOOK_URL,
+    WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET, WEBHOOK_HEALTH_INTERVAL, DISPATCHER_WORKERS,
+    TELEGRAM_API_BASE_FILE_URL, BATCH_MAX_LINKS, BATCH_SCRAPE_WORKERS, BATCH_PROGRESS_INTERVAL,
+    LIST_PAGE_SIZE, LISTING_URLS, CHAT_WEIGHTS, CHAT_CHECK_CAP, CHAT_CAP_WINDOW, RUNTIME,
+    EGRESS_PROXIES, EXPORT_GZIP_BYTES, PRICE_HISTORY_FILE, STOCK_PROBE, SOLD_OUT_MAX_INTERVAL, HA_LEASE_FILE, HA_LEASE_TTL, HA_NODE_ID
+)
+
 logger = logging.getLogger(__name__)
 
 # Global variable to store bot instance
 _bot_instance = None
 
+# Liveness record read by the watchdog
+_heartbeat = HeartbeatWriter()
+
+# Updater and, in webhook mode, the local webhook server
+_updater = None
+_webhook_server = None
+
+class HeartbeatTick:
+    """Marker object pushed through the dispatcher queue to prove it is processing."""
+
+HEARTBEAT_TICK = HeartbeatTick()
+
+# Set on SIGINT/SIGTERM; the scheduler drains its in-flight check and stops
+_shutdown_event = threading.Event()
+
+# Per-product last-checked/next-due times, checkpointed for warm restarts
+_started_at = time.time()
+
+# Set once the store has been loaded after startup
+_store_ready = threading.Event()
+
+# Per-chat limit on checks within CHAT_CAP_WINDOW minutes
+_chat_cap = ChatCheckCap(CHAT_CHECK_CAP, CHAT_CAP_WINDOW * 60)
+
+# Leader lease of an active/passive pair (HA_LEASE_FILE); only the holder serves
+_lease = LeaderLease(HA_LEASE_FILE, HA_NODE_ID or default_node_id(), HA_LEASE_TTL) if HA_LEASE_FILE else None
+_lease_done = threading.Event()
+
 def is_allowed_chat(chat_id):
     """Check if the chat_id is in the allowed list."""
     return chat_id in ALLOWED_GROUP_IDS
@@ -39,36 +94,33 @@ def start(update: Update, context: CallbackContext):
         'Komutlar:\n'
         '/ekle [Trendyol linki] - Fiyat takibi için yeni bir ürün ekler\n'
         '/sil [Trendyol linki] - Takipten bir ürün çıkarır\n'
-        '/listele - Takip edilen tüm ürünleri listeler\n'
-        '/yenile - Tüm ürünlerin fiyatlarını manuel olarak kontrol eder\n\n'
-        'Ayrıca, direkt olarak Trendyol.com veya ty.gl linki göndererek de ürün ekleyebilirsiniz.'
+        '/listele - Takip edilen ürünleri sayfa sayfa listeler\n'
+        '/ara [kelime] - Takip edilen ürünlerde isimle arama yapar\n'
+        '/hedef [Trendyol linki] [fiyat] - Fiyat bu değere düştüğünde bildirim gönderir\n'
+        '/varyant [Trendyol linki] [beden ...] - Ürünün bedenlerini listeler veya seçilen bedenleri takip eder\n'
+        '/yenile - Tüm ürünlerin fiyatlarını manuel olarak kontrol eder\n'
+        '/disa_aktar [csv|jsonl] [gecmis] - Ürünleri veya fiyat geçmişini dosya olarak gönderir\n\n'
+        'Ayrıca, direkt olarak Trendyol.com veya ty.gl linki göndererek de ürün ekleyebilirsiniz.\n'
+        'Birden fazla link içeren bir mesaj veya her satırda bir link olan .txt/.csv dosyası göndererek toplu ekleme yapabilirsiniz.'
     )
 
+URL_PATTERN = re.compile(r'https?://(?:www\.|m\.)?(trendyol\.com|ty\.gl|tyml\.gl|trendyol-milla\.com)[^\s,;"\']+')
+
 def extract_url(text):
     """Extract URL from text."""
-    url_pattern = r'https?://(?:www\.)?(trendyol\.com|ty\.gl|tyml\.gl|trendyol-milla\.com)[^\s]+'
-    match = re.search(url_pattern, text)
+    match = URL_PATTERN.search(text)
     return match.group(0) if match else None
 
-def add_product_handler(update: Update, context: CallbackContext):
-    """Add a product to track."""
-    chat_id = update.effective_chat.id
-    
-    # Check if the chat is allowed
-    if not is_allowed_chat(chat_id):
-        logger.info(f"Unauthorized add_product command from chat_id: {chat_id}")
-        return
-    
-    # Extract URL from command or message text
-    if context.args:
-        url = extract_url(' '.join(context.args))
-    else:
-        update.message.reply_text('Lütfen geçerli bir Trendyol linki ekleyin.\n'
-                                'Örnek: /ekle https://www.trendyol.com/...')
-        return
-    
-    if not url or not is_valid_trendyol_url(url):
-        update.message.reply_text('Geçerli bir Trendyol linki bulunamadı.')
+def extract_urls(text):
+    """Extract all distinct URLs from text, in order of appearance."""
+    return list(dict.fromkeys(match.group(0) for match in URL_PATTERN.finditer(text)))
+
+def track_product(update: Update, chat_id, url):
+    """Scrape a product link and add it to the chat's tracked products."""
+    # Normalize to the canonical product URL so the same product is tracked once
+    url, product_id = resolve_product_url(url)
+    if product_id and find_product(chat_id, product_id):
+        update.message.reply_text('Bu ürün zaten takip ediliyor.')
         return
     
     # Send initial message
@@ -79,9 +131,10 @@ def add_product_handler(update: Update, context: CallbackContext):
     
     if error == "Tükendi":
         # Handle sold out product
-        success = add_product(chat_id, url, product_name, price)  # price is 0 for sold out products
+        success = add_product(chat_id, url, product_name, price, product_id)  # price is 0 for sold out products
         
         if success:
+            forget_list_fragments(chat_id)
             message.edit_text(
                 f'Ürün başarıyla eklendi!\n\n'
                 f'Ürün: {product_name}\n'
@@ -100,9 +153,10 @@ def add_product_handler(update: Update, context: CallbackContext):
         return
     
     # Add the product to tracking
-    success = add_product(chat_id, url, product_name, price)
+    success = add_product(chat_id, url, product_name, price, product_id)
     
     if success:
+        forget_list_fragments(chat_id)
         message.edit_text(
             f'Ürün başarıyla eklendi!\n\n'
             f'Ürün: {product_name}\n'
@@ -112,6 +166,124 @@ def add_product_handler(update: Update, context: CallbackContext):
     else:
         message.edit_text('Ürün eklenirken bir hata oluştu. Lütfen daha sonra tekrar deneyin.')
 
+def _edit_progress(message, text):
+    """Edit a progress message, ignoring 'message is not modified' and similar errors."""
+    try:
+        message.edit_text(text)
+    except Exception as e:
+        logger.debug(f"Progress message edit failed: {e}")
+
+def _format_batch_summary(added, duplicates, failed, skipped):
+    """Build the final batch import report, kept under Telegram's message limit."""
+    lines = [
+        '✅ Toplu ekleme tamamlandı\n',
+        '📊 Özet:',
+        f'• Eklenen: {len(added)}',
+        f'• Zaten takip edilen: {len(duplicates)}',
+        f'• Başarısız: {len(failed)}',
+    ]
+    if skipped:
+        lines.append(f'• Limit nedeniyle atlanan: {skipped}')
+    
+    sections = [
+        ('\n➕ Eklenenler:', [f'• {name}' for name, _ in added]),
+        ('\n🔁 Zaten takip edilenler:', [f'• {url}' for url in duplicates]),
+        ('\n❌ Başarısız:', [f'• {url} - {error}' for url, error in failed]),
+    ]
+    for title, items in sections:
+        if items:
+            lines.append(title)
+            lines.extend(items)
+    
+    text = '\n'.join(lines)
+    if len(text) > 4000:
+        text = text[:3950].rsplit('\n', 1)[0] + '\n…'
+    return text
+
+def batch_import(update: Update, chat_id, urls):
+    """Scrape many links concurrently and add them to the store in one write."""
+    skipped = max(0, len(urls) - BATCH_MAX_LINKS)
+    urls = urls[:BATCH_MAX_LINKS]
+    
+    message = update.message.reply_text(f'🔄 {len(urls)} link işleniyor...')
+    
+    added = []
+    duplicates = []
+    failed = []
+    to_add = []
+    seen_ids = set()
+    seen_lock = threading.Lock()
+    
+    def scrape(url):
+        canonical_url, product_id = resolve_product_url(url)
+        with seen_lock:
+            # Duplicates within the batch or against products the chat already tracks
+            if product_id and (product_id in seen_ids or find_product(chat_id, product_id)):
+                return url, canonical_url, product_id, None, None, 'duplicate'
+            seen_ids.add(product_id)
+        product_name, price, error = scrape_product_info(canonical_url)
+        return url, canonical_url, product_id, product_name, price, error
+    
+    last_edit = time.monotonic()
+    with ThreadPoolExecutor(max_workers=BATCH_SCRAPE_WORKERS) as executor:
+        futures = {executor.submit(scrape, url): url for url in urls}
+        for done, future in enumerate(as_completed(futures), start=1):
+            try:
+                url, canonical_url, product_id, product_name, price, error = future.result()
+            except Exception as e:
+                logger.error(f"Batch import scrape failed for {futures[future]}: {e}")
+                failed.append((futures[future], str(e)))
+                continue
+            
+            if error == 'duplicate':
+                duplicates.append(url)
+            elif error == "Tükendi" or (not error and price):
+                # Sold-out products are tracked with price 0, like single adds
+                to_add.append((canonical_url, product_name, price, product_id))
+                added.append((product_name, price))
+            else:
+                failed.append((url, error or 'Fiyat alınamadı'))
+            
+            # Throttle progress edits to stay within Telegram's rate limits
+            now = time.monotonic()
+            if now - last_edit >= BATCH_PROGRESS_INTERVAL and done < len(urls):
+                last_edit = now
+                _edit_progress(message, f'🔄 Ürünler ekleniyor... {done}/{len(urls)}\n'
+                                        f'Eklenen: {len(added)} • Zaten var: {len(duplicates)} • Hata: {len(failed)}')
+    
+    if to_add and not add_products(chat_id, to_add):
+        message.edit_text('Ürünler kaydedilirken bir hata oluştu. Lütfen daha sonra tekrar deneyin.')
+        return
+    forget_list_fragments(chat_id)
+    
+    _edit_progress(message, _format_batch_summary(added, duplicates, failed, skipped))
+
+def add_product_handler(update: Update, context: CallbackContext):
+    """Add a product to track."""
+    chat_id = update.effective_chat.id
+    
+    # Check if the chat is allowed
+    if not is_allowed_chat(chat_id):
+        logger.info(f"Unauthorized add_product command from chat_id: {chat_id}")
+        return
+    
+    # Extract URL from command or message text
+    if context.args:
+        urls = [url for url in extract_urls(' '.join(context.args)) if is_valid_trendyol_url(url)]
+    else:
+        update.message.reply_text('Lütfen geçerli bir Trendyol linki ekleyin.\n'
+                                'Örnek: /ekle https://www.trendyol.com/...')
+        return
+    
+    if not urls:
+        update.message.reply_text('Geçerli bir Trendyol linki bulunamadı.')
+        return
+    
+    if len(urls) > 1:
+        batch_import(update, chat_id, urls)
+    else:
+        track_product(update, chat_id, urls[0])
+
 def url_handler(update: Update, context: CallbackContext):
     """Handle messages containing Trendyol URLs."""
     chat_id = update.effective_chat.id
@@ -121,52 +293,41 @@ def url_handler(update: Update, context: CallbackContext):
         logger.info(f"Unauthorized URL message from chat_id: {chat_id}")
         return
     
-    # Extract URL from message text
-    url = extract_url(update.message.text)
+    # Extract URLs from message text
+    urls = [url for url in extract_urls(update.message.text) if is_valid_trendyol_url(url)]
     
-    if not url or not is_valid_trendyol_url(url):
+    if not urls:
         return  # Ignore non-Trendyol URLs
     
-    # Send initial message
-    message = update.message.reply_text('Ürün bilgileri alınıyor...')
-    
-    # Fetch product info
-    product_name, price, error = scrape_product_info(url)
+    if len(urls) > 1:
+        batch_import(update, chat_id, urls)
+    else:
+        track_product(update, chat_id, urls[0])
+
+def document_handler(update: Update, context: CallbackContext):
+    """Import Trendyol links from an uploaded .txt or .csv file, one per line."""
+    chat_id = update.effective_chat.id
     
-    if error == "Tükendi":
-        # Handle sold out product
-        success = add_product(chat_id, url, product_name, price)  # price is 0 for sold out products
-        
-        if success:
-            message.edit_text(
-                f'Ürün başarıyla eklendi!\n\n'
-                f'Ürün: {product_name}\n'
-                f'Durum: Tükendi\n\n'
-                f'Ürün tekrar stokta olduğunda size bildirim göndereceğim.'
-            )
-        else:
-            message.edit_text('Ürün eklenirken bir hata oluştu. Lütfen daha sonra tekrar deneyin.')
-        return
-    elif error:
-        message.edit_text(f'Hata: {error}')
+    # Check if the chat is allowed
+    if not is_allowed_chat(chat_id):
+        logger.info(f"Unauthorized document upload from chat_id: {chat_id}")
         return
     
-    if not price:
-        message.edit_text('Ürün fiyatı alınamadı. Lütfen linki kontrol edin.')
+    try:
+        content = update.message.document.get_file().download_as_bytearray()
+    except Exception as e:
+        logger.error(f"Failed to download document from {chat_id}: {e}")
+        update.message.reply_text('Dosya indirilemedi. Lütfen tekrar deneyin.')
         return
     
-    # Add the product to tracking
-    success = add_product(chat_id, url, product_name, price)
+    text = bytes(content).decode('utf-8-sig', errors='replace')
+    urls = [url for url in extract_urls(text) if is_valid_trendyol_url(url)]
     
-    if success:
-        message.edit_text(
-            f'Ürün başarıyla eklendi!\n\n'
-            f'Ürün: {product_name}\n'
-            f'Güncel Fiyat: {price:.2f} TL\n\n'
-            f'Fiyat değiştiğinde size bildirim göndereceğim.'
-        )
-    else:
-        message.edit_text('Ürün eklenirken bir hata oluştu. Lütfen daha sonra tekrar deneyin.')
+    if not urls:
+        update.message.reply_text('Dosyada geçerli bir Trendyol linki bulunamadı.')
+        return
+    
+    batch_import(update, chat_id, urls)
 
 def remove_product_handler(update: Update, context: CallbackContext):
     """Remove a product from tracking."""
@@ -189,16 +350,104 @@ def remove_product_handler(update: Update, context: CallbackContext):
         update.message.reply_text('Geçerli bir Trendyol linki bulunamadı.')
         return
     
-    # Remove the product from tracking
-    success = remove_product(chat_id, url)
+    # Remove the product from tracking, matching any link variant of the same product
+    url, product_id = resolve_product_url(url)
+    success = remove_product(chat_id, url, product_id)
     
     if success:
+        forget_list_fragments(chat_id)
         update.message.reply_text('Ürün takipten çıkarıldı.')
     else:
         update.message.reply_text('Ürün bulunamadı veya zaten takip edilmiyor.')
 
+# Rendered /listele entries: (chat_id, url) -> ((name, current, initial), html), least
+# recently shown first; beyond LIST_FRAGMENTS_MAX the oldest are dropped
+LIST_FRAGMENTS_MAX = 2000
+_list_fragments = OrderedDict()
+_list_fragments_lock = threading.Lock()
+
+def forget_list_fragments(chat_id):
+    """Drop a chat's cached /listele entries after its products change."""
+    chat_key = str(chat_id)
+    with _list_fragments_lock:
+        for key in [key for key in _list_fragments if key[0] == chat_key]:
+            del _list_fragments[key]
+
+def render_product_fragment(chat_id, url, product_info):
+    """Render one /listele entry, reusing the cached HTML while name and prices are unchanged."""
+    product_name = product_info.get('product_name', 'İsimsiz Ürün')
+    current_price = product_info.get('current_price', 0)
+    initial_price = product_info.get('initial_price', 0)
+    
+    key = (str(chat_id), url)
+    signature = (product_name, current_price, initial_price)
+    with _list_fragments_lock:
+        cached = _list_fragments.get(key)
+        if cached and cached[0] == signature:
+            _list_fragments.move_to_end(key)
+            return cached[1]
+    
+    name = html.escape(product_name)
+    link = html.escape(url, quote=True)
+    
+    # Check if product is sold out (price is 0)
+    if current_price == 0:
+        fragment = (
+            f'🔹 <b>{name}</b>\n'
+            f'   <b>Tükendi</b>\n'
+            f'   <a href="{link}">Link</a>\n\n'
+        )
+    else:
+        price_diff = current_price - initial_price
+        if price_diff > 0:
+            price_trend = f'📈 +{price_diff:.2f} TL'
+        elif price_diff < 0:
+            price_trend = f'📉 {price_diff:.2f} TL'
+        else:
+            price_trend = '➡️ Değişim yok'
+        
+        fragment = (
+            f'🔹 <b>{name}</b>\n'
+            f'   Güncel Fiyat: <b>{current_price:.2f} TL</b> {price_trend}\n'
+            f'   <a href="{link}">Link</a>\n\n'
+        )
+    
+    with _list_fragments_lock:
+        _list_fragments[key] = (signature, fragment)
+        _list_fragments.move_to_end(key)
+        while len(_list_fragments) > LIST_FRAGMENTS_MAX:
+            _list_fragments.popitem(last=False)
+    return fragment
+
+def render_product_page(chat_id, page):
+    """Return (text, keyboard) for one /listele page, or (None, None) if the chat has no products."""
+    total, products = get_products_page(chat_id, page * LIST_PAGE_SIZE, LIST_PAGE_SIZE)
+    if not total:
+        return None, None
+    
+    page_count = (total + LIST_PAGE_SIZE - 1) // LIST_PAGE_SIZE
+    if page >= page_count:
+        # The list shrank since the keyboard was sent; show the last page instead
+        page = page_count - 1
+        total, products = get_products_page(chat_id, page * LIST_PAGE_SIZE, LIST_PAGE_SIZE)
+    
+    text = f'Takip Edilen Ürünler ({total}):\n\n' + ''.join(
+        render_product_fragment(chat_id, url, product_info) for url, product_info in products
+    )
+    
+    if page_count == 1:
+        return text, None
+    
+    buttons = []
+    if page > 0:
+        buttons.append(InlineKeyboardButton('◀️ Önceki', callback_data=f'liste:{page - 1}'))
+    buttons.append(InlineKeyboardButton(f'{page + 1}/{page_count}', callback_data=f'liste:{page}'))
+    if page < page_count - 1:
+        buttons.append(InlineKeyboardButton('Sonraki ▶️', callback_data=f'liste:{page + 1}'))
+    return text, InlineKeyboardMarkup([buttons])
+
 def list_products(update: Update, context: CallbackContext):
-    """List all tracked products."""
+    """List tracked products, one page at a time."""
     chat_id = update.effective_chat.id
     
     # Check if the chat is allowed
@@ -206,183 +455,639 @@ def list_products(update: Update, context: CallbackContext):
         logger.info(f"Unauthorized list_products command from chat_id: {chat_id}")
         return
     
-    # Get all products for this chat
-    products = get_all_products(chat_id)
+    text, keyboard = render_product_page(chat_id, 0)
     
-    if not products:
+    if text is None:
         update.message.reply_text('Henüz takip edilen ürün bulunmamaktadır.')
         return
     
-    # Prepare the message text
-    message = 'Takip Edilen Ürünler:\n\n'
+    update.message.reply_text(text, parse_mode=ParseMode.HTML, disable_web_page_preview=True,
+                              reply_markup=keyboard)
+
+def parse_price(text):
+    """Parse a price like '1299', '1299.90', '1.299', '1.299,90' or '1299,90 TL'; None if invalid.
+
+    Dots are thousands separators when the price also has a decimal comma, or when
+    every dot is followed by exactly three digits ('1.299' is 1299 TL, not 1.30).
+    """
+    text = text.upper().replace('TL', '').replace('₺', '').strip()
+    if ',' in text:
+        text = text.replace('.', '').replace(',', '.')
+    elif re.fullmatch(r'[1-9]\d{0,2}(\.\d{3})+', text):
+        text = text.replace('.', '')
+    try:
+        price = float(text)
+    except ValueError:
+        return None
+    return price if price > 0 else None
+
+def target_note(product_info, old_price, new_price):
+    """Notification line for target prices reached by a price change, or ''."""
+    crossed = crossed_target_prices(product_info, old_price, new_price)
+    if not crossed:
+        return ''
+    targets = ', '.join(f'{target:.2f}' for target in crossed)
+    return f'🎯 <b>Hedef fiyata ulaşıldı:</b> {targets} TL\n'
+
+def target_price_handler(update: Update, context: CallbackContext):
+    """Add or clear target prices for a tracked product."""
+    chat_id = update.effective_chat.id
     
-    for url, product_info in products.items():
-        product_name = product_info.get('product_name', 'İsimsiz Ürün')
-        current_price = product_info.get('current_price', 0)
-        initial_price = product_info.get('initial_price', 0)
-        
-        # Check if product is sold out (price is 0)
-        if current_price == 0:
-            message += (
-                f'🔹 <b>{product_name}</b>\n'
-                f'   <b>Tükendi</b>\n'
-                f'   <a href="{url}">Link</a>\n\n'
-            )
+    # Check if the chat is allowed
+    if not is_allowed_chat(chat_id):
+        logger.info(f"Unauthorized target price command from chat_id: {chat_id}")
+        return
+    
+    url = extract_url(' '.join(context.args)) if context.args else None
+    if not url or len(context.args) < 2:
+        update.message.reply_text('Kullanım: /hedef [Trendyol linki] [fiyat]\n'
+                                  'Örnek: /hedef https://www.trendyol.com/... 1299,90\n'
+                                  'Hedefleri silmek için: /hedef [Trendyol linki] sil')
+        return
+    
+    # Match the link to the chat's tracked entry for the same product
+    url, product_id = resolve_product_url(url)
+    stored_url = find_product(chat_id, product_id) if product_id else None
+    if not stored_url:
+        update.message.reply_text('Bu ürün takip edilmiyor. Önce /ekle ile ekleyin.')
+        return
+    
+    if context.args[-1].lower() == 'sil':
+        clear_target_prices(chat_id, stored_url)
+        update.message.reply_text('Ürünün hedef fiyatları silindi.')
+        return
+    
+    target_price = parse_price(context.args[-1])
+    if target_price is None:
+        update.message.reply_text('Geçerli bir fiyat girin. Örnek: 1299,90')
+        return
+    
+    if not add_target_price(chat_id, stored_url, target_price):
+        update.message.reply_text('Hedef fiyat kaydedilirken bir hata oluştu. Lütfen daha sonra tekrar deneyin.')
+        return
+    
+    targets = get_all_products(chat_id)[stored_url].get('target_prices', [])
+    update.message.reply_text(
+        f'🎯 Hedef fiyat eklendi: {target_price:.2f} TL\n'
+        f'Bu ürünün hedefleri: {", ".join(f"{target:.2f}" for target in targets)} TL\n\n'
+        f'Fiyat hedefinize düştüğünde bildirim göndereceğim.'
+    )
+
+def variant_handler(update: Update, context: CallbackContext):
+    """List a product's variants (sizes), or track the chosen ones from a single page fetch."""
+    chat_id = update.effective_chat.id
+    
+    # Check if the chat is allowed
+    if not is_allowed_chat(chat_id):
+        logger.info(f"Unauthorized variant command from chat_id: {chat_id}")
+        return
+    
+    url = extract_url(' '.join(context.args)) if context.args else None
+    if not url or not is_valid_trendyol_url(url):
+        update.message.reply_text('Kullanım: /varyant [Trendyol linki] [beden ...]\n'
+                                  'Örnek: /varyant https://www.trendyol.com/... M L\n'
+                                  'Beden yazmazsanız ürünün seçenekleri listelenir.')
+        return
+    choices = [arg for arg in context.args if not URL_PATTERN.match(arg)]
+    
+    page_url = split_variant(resolve_product_url(url)[0])[0]
+    message = update.message.reply_text('Ürün bilgileri alınıyor...')
+    page = scrape_product_page(page_url, with_variants=True)
+    product_name, _, error, variants = page
+    if error and error != "Tükendi":
+        message.edit_text(f'Hata: {error}')
+        return
+    if not variants:
+        message.edit_text('Bu ürünün beden seçenekleri bulunamadı. Ürünün tamamını /ekle ile takip edebilirsiniz.')
+        return
+    # Pages without a readable name are shown by their link
+    title = product_name or page_url
+    
+    if not choices:
+        lines = [f'{title}\n', 'Seçenekler:']
+        lines.extend(
+            f'• {value}: {price:.2f} TL' if in_stock and price else f'• {value}: {"Stokta" if in_stock else "Tükendi"}'
+            for value, (price, in_stock) in variants.items()
+        )
+        lines.append(f'\nTakip için: /varyant {page_url} {next(iter(variants))}')
+        message.edit_text('\n'.join(lines))
+        return
+    
+    by_folded = {value.casefold(): value for value in variants}
+    to_add, added, duplicates, missing = [], [], [], []
+    for choice in dict.fromkeys(choices):
+        value = by_folded.get(choice.casefold())
+        if value is None:
+            missing.append(choice)
+            continue
+        canonical_url, product_id = resolve_product_url(variant_url(page_url, value))
+        if find_product(chat_id, product_id):
+            duplicates.append(value)
             continue
+        name, price, _ = variant_result(page, value)
+        # Sold-out variants are tracked with price 0, like whole products
+        to_add.append((canonical_url, name, price or 0, product_id))
+        added.append(f'• {value}: {price:.2f} TL' if price else f'• {value}: Tükendi')
+    
+    if to_add and not add_products(chat_id, to_add):
+        message.edit_text('Ürün eklenirken bir hata oluştu. Lütfen daha sonra tekrar deneyin.')
+        return
+    forget_list_fragments(chat_id)
+    
+    lines = [title]
+    if added:
+        lines.append('\nTakibe eklenen bedenler:')
+        lines.extend(added)
+    if duplicates:
+        lines.append(f'\nZaten takip edilen: {", ".join(duplicates)}')
+    if missing:
+        lines.append(f'\nBulunamayan: {", ".join(missing)} (seçenekler: {", ".join(variants)})')
+    message.edit_text('\n'.join(lines))
+
+def search_products_handler(update: Update, context: CallbackContext):
+    """Search tracked products by name."""
+    chat_id = update.effective_chat.id
+    
+    # Check if the chat is allowed
+    if not is_allowed_chat(chat_id):
+        logger.info(f"Unauthorized search command from chat_id: {chat_id}")
+        return
+    
+    query = ' '.join(context.args)
+    if not query:
+        update.message.reply_text('Lütfen aramak istediğiniz kelimeyi yazın.\n'
+                                  'Örnek: /ara kulaklık')
+        return
+    
+    results = search_products(chat_id, query, limit=LIST_PAGE_SIZE)
+    
+    if not results:
+        update.message.reply_text(f'"{query}" ile eşleşen ürün bulunamadı.')
+        return
+    
+    text = f'🔍 "{html.escape(query)}" için sonuçlar:\n\n' + ''.join(
+        render_product_fragment(chat_id, url, product_info) for url, product_info in results
+    )
+    update.message.reply_text(text, parse_mode=ParseMode.HTML, disable_web_page_preview=True)
+
+def export_handler(update: Update, context: CallbackContext):
+    """Send the chat's tracked products or price history as a CSV or JSON Lines file."""
+    chat_id = update.effective_chat.id
+    
+    # Check if the chat is allowed
+    if not is_allowed_chat(chat_id):
+        logger.info(f"Unauthorized export command from chat_id: {chat_id}")
+        return
+    
+    options = {arg.lower() for arg in context.args}
+    fmt = 'jsonl' if options & {'jsonl', 'json'} else 'csv'
+    kind = 'history' if options & {'gecmis', 'geçmiş'} else 'products'
+    if kind == 'history' and not PRICE_HISTORY_FILE:
+        update.message.reply_text('Fiyat geçmişi kaydı kapalı (PRICE_HISTORY_FILE ayarlanmamış).')
+        return
+    
+    counter, chunks = export(kind, fmt, chat_id)
+    gzipped, data = compress_if_large(chunks, EXPORT_GZIP_BYTES)
+    
+    # Spooled to disk chunk by chunk rather than built in memory
+    with tempfile.TemporaryFile() as f:
+        for chunk in data:
+            f.write(chunk)
         
-        price_diff = current_price - initial_price
-        if price_diff > 0:
-            price_trend = f'📈 +{price_diff:.2f} TL'
-        elif price_diff < 0:
-            price_trend = f'📉 {price_diff:.2f} TL'
-        else:
-            price_trend = '➡️ Değişim yok'
+        if not counter.count:
+            update.message.reply_text('Henüz takip edilen ürün bulunmamaktadır.' if kind == 'products'
+                                      else 'Kayıtlı fiyat geçmişi bulunmamaktadır.')
+            return
         
-        message += (
-            f'🔹 <b>{product_name}</b>\n'
-            f'   Güncel Fiyat: <b>{current_price:.2f} TL</b> {price_trend}\n'
-            f'   <a href="{url}">Link</a>\n\n'
-        )
+        f.seek(0)
+        name = 'urunler' if kind == 'products' else 'fiyat_gecmisi'
+        filename = f"{name}_{datetime.now().strftime('%Y%m%d_%H%M')}.{fmt}{'.gz' if gzipped else ''}"
+        caption = f'📦 {counter.count} ürün' if kind == 'products' else f'📈 {counter.count} fiyat kaydı'
+        try:
+            context.bot.send_document(chat_id=chat_id, document=f, filename=filename,
+                                      caption=f'{caption} dışa aktarıldı.')
+        except Exception as e:
+            logger.error(f"Failed to send export to {chat_id}: {e}")
+            update.message.reply_text('Dışa aktarma dosyası gönderilemedi. Lütfen tekrar deneyin.')
+            return
+    
+    logger.info(f"Exported {counter.count} {kind} rows as {filename} to {chat_id}")
+
+def list_page_callback(update: Update, context: CallbackContext):
+    """Show another /listele page when a navigation button is pressed."""
+    query = update.callback_query
+    chat_id = update.effective_chat.id
+    
+    if not is_allowed_chat(chat_id):
+        query.answer()
+        return
+    
+    text, keyboard = render_product_page(chat_id, int(context.match.group(1)))
+    query.answer()
+    
+    if text is None:
+        query.edit_message_text('Henüz takip edilen ürün bulunmamaktadır.')
+        return
     
-    update.message.reply_text(message, parse_mode=ParseMode.HTML, disable_web_page_preview=True)
+    try:
+        query.edit_message_text(text, parse_mode=ParseMode.HTML, disable_web_page_preview=True,
+                                reply_markup=keyboard)
+    except BadRequest as e:
+        # Pressing the current page button re-renders identical content
+        if 'not modified' not in str(e):
+            raise
 
 # Global variable to store bot instance
 _bot_instance = None
 
-def check_prices():
+def _record_check(chat_id, url):
+    """Remember when a product was checked and when it is next due."""
+    now = time.time()
+    _chat_cap.record(chat_id, now)
+    record_check(chat_id, url, now, CHECK_INTERVAL * 60, SOLD_OUT_MAX_INTERVAL * 60)
+
+def _save_checkpoint():
+    """Persist the per-product check state."""
+    return save_check_state()
+
+class CyclePages:
+    """Product pages checked for several subscriptions in one pass, fetched once.
+
+    Variants of one product, or one product tracked in several chats, share a page;
+    its result is kept until the last of those subscriptions has been checked.
+    """
+
+    def __init__(self, urls):
+        counts = {}
+        variant_pages = set()
+        for url in urls:
+            page_url, variant = split_variant(url)
+            counts[page_url] = counts.get(page_url, 0) + 1
+            if variant:
+                variant_pages.add(page_url)
+        self._remaining = {page_url: count for page_url, count in counts.items() if count > 1}
+        self._with_variants = {page_url for page_url in variant_pages if page_url in self._remaining}
+        self._results = {}
+        self.reused = 0
+
+    def _checked(self, page_url):
+        self._remaining[page_url] -= 1
+        if not self._remaining[page_url]:
+            del self._remaining[page_url]
+            self._results.pop(page_url, None)
+
+    def check(self, url, scrape_page):
+        """(name, price, error) of a subscription, using scrape_page(page_url, with_variants) once per page."""
+        page_url, variant = split_variant(url)
+        if page_url not in self._remaining:
+            result = scrape_page(page_url, bool(variant))
+        else:
+            result = self._results.get(page_url)
+            if result is None:
+                result = self._results[page_url] = scrape_page(page_url, page_url in self._with_variants)
+            else:
+                self.reused += 1
+            self._checked(page_url)
+        return variant_result(result, variant) if variant else result[:3]
+
+    async def check_async(self, url, scrape_page):
+        """check with a coroutine scrape_page; concurrent checks of a page await one fetch."""
+        page_url, variant = split_variant(url)
+        if page_url not in self._remaining:
+            result = await scrape_page(page_url, bool(variant))
+        else:
+            task = self._results.get(page_url)
+            if task is None:
+                task = self._results[page_url] = asyncio.ensure_future(
+                    scrape_page(page_url, page_url in self._with_variants)
+                )
+            else:
+                self.reused += 1
+            self._checked(page_url)
+            result = await task
+        return variant_result(result, variant) if variant else result[:3]
+
+def _build_check_queue(due_only):
+    """Order products for a cycle from the checkpointed state; returns (count, iterator, CyclePages).
+
+    A regular cycle checks everything except products checked less than half an
+    interval ago (typically by the post-restart resume pass) and sold-out products
+    whose backed-off check is not due yet. With due_only, only
+    overdue products are returned. Within a chat the least recently checked (or most
+    overdue) products come first; chats are interleaved by weighted fair queuing and
+    limited to their CHAT_CHECK_CAP allowance, so a large group cannot starve others.
+    """
+    now = time.time()
+    per_chat = {}
+    
+    for chat_id, url, record in iter_products():
+        if due_only:
+            if record.next_due > now:
+                continue
+            per_chat.setdefault(chat_id, []).append((record.next_due, url, record))
+        else:
+            if now - record.last_checked < CHECK_INTERVAL * 60 / 2:
+                continue
+            if record.sold_out_checks and record.next_due > now:
+                continue
+            per_chat.setdefault(chat_id, []).append((record.last_checked, url, record))
+    
+    count = 0
+    for chat_id, items in per_chat.items():
+        items.sort(key=lambda item: item[0])
+        allowance = _chat_cap.allowance(chat_id, now)
+        if allowance is not None and allowance < len(items):
+            logger.info(f"Chat {chat_id} is capped at {allowance} of {len(items)} due products this cycle")
+            del items[allowance:]
+        count += len(items)
+    
+    pages = CyclePages(url for items in per_chat.values() for _, url, _ in items)
+    queue = ((chat_id, url, record) for chat_id, (_, url, record) in fair_order(per_chat, CHAT_WEIGHTS))
+    return count, queue, pages
+
+def report_staleness():
+    """Log how long ago each chat's products were checked, stalest chats first."""
+    now = time.time()
+    per_chat = {}
+    
+    for chat_id, url, record in iter_products():
+        age = now - (record.last_checked or _started_at)
+        max_age, total_age, count = per_chat.get(chat_id, (0, 0, 0))
+        per_chat[chat_id] = (max(max_age, age), total_age + age, count + 1)
+    
+    if not per_chat:
+        return []
+    
+    staleness = sorted(
+        ((max_age, total_age / count, chat_id, count) for chat_id, (max_age, total_age, count) in per_chat.items()),
+        reverse=True
+    )
+    summary = ', '.join(
+        f"{chat_id} ({count} products) max {max_age / 60:.1f}m, mean {mean_age / 60:.1f}m"
+        for max_age, mean_age, chat_id, count in staleness[:5]
+    )
+    logger.info(f"Staleness per chat (stalest first): {summary}")
+    return staleness
+
+def _probe_first(url, product_info):
+    """True for a sold-out product worth a stock probe; variants need the product state instead."""
+    return STOCK_PROBE and product_info['current_price'] == 0 and not split_variant(url)[1]
+
+def fetch_product_state(url, product_info, pages):
+    """Scrape a product; a sold-out one gets a cheap stock probe first and is only scraped once back in stock."""
+    if _probe_first(url, product_info) and probe_stock(url) is False:
+        return None, 0, "Tükendi"
+    return pages.check(url, scrape_product_page)
+
+async def fetch_product_state_async(fetcher, url, product_info, pages):
+    """fetch_product_state for the asyncio runtime."""
+    if _probe_first(url, product_info) and await fetcher.probe_stock(url) is False:
+        return None, 0, "Tükendi"
+    return await pages.check_async(url, fetcher.scrape_product_page)
+
+def check_prices(due_only=False):
     """Check prices for all tracked products and notify if there's a change."""
     global _bot_instance
     
     if not _bot_instance:
         logger.error("Bot instance not available for price checking")
         return
-        
-    data = get_all_products()
     
-    if not data:
+    if not is_leader():
+        logger.warning("Leader lease not held, skipping price check")
+        return
+        
+    if not product_count():
         logger.info("No products to check")
         return
     
+    total, queue, pages = _build_check_queue(due_only)
+    if not total:
+        return
+    
+    # Start a fresh bandwidth tally for this cycle
+    get_stream_stats(reset=True)
+    get_probe_stats(reset=True)
+    
+    # Prices of every product on the configured listing pages, fetched in a few requests
+    listing_prices = scrape_listings() if LISTING_URLS else {}
+    listed_count = 0
+    
     error_count = 0
+    checked_count = 0
+    _heartbeat.cycle_started(total)
     
-    for chat_id, products in data.items():
-        for url, product_info in list(products.items()):
-            try:
-                product_name = product_info['product_name']
-                current_price = product_info['current_price']
-                
-                logger.info(f"Checking price for {product_name} at {url}")
+    for chat_id, url, product_info in queue:
+        if _shutdown_event.is_set():
+            logger.info("Shutdown requested, stopping price check cycle")
+            break
+        
+        checked_count += 1
+        _heartbeat.cycle_progress(checked_count)
+        try:
+            listed = listing_prices.get(product_info.get('product_id'))
+            if listed:
+                # Price and stock from a listing card; names there are formatted differently
+                listed_count += 1
+                new_price, in_stock = listed
+                new_name, error = None, None if in_stock else "Tükendi"
+            else:
+                logger.info(f"Checking price for {product_info['product_name']} at {url}")
                 
                 # Fetch new product info
-                _, new_price, error = scrape_product_info(url)
-                
-                # Handle sold-out products specially
-                if error == "Tükendi":
-                    # Product is sold out
-                    if current_price != 0:  # Only update if not already marked as sold out
-                        update_product_price(chat_id, url, 0)
-                        
-                        # Send sold-out notification
-                        notification_text = (
-                            f'🚫 <b>Ürün Tükendi!</b>\n\n'
-                            f'<b>{product_name}</b>\n'
-                            f'Eski Fiyat: <b>{current_price:.2f} TL</b>\n'
-                            f'Durum: <b>Stoklar Tükendi</b>\n\n'
-                            f'Ürün tekrar stokta olduğunda bildirim göndereceğim.\n\n'
-                            f'<a href="{url}">Ürüne Git</a>'
-                        )
-                        
-                        try:
-                            _bot_instance.send_message(
-                                chat_id=int(chat_id),
-                                text=notification_text,
-                                parse_mode=ParseMode.HTML,
-                                disable_web_page_preview=True
-                            )
-                            logger.info(f"Sold-out notification sent to {chat_id}")
-                        except Exception as send_error:
-                            logger.error(f"Failed to send sold-out notification to {chat_id}: {send_error}")
-                            error_count += 1
-                    else:
-                        logger.info(f"Product {product_name} is still sold out")
-                    continue
-                
-                if error:
-                    logger.error(f"Error checking {url}: {error}")
-                    error_count += 1
-                    continue
-                
-                # Handle case where product was sold out but now has a price (back in stock)
-                if current_price == 0 and new_price and new_price > 0:
-                    # Product is back in stock!
-                    update_product_price(chat_id, url, new_price)
-                    
-                    notification_text = (
-                        f'🟢 <b>Ürün Tekrar Stokta!</b>\n\n'
-                        f'<b>{product_name}</b>\n'
-                        f'Yeni Fiyat: <b>{new_price:.2f} TL</b>\n\n'
-                        f'<a href="{url}">Ürüne Git</a>'
-                    )
-                    
-                    try:
-                        _bot_instance.send_message(
-                            chat_id=int(chat_id),
-                            text=notification_text,
-                            parse_mode=ParseMode.HTML,
-                            disable_web_page_preview=True
-                        )
-                        logger.info(f"Back-in-stock notification sent to {chat_id}")
-                    except Exception as send_error:
-                        logger.error(f"Failed to send back-in-stock notification to {chat_id}: {send_error}")
-                        error_count += 1
-                    continue
-                
-                if new_price is None:
-                    logger.error(f"Could not get price for {url}")
-                    error_count += 1
-                    continue
-                
-                # If the price has changed
-                if abs(new_price - current_price) > 0.01:  # Allow for small decimal differences
-                    # Update the price in the database
-                    update_product_price(chat_id, url, new_price)
-                    
-                    # Prepare and send notification
-                    price_diff = new_price - current_price
-                    if price_diff > 0:
-                        trend_emoji = "📈 Fiyat Yükseldi"
-                        trend_color = "🔴"
-                    else:
-                        trend_emoji = "📉 Fiyat Düştü"
-                        trend_color = "🟢"
-                    
-                    notification_text = (
-                        f'{trend_color} <b>{trend_emoji}!</b>\n\n'
-                        f'<b>{product_name}</b>\n'
-                        f'Eski Fiyat: <b>{current_price:.2f} TL</b>\n'
-                        f'Yeni Fiyat: <b>{new_price:.2f} TL</b>\n'
-                        f'Fark: <b>{price_diff:+.2f} TL (%{(price_diff/current_price*100):+.1f})</b>\n\n'
-                        f'<a href="{url}">Ürüne Git</a>'
-                    )
-                    
-                    # Send notification
-                    try:
-                        _bot_instance.send_message(
-                            chat_id=int(chat_id),
-                            text=notification_text,
-                            parse_mode=ParseMode.HTML,
-                            disable_web_page_preview=True
-                        )
-                        logger.info(f"Price change notification sent to {chat_id}")
-                    except Exception as send_error:
-                        logger.error(f"Failed to send notification to {chat_id}: {send_error}")
-                        error_count += 1
-                else:
-                    logger.info(f"No price change for {product_name}")
+                new_name, new_price, error = fetch_product_state(url, product_info, pages)
+            error_count += handle_check_result(chat_id, url, product_info, new_name, new_price, error)
+        except Exception as e:
+            logger.error(f"Error checking price for {url}: {e}")
+            error_count += 1
+        finally:
+            _record_check(chat_id, url)
+            if checked_count % CHECKPOINT_EVERY == 0:
+                _save_checkpoint()
+    
+    finish_check_cycle(checked_count, listed_count, error_count, pages.reused)
+
+def handle_check_result(chat_id, url, product_info, new_name, new_price, error):
+    """Store a product's check result and send any notification; returns 1 on error, else 0.
+    
+    Once this instance has lost the leader lease, results are dropped and nothing is
+    sent: the new leader checks the product and notifies instead.
+    """
+    if not is_leader():
+        logger.warning(f"Leader lease lost, dropping check result for {url}")
+        return 0
+    
+    product_name = product_info['product_name']
+    current_price = product_info['current_price']
+    
+    if new_name and new_name != product_name:
+        update_product_name(chat_id, url, new_name)
+        product_name = new_name
+    
+    # Handle sold-out products specially
+    if error == "Tükendi":
+        # Product is sold out
+        if current_price != 0:  # Only update if not already marked as sold out
+            update_product_price(chat_id, url, 0)
             
-            except Exception as e:
-                logger.error(f"Error checking price for {url}: {e}")
-                error_count += 1
+            # Send sold-out notification
+            notification_text = (
+                f'🚫 <b>Ürün Tükendi!</b>\n\n'
+                f'<b>{product_name}</b>\n'
+                f'Eski Fiyat: <b>{current_price:.2f} TL</b>\n'
+                f'Durum: <b>Stoklar Tükendi</b>\n\n'
+                f'Ürün tekrar stokta olduğunda bildirim göndereceğim.\n\n'
+                f'<a href="{url}">Ürüne Git</a>'
+            )
+            
+            if not is_leader():
+                logger.warning(f"Leader lease lost, not notifying {chat_id}")
+                return 0
+            try:
+                _bot_instance.send_message(
+                    chat_id=int(chat_id),
+                    text=notification_text,
+                    parse_mode=ParseMode.HTML,
+                    disable_web_page_preview=True
+                )
+                logger.info(f"Sold-out notification sent to {chat_id}")
+            except Exception as send_error:
+                logger.error(f"Failed to send sold-out notification to {chat_id}: {send_error}")
+                return 1
+        else:
+            logger.info(f"Product still sold out: {product_name}")
+        return 0
+    
+    if error:
+        logger.error(f"Error checking {url}: {error}")
+        return 1
+    
+    # Handle case where product was sold out but now has a price (back in stock)
+    if current_price == 0 and new_price and new_price > 0:
+        # Product is back in stock!
+        update_product_price(chat_id, url, new_price)
+        
+        notification_text = (
+            f'🟢 <b>Ürün Tekrar Stokta!</b>\n\n'
+            f'<b>{product_name}</b>\n'
+            f'Yeni Fiyat: <b>{new_price:.2f} TL</b>\n'
+            f'{target_note(product_info, current_price, new_price)}\n'
+            f'<a href="{url}">Ürüne Git</a>'
+        )
+        
+        if not is_leader():
+            logger.warning(f"Leader lease lost, not notifying {chat_id}")
+            return 0
+        try:
+            _bot_instance.send_message(
+                chat_id=int(chat_id),
+                text=notification_text,
+                parse_mode=ParseMode.HTML,
+                disable_web_page_preview=True
+            )
+            logger.info(f"Back-in-stock notification sent to {chat_id}")
+        except Exception as send_error:
+            logger.error(f"Failed to send back-in-stock notification to {chat_id}: {send_error}")
+            return 1
+        return 0
+    
+    if new_price is None:
+        logger.error(f"Could not get price for {url}")
+        return 1
+    
+    # If the price has changed
+    if abs(new_price - current_price) > 0.01:  # Allow for small decimal differences
+        # Update the price in the database
+        update_product_price(chat_id, url, new_price)
+        
+        # Prepare and send notification
+        price_diff = new_price - current_price
+        if price_diff > 0:
+            trend_emoji = "📈 Fiyat Yükseldi"
+            trend_color = "🔴"
+        else:
+            trend_emoji = "📉 Fiyat Düştü"
+            trend_color = "🟢"
+        
+        notification_text = (
+            f'{trend_color} <b>{trend_emoji}!</b>\n\n'
+            f'<b>{product_name}</b>\n'
+            f'Eski Fiyat: <b>{current_price:.2f} TL</b>\n'
+            f'Yeni Fiyat: <b>{new_price:.2f} TL</b>\n'
+            f'Fark: <b>{price_diff:+.2f} TL (%{(price_diff/current_price*100):+.1f})</b>\n'
+            f'{target_note(product_info, current_price, new_price)}\n'
+            f'<a href="{url}">Ürüne Git</a>'
+        )
+        
+        # Send notification
+        if not is_leader():
+            logger.warning(f"Leader lease lost, not notifying {chat_id}")
+            return 0
+        try:
+            _bot_instance.send_message(
+                chat_id=int(chat_id),
+                text=notification_text,
+                parse_mode=ParseMode.HTML,
+                disable_web_page_preview=True
+            )
+            logger.info(f"Price change notification sent to {chat_id}")
+        except Exception as send_error:
+            logger.error(f"Failed to send notification to {chat_id}: {send_error}")
+            return 1
+    else:
+        logger.info(f"No price change for {product_name}")
+    
+    return 0
+
+def finish_check_cycle(checked_count, listed_count, error_count, reused_count=0):
+    """Checkpoint and report after a check cycle."""
+    _save_checkpoint()
+    _heartbeat.cycle_finished()
+    
+    report_staleness()
+    
+    if LISTING_URLS:
+        logger.info(f"Listing prices used for {listed_count} of {checked_count} products this cycle")
+    
+    if reused_count:
+        logger.info(f"Shared pages answered {reused_count} of {checked_count} checks without another request")
+    
+    for template, groups in get_strategy_stats().items():
+        summary = '; '.join(
+            f"{group}: " + ', '.join(
+                f"{stat['name']} {stat['hit_rate']:.0%}/{stat['avg_ms']:.1f}ms"
+                for stat in stats
+            )
+            for group, stats in groups.items()
+        )
+        logger.info(f"Extraction strategies on {template}: {summary}")
+    
+    if STREAM_FETCH:
+        stats = get_stream_stats(reset=True)
+        logger.info(
+            f"Streaming fetch: {stats['pages']} pages, {stats['early_closed']} closed early, "
+            f"{stats['bytes_read'] / 1024:.1f} KB read this cycle, {stats['bytes_saved'] / 1024:.1f} KB saved "
+            f"on the {stats['measured']} early-closed pages with a known length"
+        )
+    
+    stats = get_probe_stats(reset=True)
+    if stats['probes']:
+        logger.info(
+            f"Stock probes: {stats['probes']} sold-out products, {stats['in_stock']} back in stock, "
+            f"{stats['inconclusive']} fell back to a full check, {stats['bytes_read'] / 1024:.1f} KB read"
+        )
+    
+    if EGRESS_PROXIES:
+        summary = ', '.join(
+            f"{row['endpoint']} {row['score']:.1f} ({row['latency_ms']}ms, {row['error_rate']:.0%} err, "
+            f"{row['blocks']} blocks{', cooling' if row['cooling'] else ''})"
+            for row in get_egress().stats()
+        )
+        logger.info(f"Egress health: {summary}")
+    
+    stats = get_shadow_stats()
+    if stats and stats['compared']:
+        logger.info(f"{shadow_summary(stats)} since start")
     
     # Send admin notification if there are too many errors
     if error_count > 5 and ADMIN_CHAT_ID:
@@ -396,11 +1101,285 @@ def check_prices():
         """
         send_admin_notification(admin_message)
 
+async def check_prices_async(fetcher, due_only=False):
+    """check_prices for the asyncio runtime; up to fetcher.max_inflight pages are fetched at once."""
+    if not _bot_instance:
+        logger.error("Bot instance not available for price checking")
+        return
+    
+    if not is_leader():
+        logger.warning("Leader lease not held, skipping price check")
+        return
+    
+    if not product_count():
+        logger.info("No products to check")
+        return
+    
+    total, queue, pages = _build_check_queue(due_only)
+    if not total:
+        return
+    
+    loop = asyncio.get_running_loop()
+    get_stream_stats(reset=True)
+    get_probe_stats(reset=True)
+    listing_prices = await loop.run_in_executor(None, scrape_listings) if LISTING_URLS else {}
+    counts = {'checked': 0, 'listed': 0, 'errors': 0}
+    _heartbeat.cycle_started(total)
+    
+    # Workers share one iterator, so products still start in fair-queue order
+    async def worker():
+        for chat_id, url, product_info in queue:
+            if _shutdown_event.is_set():
+                break
+            
+            counts['checked'] += 1
+            _heartbeat.cycle_progress(counts['checked'])
+            try:
+                listed = listing_prices.get(product_info.get('product_id'))
+                if listed:
+                    counts['listed'] += 1
+                    new_price, in_stock = listed
+                    new_name, error = None, None if in_stock else "Tükendi"
+                else:
+                    logger.info(f"Checking price for {product_info['product_name']} at {url}")
+                    new_name, new_price, error = await fetch_product_state_async(fetcher, url, product_info, pages)
+                # Store writes and notifications block, so they run off the loop
+                counts['errors'] += await loop.run_in_executor(
+                    None, handle_check_result, chat_id, url, product_info, new_name, new_price, error
+                )
+            except Exception as e:
+                logger.error(f"Error checking price for {url}: {e}")
+                counts['errors'] += 1
+            finally:
+                _record_check(chat_id, url)
+                if counts['checked'] % CHECKPOINT_EVERY == 0:
+                    await loop.run_in_executor(None, _save_checkpoint)
+    
+    await asyncio.gather(*(worker() for _ in range(min(fetcher.max_inflight, total))))
+    if _shutdown_event.is_set():
+        logger.info("Shutdown requested, stopping price check cycle")
+    
+    await loop.run_in_executor(
+        None, finish_check_cycle, counts['checked'], counts['listed'], counts['errors'], pages.reused
+    )
+
+def _resume_pending():
+    """True while some product has not been checked since the bot started."""
+    return any(record.last_checked < _started_at for _, _, record in iter_products())
+
+def resume_overdue_checks():
+    """Check products that became due while the bot was down, until all are caught up."""
+    check_prices(due_only=True)
+    
+    if not _resume_pending():
+        logger.info("Resumed checks caught up with the checkpoint")
+        return schedule.CancelJob
+
+async def resume_overdue_checks_async(fetcher):
+    """resume_overdue_checks for the asyncio runtime; returns False once caught up.
+    
+    The first run loads the store and ends the job if there is no checkpoint.
+    """
+    if not _store_ready.is_set():
+        if not await asyncio.get_running_loop().run_in_executor(None, warm_up_store):
+            return False
+    
+    await check_prices_async(fetcher, due_only=True)
+    
+    if not _resume_pending():
+        logger.info("Resumed checks caught up with the checkpoint")
+        return False
+
+def warm_up_store():
+    """Load the store and check state off the startup path; True if a checkpoint should be resumed."""
+    started = time.monotonic()
+    try:
+        # Re-key products saved under raw pasted URLs by canonical product ID
+        migrate_product_keys(resolve=get_full_url)
+        resume = bool(load_check_state())
+    except Exception as e:
+        logger.error(f"Error loading the store: {e}")
+        resume = False
+    finally:
+        _store_ready.set()
+    
+    logger.info(f"Loaded {product_count()} products in {time.monotonic() - started:.2f}s")
+    if resume:
+        logger.info("Check state checkpoint found, resuming overdue products")
+    return resume
+
 def run_scheduler():
-    """Run the scheduler in a separate thread."""
-    while True:
+    """Run the scheduler in a separate thread, after loading the store."""
+    # Warm restart: resume from the checkpoint, overdue products first
+    if warm_up_store():
+        resume_job = schedule.every(1).minutes.do(resume_overdue_checks)
+        # Run the first resume pass right away instead of after one minute
+        resume_job.next_run = datetime.now()
+    
+    while not _shutdown_event.is_set():
+        _heartbeat.beat('scheduler')
         schedule.run_pending()
-        time.sleep(1)
+        _shutdown_event.wait(1)
+
+def run_async_runtime(updater):
+    """Run update polling, the check scheduler and page fetches on one asyncio event loop."""
+    from async_runtime import AsyncFetcher, run
+    
+    if UPDATE_MODE == 'webhook':
+        logger.warning("The asyncio runtime polls for updates, ignoring UPDATE_MODE=webhook")
+    
+    fetcher = AsyncFetcher()
+    jobs = [
+        (functools.partial(check_prices_async, fetcher), CHECK_INTERVAL * 60, None),
+        (async_heartbeat, HEARTBEAT_INTERVAL, 0),
+        # Loads the store, then resumes from the checkpoint, overdue products first
+        (functools.partial(resume_overdue_checks_async, fetcher), 60, 0),
+    ]
+    
+    run(updater, fetcher, jobs, _shutdown_event, SHUTDOWN_DRAIN_TIMEOUT)
+    updater.stop()
+
+def async_heartbeat():
+    """Heartbeat job of the asyncio runtime; also routes a tick through the dispatcher."""
+    _heartbeat.beat('scheduler')
+    _updater.update_queue.put(HEARTBEAT_TICK)
+
+def start_webhook(updater):
+    """Receive updates through the local webhook server; return False to fall back to polling."""
+    global _webhook_server
+    
+    if not WEBHOOK_URL:
+        logger.error("UPDATE_MODE=webhook requires WEBHOOK_URL, falling back to polling")
+        return False
+    
+    if not WEBHOOK_SECRET:
+        logger.warning("WEBHOOK_SECRET is not set, webhook requests will not be authenticated")
+    
+    try:
+        server = WebhookServer(updater.bot, updater.update_queue, WEBHOOK_LISTEN, WEBHOOK_PORT,
+                               WEBHOOK_PATH, WEBHOOK_SECRET)
+    except OSError as e:
+        logger.error(f"Could not start webhook server: {e}, falling back to polling")
+        return False
+    
+    server.start()
+    
+    try:
+        updater.bot.set_webhook(
+            url=WEBHOOK_URL,
+            secret_token=WEBHOOK_SECRET or None,
+            max_connections=DISPATCHER_WORKERS
+        )
+    except Exception as e:
+        logger.error(f"Could not set webhook: {e}, falling back to polling")
+        server.stop()
+        return False
+    
+    # Same threads start_polling would start, minus the polling loop
+    updater.job_queue.start()
+    threading.Thread(target=updater.dispatcher.start, name='dispatcher', daemon=True).start()
+    updater.job_queue.run_repeating(check_webhook_health, interval=WEBHOOK_HEALTH_INTERVAL,
+                                    first=WEBHOOK_HEALTH_INTERVAL)
+    
+    _webhook_server = server
+    return True
+
+def fall_back_to_polling():
+    """Stop the webhook server and switch to long polling."""
+    global _webhook_server
+    
+    if _webhook_server:
+        _webhook_server.stop()
+        _webhook_server = None
+    
+    # start_polling deletes the webhook before its first getUpdates call
+    _updater.start_polling()
+    logger.info("Switched to polling mode")
+
+def check_webhook_health(context: CallbackContext):
+    """Switch to polling if Telegram keeps failing to deliver webhook updates."""
+    try:
+        info = context.bot.get_webhook_info()
+    except Exception as e:
+        logger.error(f"Could not get webhook info: {e}")
+        return
+    
+    if not info.last_error_date or not info.pending_update_count:
+        return
+    
+    error_age = time.time() - info.last_error_date.timestamp()
+    if error_age > 2 * WEBHOOK_HEALTH_INTERVAL:
+        return
+    
+    logger.error(f"Webhook delivery failing ({info.last_error_message}), falling back to polling")
+    context.job.schedule_removal()
+    fall_back_to_polling()
+    send_admin_notification(
+        f"⚠️ <b>Webhook Hatası</b>\n\n"
+        f"<b>Hata:</b> <code>{info.last_error_message}</code>\n"
+        f"<b>Bekleyen güncelleme:</b> {info.pending_update_count}\n\n"
+        f"Bot polling moduna geçti."
+    )
+
+def is_leader():
+    """False once this instance has lost the leader lease; always True without HA."""
+    return not _lease or _lease.held()
+
+def wait_for_leadership():
+    """Stay standby until this instance takes the leader lease; False if shut down first."""
+    standby_for = None
+    while not _shutdown_event.is_set():
+        if _lease.acquire():
+            logger.info(f"Took the leader lease as {_lease.node_id} (term {_lease.term})")
+            if _lease.previous_holder:
+                send_admin_notification(
+                    f"🔁 <b>Lider Değişti</b>\n\n"
+                    f"<b>Zaman:</b> {datetime.now().strftime('%d.%m.%Y %H:%M:%S')}\n"
+                    f"<b>Yeni lider:</b> {_lease.node_id}\n"
+                    f"<b>Önceki lider:</b> {_lease.previous_holder}\n"
+                    f"<b>Dönem:</b> {_lease.term}"
+                )
+            return True
+        
+        if _lease.holder != standby_for:
+            standby_for = _lease.holder
+            logger.info(f"Standby: {standby_for} holds the leader lease")
+        # A standby has no scheduler or dispatcher to beat; it is healthy while it waits
+        _heartbeat.beat('scheduler')
+        _heartbeat.beat('dispatcher')
+        _shutdown_event.wait(RETRY_INTERVAL)
+    return False
+
+def keep_leadership():
+    """Renew the leader lease; once it is lost, shut down so the standby alone serves.
+
+    Renewal continues through the shutdown drain, until release_leadership.
+    """
+    while not _lease_done.wait(_lease.ttl / 3):
+        if not _lease.acquire() and not _shutdown_event.is_set():
+            logger.error(f"Lost the leader lease to {_lease.holder}, shutting down")
+            # SIGTERM drains like a normal stop in both runtimes; systemd restarts us as standby
+            os.kill(os.getpid(), signal.SIGTERM)
+            return
+
+def release_leadership():
+    """Stop renewing and hand the lease to the standby; call once the drain is done."""
+    if _lease:
+        _lease_done.set()
+        _lease.release()
+
+def request_shutdown(signum, frame):
+    """Signal handler that starts a graceful shutdown."""
+    logger.info(f"Received signal {signum}, shutting down gracefully...")
+    _shutdown_event.set()
+
+def queue_heartbeat_tick(context: CallbackContext):
+    """Job queue callback that routes a heartbeat tick through the dispatcher."""
+    context.dispatcher.update_queue.put(HEARTBEAT_TICK)
+
+def dispatcher_heartbeat(update: HeartbeatTick, context: CallbackContext):
+    """Record that the dispatcher thread is still processing updates."""
+    _heartbeat.beat('dispatcher')
 
 def send_admin_notification(message):
     """Send notification to admin chat."""
@@ -457,7 +1436,7 @@ def error(update: Update, context: CallbackContext):
 
 def main():
     """Start the bot."""
-    global _bot_instance
+    global _bot_instance, _updater
     
     if not TELEGRAM_BOT_TOKEN:
         logger.error("No token provided. Set TELEGRAM_BOT_TOKEN in .env file.")
@@ -468,47 +1447,108 @@ def main():
         logger.warning("Set ALLOWED_GROUP_IDS with comma-separated group IDs in your .env file.")
     
     # Create the Updater and pass it the bot's token
-    updater = Updater(TELEGRAM_BOT_TOKEN)
+    updater = Updater(TELEGRAM_BOT_TOKEN, base_url=TELEGRAM_API_BASE_URL,
+                      base_file_url=TELEGRAM_API_BASE_FILE_URL, workers=DISPATCHER_WORKERS)
+    _updater = updater
     
     # Store bot instance globally for price checking
     _bot_instance = updater.bot
     
+    # Publish PID and heartbeat for the watchdog
+    _heartbeat.start()
+    
+    # Active/passive: only the lease holder polls Telegram and runs the checks
+    if _lease:
+        for sig in (signal.SIGINT, signal.SIGTERM, signal.SIGABRT):
+            signal.signal(sig, request_shutdown)
+        if not wait_for_leadership():
+            _heartbeat.stop()
+            logger.info("Bot stopped")
+            return
+        threading.Thread(target=keep_leadership, name='leader-lease', daemon=True).start()
+    
     # Get the dispatcher to register handlers
     dispatcher = updater.dispatcher
     
+    # Heartbeat ticks are handled before any other handler group
+    dispatcher.add_handler(TypeHandler(HeartbeatTick, dispatcher_heartbeat), group=-1)
+    updater.job_queue.run_repeating(queue_heartbeat_tick, interval=HEARTBEAT_INTERVAL, first=0)
+    
     # Command handlers
     dispatcher.add_handler(CommandHandler("start", start))
-    dispatcher.add_handler(CommandHandler("ekle", add_product_handler))
+    dispatcher.add_handler(CommandHandler("ekle", add_product_handler, run_async=True))
     dispatcher.add_handler(CommandHandler("sil", remove_product_handler))
     dispatcher.add_handler(CommandHandler("listele", list_products))
-    dispatcher.add_handler(CommandHandler("yenile", refresh_prices_handler))
+    dispatcher.add_handler(CommandHandler("ara", search_products_handler))
+    dispatcher.add_handler(CommandHandler("hedef", target_price_handler, run_async=True))
+    dispatcher.add_handler(CommandHandler("varyant", variant_handler, run_async=True))
+    dispatcher.add_handler(CallbackQueryHandler(list_page_callback, pattern=r'^liste:(\d+)$'))
+    dispatcher.add_handler(CommandHandler("yenile", refresh_prices_handler, run_async=True))
+    dispatcher.add_handler(CommandHandler("disa_aktar", export_handler, run_async=True))
     
     # Message handler for Trendyol links
     dispatcher.add_handler(MessageHandler(
-        Filters.text & ~Filters.command & Filters.regex(r'https?://(www\.)?(trendyol\.com|ty\.gl|tyml\.gl|trendyol-milla\.com)'), 
-        url_handler
+        Filters.text & ~Filters.command & Filters.regex(r'https?://(www\.|m\.)?(trendyol\.com|ty\.gl|tyml\.gl|trendyol-milla\.com)'), 
+        url_handler,
+        run_async=True
+    ))
+    
+    # Link lists uploaded as .txt or .csv files
+    dispatcher.add_handler(MessageHandler(
+        Filters.document.file_extension('txt') | Filters.document.file_extension('csv'),
+        document_handler,
+        run_async=True
     ))
     
     # Error handler
     dispatcher.add_error_handler(error)
     
+    if RUNTIME == 'asyncio':
+        run_async_runtime(updater)
+        _save_checkpoint()
+        release_leadership()
+        _heartbeat.stop()
+        logger.info("Bot stopped")
+        return
+    
     # Clear any existing scheduled jobs to prevent duplicates
     schedule.clear()
     
     # Schedule price checking based on the defined interval
     schedule.every(CHECK_INTERVAL).minutes.do(check_prices)
     
-    # Start the scheduler in a new thread
+    # Start the scheduler in a new thread; it loads the store while polling starts
     scheduler_thread = threading.Thread(target=run_scheduler)
     scheduler_thread.daemon = True
     scheduler_thread.start()
     
     # Start the Bot
-    updater.start_polling()
-    logger.info("Bot started!")
+    if UPDATE_MODE == 'webhook' and start_webhook(updater):
+        logger.info("Bot started in webhook mode!")
+    else:
+        updater.start_polling()
+        logger.info("Bot started!")
     
     # Run the bot until the user presses Ctrl-C or the process receives SIGINT, SIGTERM or SIGABRT
-    updater.idle()
+    for sig in (signal.SIGINT, signal.SIGTERM, signal.SIGABRT):
+        signal.signal(sig, request_shutdown)
+    while not _shutdown_event.wait(1):
+        pass
+    
+    # Drain: let the scheduler finish its in-flight check and notification
+    scheduler_thread.join(timeout=SHUTDOWN_DRAIN_TIMEOUT)
+    if scheduler_thread.is_alive():
+        logger.warning("Scheduler did not finish its in-flight check in time")
+    
+    # Stop receiving updates and wait for running handlers
+    if _webhook_server:
+        _webhook_server.stop()
+    updater.stop()
+    
+    _save_checkpoint()
+    release_leadership()
+    _heartbeat.stop()
+    logger.info("Bot stopped")
 
 def refresh_prices_handler(update: Update, context: CallbackContext):
     """Manual refresh command to check all tracked products immediately."""
@@ -532,14 +1572,21 @@ def refresh_prices_handler(update: Update, context: CallbackContext):
     checked_count = 0
     changed_count = 0
     error_count = 0
+    pages = CyclePages(products)
     
     for url, product_info in products.items():
+        if _shutdown_event.is_set():
+            break
+        
         try:
             product_name = product_info['product_name']
             current_price = product_info['current_price']
             
-            # Fetch new product info
-            _, new_price, error = scrape_product_info(url)
+            # Fetch new product info; variants of one product share a page fetch
+            new_name, new_price, error = pages.check(url, scrape_product_page)
+            if new_name and new_name != product_name:
+                update_product_name(chat_id, url, new_name)
+                product_name = new_name
             
             # Handle sold-out products specially
             if error == "Tükendi":
@@ -587,7 +1634,8 @@ def refresh_prices_handler(update: Update, context: CallbackContext):
                 notification_text = (
                     f'🟢 <b>Ürün Tekrar Stokta! (Manuel Kontrol)</b>\n\n'
                     f'<b>{product_name}</b>\n'
-                    f'Yeni Fiyat: <b>{new_price:.2f} TL</b>\n\n'
+                    f'Yeni Fiyat: <b>{new_price:.2f} TL</b>\n'
+                    f'{target_note(product_info, current_price, new_price)}\n'
                     f'<a href="{url}">Ürüne Git</a>'
                 )
                 
@@ -632,7 +1680,8 @@ def refresh_prices_handler(update: Update, context: CallbackContext):
                     f'<b>{product_name}</b>\n'
                     f'Eski Fiyat: <b>{current_price:.2f} TL</b>\n'
                     f'Yeni Fiyat: <b>{new_price:.2f} TL</b>\n'
-                    f'Fark: <b>{price_diff:+.2f} TL (%{(price_diff/current_price*100):+.1f})</b>\n\n'
+                    f'Fark: <b>{price_diff:+.2f} TL (%{(price_diff/current_price*100):+.1f})</b>\n'
+                    f'{target_note(product_info, current_price, new_price)}\n'
                     f'<a href="{url}">Ürüne Git</a>'
                 )
                 
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Memory benchmark for the in-memory product registry.
+
+Writes a synthetic store, loads it with tracemalloc running and reports bytes per
+tracked product: the loaded registry, plus check state for every product, plus
+every chat's name search index, and the peak while one check cycle's queue and
+shared-page index are built and consumed.
+
+The same steps are measured for the dict layout the registry replaced (the JSON
+store kept as nested dicts, product ID and name indexes built for every chat at
+load, check state in per-product dicts and a copied store per check cycle), so
+one run shows bytes per product before and after:
+
+    python memory_bench.py --products 100000 --chats 200 --shared 0.3
+    python memory_bench.py --layout registry
+
+--shared is the share of subscriptions to a product another chat already tracks.
+"""
+
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BRANDS = ('Nike', 'Adidas', 'Koton', 'Mavi', 'LCW', 'Philips', 'Arzum')
+KINDS = ('Tişört', 'Ayakkabı', 'Kulaklık', 'Çanta', 'Mont')
+
+def write_store(path, products, chats, shared, seed):
+    """Write a store with a Zipf-like chat size skew; return the number of subscriptions."""
+    from loadtest import chat_sizes
+
+    rng = random.Random(seed)
+    catalogue = []
+    data = {}
+    for index, size in enumerate(chat_sizes(products, chats)):
+        chat_products = data[str(-1001000000000 - index)] = {}
+        while len(chat_products) < size:
+            if catalogue and rng.random() < shared:
+                url, info = rng.choice(catalogue)
+            else:
+                product_id = 100000 + len(catalogue)
+                brand = rng.choice(BRANDS)
+                price = round(rng.uniform(20, 5000), 2)
+                url = f'https://www.trendyol.com/{brand.lower()}/urun-{product_id}-p-{product_id}'
+                info = {
+                    'initial_price': price,
+                    'current_price': price,
+                    'product_name': f'{brand} Ürün {product_id} {rng.choice(KINDS)}',
+                    'product_id': str(product_id),
+                }
+                catalogue.append((url, info))
+            chat_products[url] = dict(info)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=4)
+    return sum(len(products) for products in data.values())
+
+def traced():
+    gc.collect()
+    return tracemalloc.get_traced_memory()[0]
+
+def measure_registry(subscriptions):
+    """Measure data_manager's registry; return {step: bytes} and the number of products queued."""
+    import data_manager
+    import main
+
+    tracemalloc.start()
+    base = traced()
+    results = {}
+
+    started = time.perf_counter()
+    data_manager.product_count()
+    results['load_s'] = round(time.perf_counter() - started, 2)
+    results['registry'] = traced() - base
+
+    for chat_id, url, _ in data_manager.iter_products():
+        main._record_check(chat_id, url)
+    results['with_check_state'] = traced() - base
+
+    for chat_id in {chat_id for chat_id, _, _ in data_manager.iter_products()}:
+        data_manager.search_products(chat_id, 'urun')
+    results['with_search_index'] = traced() - base
+
+    tracemalloc.reset_peak()
+    before_queue = traced()
+    # The cycle's shared-page index is alive for the whole cycle, so it counts too
+    total, queue, pages = main._build_check_queue(due_only=False)
+    consumed = sum(1 for _ in queue)
+    results['check_queue_peak'] = tracemalloc.get_traced_memory()[1] - before_queue
+    del pages
+    tracemalloc.stop()
+    return results, consumed
+
+def measure_dict_layout(path):
+    """Measure the same steps for the nested-dict store the registry replaced."""
+    from data_manager import tokenize, _prefixes
+    from fair_queue import fair_order
+
+    tracemalloc.start()
+    base = traced()
+    results = {}
+
+    # The whole store as parsed JSON, with the product ID and name indexes of every chat
+    started = time.perf_counter()
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    product_index, name_tokens, name_prefixes = {}, {}, {}
+    for chat_id, products in data.items():
+        tokens = name_tokens.setdefault(chat_id, {})
+        prefixes = name_prefixes.setdefault(chat_id, {})
+        for url, info in products.items():
+            product_index.setdefault(info['product_id'], {})[chat_id] = url
+            for token in set(tokenize(info['product_name'])):
+                tokens.setdefault(token, set()).add(url)
+                for prefix in _prefixes(token):
+                    prefixes.setdefault(prefix, set()).add(url)
+    results['load_s'] = round(time.perf_counter() - started, 2)
+    results['registry'] = traced() - base
+
+    check_state = {}
+    now = time.time()
+    for chat_id, products in data.items():
+        for url in products:
+            check_state.setdefault(chat_id, {})[url] = {'last_checked': now, 'next_due': now}
+    results['with_check_state'] = traced() - base
+    # Name indexes were already built at load
+    results['with_search_index'] = traced() - base
+
+    tracemalloc.reset_peak()
+    before_queue = traced()
+    snapshot = {chat_id: dict(products) for chat_id, products in data.items()}
+    per_chat = {}
+    for chat_id, products in snapshot.items():
+        chat_state = check_state.get(chat_id, {})
+        items = [(chat_state[url]['last_checked'], url, info) for url, info in products.items()]
+        items.sort(key=lambda item: item[0])
+        per_chat[chat_id] = items
+    consumed = sum(1 for _ in fair_order(per_chat))
+    results['check_queue_peak'] = tracemalloc.get_traced_memory()[1] - before_queue
+    del snapshot, per_chat
+    tracemalloc.stop()
+    return results, consumed
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix='trendyol-membench-')
+    os.environ.update({
+        'DATA_FILE': os.path.join(workdir, 'tracked_products.json'),
+        'CHECK_STATE_FILE': os.path.join(workdir, 'check_state.json'),
+        'CHECK_INTERVAL': '0',
+        'LOG_SAMPLE': '',
+    })
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    subscriptions = write_store(os.environ['DATA_FILE'], args.products, args.chats, args.shared, args.seed)
+
+    report = {'subscriptions': subscriptions, 'chats': args.chats, 'shared': args.shared}
+    layouts = ('dict', 'registry') if args.layout == 'both' else (args.layout,)
+    for layout in layouts:
+        if layout == 'dict':
+            results, consumed = measure_dict_layout(os.environ['DATA_FILE'])
+        else:
+            results, consumed = measure_registry(subscriptions)
+        report[layout] = {
+            'queued': consumed,
+            'load_s': results.pop('load_s'),
+            'mb': {name: round(value / 1024 / 1024, 1) for name, value in results.items()},
+            'bytes_per_product': {name: round(value / subscriptions) for name, value in results.items()},
+        }
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure registry memory per tracked product.')
+    parser.add_argument('--products', type=int, default=100000, help='subscriptions (chat, product pairs)')
+    parser.add_argument('--chats', type=int, default=200)
+    parser.add_argument('--shared', type=float, default=0.3,
+                        help='share of subscriptions to a product another chat already tracks')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--layout', choices=('both', 'registry', 'dict'), default='both',
+                        help="'dict' is the nested-dict store the registry replaced")
+    parser.add_argument('--output', help='write the JSON report to this file')
+    args = parser.parse_args()
+
+    report = run(args)
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    print(text)
+
+if __name__ == '__main__':
+    main()
@@ -1,30 +1,350 @@
-import requests
-from bs4 import BeautifulSoup
+import html as html_lib
+import json
 import re
-from config import USER_AGENT
+import threading
+import time
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode, unquote_plus
+from config import (
+    USER_AGENT, STREAM_FETCH, STREAM_CHUNK_SIZE, LISTING_URLS, LISTING_PAGES, HTTP_ARCHIVE_DIR, HTTP_ARCHIVE_MODE,
+    HTTP_ARCHIVE_MAX_MB, HTTP_ARCHIVE_MAX_AGE_DAYS, HTTP_ARCHIVE_SAMPLE, EGRESS_PROXIES, EGRESS_USER_AGENTS,
+    EGRESS_MAX_INFLIGHT, EGRESS_BLOCK_COOLDOWN, SHADOW_SAMPLE, SHADOW_CPU_BUDGET, SHADOW_DIR, SHADOW_MAX_CASES
+)
+from egress import EgressPool, NoEndpointAvailable, BLOCK_STATUSES
+from http_archive import HttpArchive
+from shadow import ShadowRunner
 import logging
 
-# Configure logging
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
 logger = logging.getLogger(__name__)
 
+# requests and bs4/lxml are imported on first use, so the bot can answer commands
+# before the parsing stack has loaded
+
+# Trendyol content ID segment of a product URL path
+PRODUCT_ID_RE = re.compile(r'-p-(\d+)')
+
+_TRENDYOL_URL_RE = re.compile(r'https?://(www\.|m\.)?(trendyol\.com|ty\.gl|tyml\.gl|trendyol-milla\.com).*')
+_PRICE_NUMBER_RE = re.compile(r'(\d+[,.]\d+|\d+)')
+_WINNER_PRICE_RE = re.compile(r'"price":\s*{\s*[^}]*"value":\s*([0-9.]+)')
+_PRICE_TEXT_RE = re.compile(r'\d+[,.]?\d*\s*TL|\d+[,.]?\d*\s*₺')
+
+# Query parameters that select a specific listing of a product
+_LISTING_PARAMS = ('boutiqueId', 'merchantId')
+
+# Query parameter of a variant (size) subscription; always last in canonical URLs
+_VARIANT_PARAM = 'v'
+_VARIANT_RE = re.compile(r'[?&]v=([^&]*)$')
+
+# Product state embedded in product pages; carries every variant's stock and price
+_PRODUCT_STATE_MARKER = '__PRODUCT_DETAIL_APP_INITIAL_STATE__'
+
+# Longest wait (seconds) for a free egress endpoint before a request fails
+EGRESS_WAIT = 60
+
+# Egress endpoints for page downloads; without EGRESS_PROXIES a single direct
+# endpoint with no concurrency limit or cooldown
+_egress = EgressPool(EGRESS_PROXIES, EGRESS_USER_AGENTS, EGRESS_MAX_INFLIGHT, EGRESS_BLOCK_COOLDOWN) \
+    if EGRESS_PROXIES else EgressPool(['direct'], [USER_AGENT])
+
+def get_egress():
+    """Return the egress pool used for page downloads."""
+    return _egress
+
+def http_request(method, url, read=None, **kwargs):
+    """requests.request over the egress pool, with the endpoint's proxy and client headers.
+    
+    A request that is blocked, answered with a server error or fails to connect
+    is retried once on another endpoint, if one is free right away. With read,
+    read(response) is returned instead of the response, which is then closed; it
+    runs while the endpoint is still leased, so a streamed body counts towards the
+    endpoint's in-flight limit and latency, as in the asyncio runtime.
+    """
+    import requests
+    
+    response, error = None, None
+    tried = []
+    for wait in ((EGRESS_WAIT, 0) if len(_egress) > 1 else (EGRESS_WAIT,)):
+        try:
+            with _egress.lease(wait, tried) as lease:
+                tried.append(lease.endpoint)
+                response = requests.request(method, url, headers=lease.endpoint.headers,
+                                            proxies=lease.endpoint.proxies, **kwargs)
+                lease.status = response.status_code
+                if read and response.status_code not in BLOCK_STATUSES and response.status_code < 500:
+                    try:
+                        return read(response)
+                    finally:
+                        response.close()
+        except requests.RequestException as e:
+            response, error = None, e
+            continue
+        except NoEndpointAvailable:
+            if not tried:
+                raise
+            break
+        if response.status_code not in BLOCK_STATUSES and response.status_code < 500:
+            return response
+        response.close()
+    if response is not None:
+        return read(response) if read else response
+    raise error
+
 def is_valid_trendyol_url(url):
     """Check if the URL is a valid Trendyol URL."""
-    return bool(re.match(r'https?://(www\.)?(trendyol\.com|ty\.gl|tyml\.gl|trendyol-milla\.com).*', url))
+    return bool(_TRENDYOL_URL_RE.match(url))
+
+def normalize_product_url(url):
+    """Return (canonical_url, product_id) for a product URL, or (url, None) if it has no content ID.
+
+    The canonical URL drops tracking parameters and mobile hosts; the product ID is the
+    content ID plus the merchant and variant when the link pins them (e.g. "123456",
+    "123456-m968" or "123456-m968-vM").
+    """
+    parts = urlsplit(url.strip())
+    match = PRODUCT_ID_RE.search(parts.path)
+    if not match:
+        return url, None
+    
+    host = parts.netloc.lower()
+    if host.startswith('m.'):
+        host = 'www.' + host[2:]
+    elif host == 'trendyol.com':
+        host = 'www.trendyol.com'
+    
+    params = dict(parse_qsl(parts.query))
+    listing = [(key, params[key]) for key in _LISTING_PARAMS + (_VARIANT_PARAM,) if params.get(key)]
+    
+    product_id = match.group(1)
+    if params.get('merchantId'):
+        product_id = f"{product_id}-m{params['merchantId']}"
+    if params.get(_VARIANT_PARAM):
+        product_id = f"{product_id}-v{params[_VARIANT_PARAM]}"
+    
+    canonical_url = urlunsplit((parts.scheme or 'https', host, parts.path[:match.end()], urlencode(listing), ''))
+    return canonical_url, product_id
 
-def get_full_url(url):
+def split_variant(url):
+    """Return (page_url, variant) of a canonical product URL; variant is None for the whole product."""
+    match = _VARIANT_RE.search(url)
+    if not match:
+        return url, None
+    return url[:match.start()], unquote_plus(match.group(1))
+
+def variant_url(page_url, variant):
+    """Canonical URL of one variant of a product page."""
+    return f"{page_url}{'&' if '?' in page_url else '?'}{urlencode({_VARIANT_PARAM: variant})}"
+
+def resolve_product_url(url):
+    """Normalize a pasted link, following short links (ty.gl) when needed."""
+    canonical_url, product_id = normalize_product_url(url)
+    if product_id:
+        return canonical_url, product_id
+    return normalize_product_url(get_full_url(url))
+
+def get_full_url(url, timeout=10):
     """Follow redirects to get the full URL if it's a shortened link."""
     try:
-        headers = {'User-Agent': USER_AGENT}
-        response = requests.head(url, headers=headers, allow_redirects=True)
+        response = http_request('HEAD', url, allow_redirects=True, timeout=timeout)
         return response.url
     except Exception as e:
         logger.error(f"Error following redirect for {url}: {e}")
         return url
 
+# Byte patterns the streaming extractor uses to decide that a page prefix is enough
+_STREAM_NAME_RE = re.compile(rb'</h1>', re.IGNORECASE)
+_STREAM_PRICE_RES = (
+    # Up to the closing tag, so a price split across chunks is not taken half read
+    re.compile(rb'class="[^"]*(?:campaign-price|prc-dsc)[^"]*"[^>]*>[^<]*\d[^<]*<'),
+    re.compile(rb'"offers"\s*:\s*\{[^}]*"price"[^<]*</script>'),
+)
+_STREAM_WINNER_RE = re.compile(rb'winnerVariant')
+_STREAM_WINNER_PRICE_RE = re.compile(rb'"price":\s*\{\s*[^}]*"value":\s*[0-9.]+[,}\s]')
+_STREAM_STOCK_RE = re.compile(rb'<button[^>]*add-to-basket[^>]*>.*?</button>', re.DOTALL)
+_STREAM_SOLD_OUT = 'Tükendi'.encode('utf-8')
+_STREAM_STATE_RE = re.compile(_PRODUCT_STATE_MARKER.encode())
+_STREAM_SCRIPT_END_RE = re.compile(rb'</script>', re.IGNORECASE)
+
+# Bytes read and saved by streaming fetches since the last reset. Savings are only known
+# for early-closed pages whose length was announced ('measured'); the rest count as 0
+_stream_stats_lock = threading.Lock()
+_stream_stats = {'pages': 0, 'early_closed': 0, 'measured': 0, 'bytes_read': 0, 'bytes_saved': 0}
+
+class StreamingExtractor:
+    """Incrementally scan page chunks until name, price and stock are determined.
+
+    With with_variants, reading also continues until the product state script
+    (which lists the variants) has ended.
+    """
+
+    # Re-scan this many bytes of the previous chunks so that markers split
+    # across chunk boundaries are still found
+    OVERLAP = 4096
+
+    def __init__(self, with_variants=False):
+        self.buffer = bytearray()
+        self.has_name = False
+        self.has_price = False
+        self.has_stock = False
+        self.sold_out = False
+        self.has_state = not with_variants
+        self._scan_from = 0
+        self._winner_at = None
+        self._state_at = None
+
+    def feed(self, chunk):
+        """Append a chunk and update which fields are already present."""
+        self.buffer += chunk
+        start = self._scan_from
+        
+        if not self.has_name and _STREAM_NAME_RE.search(self.buffer, start):
+            self.has_name = True
+        
+        if not self.sold_out and self.buffer.find(_STREAM_SOLD_OUT, start) != -1:
+            self.sold_out = True
+        
+        if not self.has_price:
+            for pattern in _STREAM_PRICE_RES:
+                if pattern.search(self.buffer, start):
+                    self.has_price = True
+                    break
+        
+        if not self.has_price:
+            if self._winner_at is None:
+                match = _STREAM_WINNER_RE.search(self.buffer, start)
+                if match:
+                    self._winner_at = match.start()
+            if self._winner_at is not None and _STREAM_WINNER_PRICE_RE.search(self.buffer, max(start, self._winner_at)):
+                self.has_price = True
+        
+        if not self.has_stock and _STREAM_STOCK_RE.search(self.buffer, start):
+            self.has_stock = True
+        
+        if not self.has_state:
+            if self._state_at is None:
+                match = _STREAM_STATE_RE.search(self.buffer, start)
+                if match:
+                    self._state_at = match.start()
+            if self._state_at is not None and _STREAM_SCRIPT_END_RE.search(self.buffer, max(start, self._state_at)):
+                self.has_state = True
+        
+        self._scan_from = max(0, len(self.buffer) - self.OVERLAP)
+
+    @property
+    def complete(self):
+        """True once the prefix holds everything scrape_product_info needs."""
+        return self.has_state and self.has_name and (self.sold_out or (self.has_price and self.has_stock))
+
+class StockProbe:
+    """Scan page chunks for the add-to-basket button and stop there.
+
+    in_stock becomes True or False once the button has been seen; only a short
+    tail of the page is kept between chunks.
+    """
+
+    # Bytes kept from the previous chunks so a button split across chunks is found
+    OVERLAP = 4096
+
+    def __init__(self):
+        self.in_stock = None
+        self.bytes_read = 0
+        self._tail = b''
+
+    def feed(self, chunk):
+        self.bytes_read += len(chunk)
+        window = self._tail + chunk
+        match = _STREAM_STOCK_RE.search(window)
+        if match:
+            button = match.group(0)
+            opening_tag = button[:button.find(b'>')]
+            self.in_stock = not (_STREAM_SOLD_OUT in button or b'disabled' in opening_tag)
+        else:
+            self._tail = window[-self.OVERLAP:]
+
+# Stock probes since the last reset
+_probe_stats_lock = threading.Lock()
+_probe_stats = {'probes': 0, 'in_stock': 0, 'inconclusive': 0, 'bytes_read': 0}
+
+def record_probe_stats(probe):
+    with _probe_stats_lock:
+        _probe_stats['probes'] += 1
+        _probe_stats['in_stock'] += probe.in_stock is True
+        _probe_stats['inconclusive'] += probe.in_stock is None
+        _probe_stats['bytes_read'] += probe.bytes_read
+
+def get_probe_stats(reset=False):
+    """Return stock probe counters, optionally resetting them."""
+    with _probe_stats_lock:
+        stats = dict(_probe_stats)
+        if reset:
+            for key in _probe_stats:
+                _probe_stats[key] = 0
+    return stats
+
+def record_stream_stats(bytes_read, early_closed, content_length=None):
+    """Count a streamed page; content_length (same units as bytes_read) measures the savings."""
+    with _stream_stats_lock:
+        _stream_stats['pages'] += 1
+        _stream_stats['bytes_read'] += bytes_read
+        if early_closed:
+            _stream_stats['early_closed'] += 1
+            if content_length is not None:
+                _stream_stats['measured'] += 1
+                _stream_stats['bytes_saved'] += max(0, content_length - bytes_read)
+
+def get_stream_stats(reset=False):
+    """Return streaming fetch counters, optionally resetting them."""
+    with _stream_stats_lock:
+        stats = dict(_stream_stats)
+        if reset:
+            for key in _stream_stats:
+                _stream_stats[key] = 0
+    return stats
+
+def _fetch_page_streaming(url, with_variants=False):
+    """Download a page in chunks and stop as soon as the needed data has arrived."""
+    return http_request('GET', url, read=lambda response: _read_streaming(response, with_variants),
+                        timeout=10, stream=True)
+
+def _read_streaming(response, with_variants):
+    if response.status_code != 200:
+        return response.status_code, None
+    
+    extractor = StreamingExtractor(with_variants)
+    early_closed = False
+    for chunk in response.iter_content(chunk_size=STREAM_CHUNK_SIZE):
+        extractor.feed(chunk)
+        if extractor.complete:
+            early_closed = True
+            break
+    
+    # Count wire bytes (possibly compressed), the same units as Content-Length
+    content_length = response.headers.get('Content-Length', '')
+    record_stream_stats(response.raw.tell(), early_closed,
+                        int(content_length) if content_length.isdigit() else None)
+    
+    html = bytes(extractor.buffer).decode(response.encoding or 'utf-8', errors='replace')
+    return response.status_code, html
+
+# Page archive for debugging extraction failures (HTTP_ARCHIVE_DIR)
+_archive = HttpArchive(
+    HTTP_ARCHIVE_DIR, HTTP_ARCHIVE_MAX_MB * 1024 * 1024, HTTP_ARCHIVE_MAX_AGE_DAYS * 86400,
+    HTTP_ARCHIVE_SAMPLE, replaying=HTTP_ARCHIVE_MODE == 'replay'
+) if HTTP_ARCHIVE_DIR else None
+
+def get_archive():
+    """Return the page archive, or None when archiving is off."""
+    return _archive
+
+def fetch_page(url, with_variants=False):
+    """Download a product page, returning (status_code, html); with_variants keeps the product state."""
+    if _archive and _archive.replaying:
+        return _archive.replay(url)
+    
+    if STREAM_FETCH:
+        return _fetch_page_streaming(url, with_variants)
+    
+    response = http_request('GET', url, timeout=10)
+    return response.status_code, response.text
+
 def extract_price(text):
     """Extract numeric price value from text."""
     if not text:
@@ -32,7 +352,7 @@ def extract_price(text):
     # Remove spaces and replace comma with dot
     price_text = text.strip().replace('.', '').replace(',', '.')
     # Extract numbers with decimal points using regex
-    match = re.search(r'(\d+[,.]\d+|\d+)', price_text)
+    match = _PRICE_NUMBER_RE.search(price_text)
     if match:
         price = float(match.group(1).replace(',', '.'))
         # Add reasonable bounds check to avoid interpreting IDs as prices
@@ -40,148 +360,598 @@ def extract_price(text):
             return price
     return None
 
+# Counters are halved past this many attempts so recent pages weigh more
+STRATEGY_WINDOW = 500
+
+# Raw-HTML markers identifying Trendyol page templates, checked in order
+_PAGE_TEMPLATES = (
+    ('pdp-state', '__PRODUCT_DETAIL_APP_INITIAL_STATE__'),
+    ('pdp-legacy', 'pr-new-br'),
+)
+
+def _site_of(url):
+    host = urlsplit(url).netloc.lower()
+    return 'trendyol-milla.com' if 'trendyol-milla' in host else 'trendyol.com'
+
+def _page_template(html):
+    for name, marker in _PAGE_TEMPLATES:
+        if marker in html:
+            return name
+    return 'other'
+
+class StrategyRegistry:
+    """Extraction strategies per group, reordered by observed hit rate and cost.
+
+    Statistics are kept per (site, page template). A group is one of two kinds:
+
+    - 'precedence' (prices): strategies always run in registration order, because
+      the first one that finds a value decides which price is reported. None is
+      ever skipped: a rarely seen higher one (a campaign price) must still win
+      when it appears, and lower ones only run when every higher one misses.
+    - 'detector' (sold-out checks): any hit decides, so strategies run cheapest
+      expected cost per hit first. A page where none hits says nothing about
+      them, so misses only count on pages where one of them hit.
+    """
+
+    def __init__(self):
+        self._strategies = {}
+        self._kinds = {}
+        # (group, key, name) -> [attempts, hits, seconds]
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def register(self, group, name):
+        """Decorator adding func(soup) -> value or None to a strategy group."""
+        def decorator(func):
+            self._strategies.setdefault(group, []).append((name, func))
+            return func
+        return decorator
+
+    def set_kind(self, group, kind):
+        """Make a group 'precedence' (the default) or 'detector'."""
+        self._kinds[group] = kind
+
+    def _ordered(self, group, key):
+        strategies = self._strategies[group]
+        if self._kinds.get(group) != 'detector':
+            return strategies
+        
+        with self._lock:
+            stats = {name: self._stats.get((group, key, name), [0, 0, 0.0]) for name, _ in strategies}
+        
+        # Expected seconds per hit, with smoothed hit rate; untried detectors keep
+        # their registration order
+        def cost(item):
+            index, (name, _) = item
+            attempts, hits, seconds = stats[name]
+            hit_rate = (hits + 1) / (attempts + 2)
+            return ((seconds / attempts) / hit_rate if attempts else float('inf'), index)
+        return [strategy for _, strategy in sorted(enumerate(strategies), key=cost)]
+
+    def run(self, group, key, soup):
+        """Run a group's strategies until one returns a value; return (name, value) or (None, None)."""
+        detector = self._kinds.get(group) == 'detector'
+        samples = []
+        
+        found = None, None
+        for name, func in self._ordered(group, key):
+            value = self._attempt(group, key, name, func, soup, samples)
+            if value:
+                found = name, value
+                break
+        
+        if found[1] or not detector:
+            self._record(group, key, samples)
+        return found
+
+    def _attempt(self, group, key, name, func, soup, samples):
+        started = time.perf_counter()
+        try:
+            value = func(soup)
+        except Exception as e:
+            logger.debug(f"{group} strategy '{name}' failed: {e}")
+            value = None
+        samples.append((name, bool(value), time.perf_counter() - started))
+        return value
+
+    def _record(self, group, key, samples):
+        with self._lock:
+            for name, hit, elapsed in samples:
+                stats = self._stats.setdefault((group, key, name), [0, 0, 0.0])
+                stats[0] += 1
+                stats[1] += hit
+                stats[2] += elapsed
+                if stats[0] > STRATEGY_WINDOW:
+                    stats[:] = [stats[0] / 2, stats[1] / 2, stats[2] / 2]
+
+    def get_stats(self, reset=False):
+        """Return {"site/template": {group: [strategy stats]}}."""
+        with self._lock:
+            snapshot = {k: list(v) for k, v in self._stats.items()}
+            if reset:
+                self._stats.clear()
+        
+        report = {}
+        for (group, key, name), (attempts, hits, seconds) in snapshot.items():
+            report.setdefault(f"{key[0]}/{key[1]}", {}).setdefault(group, []).append({
+                'name': name,
+                'attempts': round(attempts),
+                'hit_rate': round(hits / attempts, 3) if attempts else 0,
+                'avg_ms': round(seconds / attempts * 1000, 3) if attempts else 0,
+            })
+        return report
+
+_registry = StrategyRegistry()
+_registry.set_kind('price', 'precedence')
+_registry.set_kind('sold_out', 'detector')
+
+@_registry.register('sold_out', 'sold-out-button')
+def _sold_out_button(soup):
+    button = soup.select_one('.product-button-container .add-to-basket.sold-out')
+    return bool(button and "Tükendi" in button.text)
+
+@_registry.register('sold_out', 'sold-out-text')
+def _sold_out_text(soup):
+    # Any text containing "Stoklar Tükendi" or "Tükendi"
+    return bool(soup.find(string=lambda text: text and 'Tükendi' in text))
+
+@_registry.register('sold_out', 'basket-button')
+def _sold_out_basket_button(soup):
+    # Add-to-basket button text and disabled state
+    button = soup.find('button', class_='add-to-basket')
+    if not button:
+        return False
+    text = button.get_text().strip()
+    return bool('Tükendi' in text or 'Stok' in text or button.has_attr('disabled'))
+
+@_registry.register('sold_out', 'sold-out-class')
+def _sold_out_css_class(soup):
+    return bool(soup.select('.sold-out, .stok-yok, .out-of-stock'))
+
+# Price strategies in precedence order: campaign price overrides the regular price
+@_registry.register('price', 'campaign-price')
+def _price_campaign(soup):
+    price_tag = soup.find('p', class_='campaign-price')
+    return extract_price(price_tag.text) if price_tag else None
+
+@_registry.register('price', 'prc-dsc')
+def _price_prc_dsc(soup):
+    price_tag = soup.find('span', class_='prc-dsc')
+    return extract_price(price_tag.text) if price_tag else None
+
+@_registry.register('price', 'json-ld')
+def _price_json_ld(soup):
+    # JSON-LD structured data contains the offer price
+    for script in soup.find_all('script', type='application/ld+json'):
+        try:
+            data = json.loads(script.string)
+        except (TypeError, ValueError):
+            continue
+        if isinstance(data, dict) and isinstance(data.get('offers'), dict) and 'price' in data['offers']:
+            return float(data['offers']['price'])
+    return None
+
+@_registry.register('price', 'winner-variant')
+def _price_winner_variant(soup):
+    # Price from the winnerVariant data of the page state script
+    for script in soup.find_all('script'):
+        if script.string and 'winnerVariant' in script.string:
+            price_match = _WINNER_PRICE_RE.search(script.string)
+            if price_match:
+                return float(price_match.group(1))
+    return None
+
+@_registry.register('price', 'tl-text')
+def _price_tl_text(soup):
+    # Any text that looks like a TL amount; slowest and least precise
+    for element in soup.find_all(string=_PRICE_TEXT_RE):
+        price = extract_price(element)
+        if price and price < 100000:  # Reasonable price limit
+            return price
+    return None
+
+def get_strategy_stats(reset=False):
+    """Return extraction strategy statistics per site and page template."""
+    return _registry.get_stats(reset)
+
+def _read_probe(response):
+    probe = StockProbe()
+    if response.status_code == 200 and is_valid_trendyol_url(response.url):
+        for chunk in response.iter_content(chunk_size=STREAM_CHUNK_SIZE):
+            probe.feed(chunk)
+            if probe.in_stock is not None:
+                break
+    return probe
+
+def probe_stock(url):
+    """Cheap stock check of a sold-out product, reading the page only up to its basket button.
+    
+    Returns True or False, or None when the page could not be read or shows no
+    add-to-basket button; callers fall back to scrape_product_info then.
+    """
+    import requests
+    
+    probe = StockProbe()
+    if _archive and _archive.replaying:
+        status_code, html = _archive.replay(url)
+        if status_code == 200:
+            probe.feed(html.encode('utf-8'))
+        record_probe_stats(probe)
+        return probe.in_stock
+    
+    try:
+        probe = http_request('GET', url, read=_read_probe, timeout=10, stream=True)
+    except (requests.RequestException, NoEndpointAvailable) as e:
+        logger.warning(f"Stock probe failed for {url}: {e}")
+        return None
+    
+    record_probe_stats(probe)
+    return probe.in_stock
+
 def scrape_product_info(url):
-    """Scrape product information from Trendyol."""
+    """Scrape product information from Trendyol; for a variant URL, that variant's price and stock."""
+    page_url, variant = split_variant(url)
+    result = scrape_product_page(page_url, with_variants=bool(variant))
+    return variant_result(result, variant) if variant else result[:3]
+
+def scrape_product_page(url, with_variants=False):
+    """Scrape a product page into (name, price, error, variants).
+    
+    variants is {value: (price, in_stock)} from the product state, filled only with
+    with_variants; one page serves every variant subscription of the product.
+    """
+    import requests
+    
     try:
-        # Follow redirects for shortened URLs
-        full_url = get_full_url(url)
+        # Follow redirects for shortened URLs; canonical product URLs need no extra request
+        replaying = _archive and _archive.replaying
+        full_url = url if PRODUCT_ID_RE.search(url) or replaying else get_full_url(url)
         
         # Check if the URL is a valid Trendyol URL
         if not is_valid_trendyol_url(full_url):
-            return None, None, "URL does not belong to Trendyol"
+            return None, None, "URL does not belong to Trendyol", {}
         
-        headers = {'User-Agent': USER_AGENT}
-        response = requests.get(full_url, headers=headers, timeout=10)
+        status_code, html = fetch_page(full_url, with_variants)
         
-        if response.status_code != 200:
-            return None, None, f"Failed to access the product page. Status code: {response.status_code}"
-        
-        soup = BeautifulSoup(response.text, 'lxml')
-        # Extract product name from title
-        title_tag = soup.find('title')
-        product_name = title_tag.text.split('-')[0].strip() if title_tag else None
-        
-        # Try to get a better product name from h1 with class pr-new-br (Trendyol's product title class)
-        h1_tag = soup.find('h1', class_='pr-new-br')
-        if h1_tag:
-            # If there's a brand link inside the h1
-            brand_link = h1_tag.find('a', class_='product-brand-name-with-link')
-            brand_name = brand_link.text.strip() if brand_link else ""
-            
-            # Find the span containing the product description
-            product_desc_span = h1_tag.find('span')
-            product_desc = product_desc_span.text.strip() if product_desc_span else ""
-            
-            # Combine brand and product description
-            if brand_name and product_desc:
-                product_name = f"{brand_name} {product_desc}"
-            elif h1_tag.text:
-                product_name = h1_tag.text.strip()
-        
-        # Fallback to any h1 tag if no specific product title tag found
-        elif soup.find('h1'):
-            product_name = soup.find('h1').text.strip()
-        
-        # Check if product is sold out - Enhanced detection
-        is_sold_out = False
-        
-        # Method 1: Check specific sold-out button selector
-        sold_out_button = soup.select_one('.product-button-container .add-to-basket.sold-out')
-        if sold_out_button and "Tükendi" in sold_out_button.text:
-            is_sold_out = True
-        
-        # Method 2: Check for any text containing "Stoklar Tükendi" or "Tükendi"
-        if not is_sold_out:
-            sold_out_texts = soup.find_all(string=lambda text: text and ('Stoklar Tükendi' in text or 'Tükendi' in text))
-            if sold_out_texts:
-                is_sold_out = True
-                logger.info(f"Sold out detected via text: {sold_out_texts[0].strip()}")
-        
-        # Method 3: Check add-to-basket button text and disabled state
-        if not is_sold_out:
-            add_to_basket_btn = soup.find('button', class_='add-to-basket')
-            if add_to_basket_btn:
-                btn_text = add_to_basket_btn.get_text().strip()
-                if 'Tükendi' in btn_text or 'Stok' in btn_text or add_to_basket_btn.get('disabled'):
-                    is_sold_out = True
-                    logger.info(f"Sold out detected via button: {btn_text}")
-        
-        # Method 4: Check for sold-out related CSS classes
-        if not is_sold_out:
-            sold_out_elements = soup.select('.sold-out, .stok-yok, .out-of-stock')
-            if sold_out_elements:
-                is_sold_out = True
-                logger.info("Sold out detected via CSS class")
-        
-        if is_sold_out:
-            is_sold_out = True
-            logger.info(f"Product is sold out: {product_name}")
-            return product_name, 0, "Tükendi"
-        
-        # Try different price selectors
-        price = None
-        price_selectors = [
-            {"tag": "p", "class": "campaign-price"},
-            {"tag": "span", "class": "prc-dsc"}
-        ]
-        
-        for selector in price_selectors:
-            price_tag = soup.find(selector["tag"], class_=selector["class"])
-            if price_tag:
-                price = extract_price(price_tag.text)
-                if price:
-                    break
+        if status_code != 200:
+            return None, None, f"Failed to access the product page. Status code: {status_code}", {}
         
-        # If no price found with selectors, try JSON-LD data
-        if not price:
-            # Look for JSON-LD structured data which contains price information
-            script_tags = soup.find_all('script', type='application/ld+json')
-            for script in script_tags:
-                try:
-                    import json
-                    data = json.loads(script.string)
-                    if isinstance(data, dict) and 'offers' in data:
-                        offers = data['offers']
-                        if isinstance(offers, dict) and 'price' in offers:
-                            price = float(offers['price'])
-                            break
-                except:
-                    continue
-        
-        # If still no price, try JavaScript variables
-        if not price:
-            # Look for window variables containing price data
-            script_tags = soup.find_all('script')
-            for script in script_tags:
-                if script.string and 'winnerVariant' in script.string:
-                    # Extract price from winnerVariant data
-                    import re
-                    price_match = re.search(r'"price":\s*{\s*[^}]*"value":\s*([0-9.]+)', script.string)
-                    if price_match:
-                        price = float(price_match.group(1))
-                        break
-                    
-        if not price:
-            # Try to find any element containing TL as fallback (but be more careful)
-            price_elements = soup.find_all(text=re.compile(r'\d+[,.]?\d*\s*TL|\d+[,.]?\d*\s*₺'))
-            for element in price_elements:
-                # Only extract if it looks like a price (not too large to be an ID)
-                extracted_price = extract_price(element)
-                if extracted_price and extracted_price < 100000:  # Reasonable price limit
-                    price = extracted_price
-                    break
+        return parse_page(full_url, html, with_variants)
         
-        if not product_name:
-            return None, None, "Could not extract product name"
+    except (requests.RequestException, NoEndpointAvailable) as e:
+        return None, None, f"Request error: {str(e)}", {}
+    except Exception as e:
+        logger.error(f"Error scraping {url}: {e}")
+        return None, None, f"Error scraping product: {str(e)}", {}
+
+def parse_page(full_url, html, with_variants=False):
+    """parse_and_archive plus, with with_variants, the page's variants: (name, price, error, variants)."""
+    return parse_and_archive(full_url, html) + (parse_variants(html) if with_variants else {},)
+
+def parse_variants(html):
+    """Extract {value: (price, in_stock)} of every variant (size) from the product state.
+    
+    price is None when a variant has no price of its own.
+    """
+    start = html.find(_PRODUCT_STATE_MARKER)
+    if start == -1:
+        return {}
+    start = html.find('{', start)
+    try:
+        state, _ = json.JSONDecoder().raw_decode(html, start)
+        product = state.get('product') or {}
+    except (ValueError, AttributeError):
+        return {}
+    
+    variants = {}
+    for variant in product.get('allVariants') or []:
+        try:
+            price = variant.get('price')
+            variants[str(variant['value'])] = (float(price) if price else None, bool(variant.get('inStock')))
+        except (KeyError, TypeError, ValueError, AttributeError):
+            continue
+    if variants:
+        return variants
+    
+    # Older state: attribute variants with nested price objects
+    for variant in product.get('variants') or []:
+        try:
+            price_info = variant.get('price') or {}
+            price = (price_info.get('discountedPrice') or price_info.get('sellingPrice') or {}).get('value')
+            in_stock = variant.get('sellable', True) and variant.get('stock') != 0
+            variants[str(variant['attributeValue'])] = (float(price) if price else None, bool(in_stock))
+        except (KeyError, TypeError, ValueError, AttributeError):
+            continue
+    return variants
+
+def variant_result(page_result, variant):
+    """Turn a scrape_product_page result into (name, price, error) for one variant."""
+    product_name, price, error, variants = page_result
+    if error and error != "Tükendi":
+        return product_name, price, error
+    
+    name = f"{product_name} ({variant})" if product_name else None
+    folded = variant.casefold()
+    match = next((value for value in variants if value.casefold() == folded), None)
+    if match is None:
+        # A sold-out page may omit the variant list; otherwise the variant is gone
+        return (name, 0, "Tükendi") if error else (name, None, f"Variant not found: {variant}")
+    
+    variant_price, in_stock = variants[match]
+    if not in_stock:
+        return name, 0, "Tükendi"
+    if not (variant_price or price):
+        return name, None, "Could not extract price"
+    return name, variant_price or price, None
+
+def parse_and_archive(full_url, html):
+    """parse_product_page, archiving the page if it failed or is sampled and shadow-parsing a sample."""
+    started = time.thread_time()
+    try:
+        result = parse_product_page(full_url, html)
+    except Exception as e:
+        logger.error(f"Error parsing {full_url}: {e}")
+        result = None, None, f"Error scraping product: {str(e)}"
+    
+    if _shadow:
+        _shadow.submit(full_url, html, result, time.thread_time() - started)
+    if _archive:
+        _archive.record(full_url, html, result[2])
+    return result
+
+def parse_product_page(full_url, html):
+    """Extract (name, price, error) from a downloaded product page; CPU-bound, no I/O."""
+    from bs4 import BeautifulSoup
+    
+    soup = BeautifulSoup(html, 'lxml')
+    # Extract product name from title
+    title_tag = soup.find('title')
+    product_name = title_tag.text.split('-')[0].strip() if title_tag else None
+    
+    # Try to get a better product name from h1 with class pr-new-br (Trendyol's product title class)
+    h1_tag = soup.find('h1', class_='pr-new-br')
+    if h1_tag:
+        # If there's a brand link inside the h1
+        brand_link = h1_tag.find('a', class_='product-brand-name-with-link')
+        brand_name = brand_link.text.strip() if brand_link else ""
+        
+        # Find the span containing the product description
+        product_desc_span = h1_tag.find('span')
+        product_desc = product_desc_span.text.strip() if product_desc_span else ""
+        
+        # Combine brand and product description
+        if brand_name and product_desc:
+            product_name = f"{brand_name} {product_desc}"
+        elif h1_tag.text:
+            product_name = h1_tag.text.strip()
+    
+    # Fallback to any h1 tag if no specific product title tag found
+    elif soup.find('h1'):
+        product_name = soup.find('h1').text.strip()
+    
+    key = (_site_of(full_url), _page_template(html))
+    
+    # Check if product is sold out; detectors run in order of past hit rate
+    sold_out_by, _ = _registry.run('sold_out', key, soup)
+    if sold_out_by:
+        logger.info(f"Product is sold out ({sold_out_by}): {product_name}")
+        return product_name, 0, "Tükendi"
+    
+    # Try price strategies, cheapest likely winner first
+    _, price = _registry.run('price', key, soup)
+    
+    if not product_name:
+        return None, None, "Could not extract product name"
+        
+    if not price:
+        return product_name, None, "Could not extract price"
+        
+    return product_name, price, None
+
+def _class_re(tag, class_name):
+    """Regex for a tag whose class list contains class_name, capturing its contents."""
+    return re.compile(rf'<{tag}\s[^>]*class="(?:[^"]*\s)?{class_name}(?:\s[^"]*)?"[^>]*>(.*?)</{tag}>',
+                      re.IGNORECASE | re.DOTALL)
+
+# Patterns of the regex-only parser
+_RX_TITLE_RE = re.compile(r'<title[^>]*>(.*?)</title>', re.IGNORECASE | re.DOTALL)
+_RX_PRODUCT_H1_RE = _class_re('h1', 'pr-new-br')
+_RX_H1_RE = re.compile(r'<h1[^>]*>(.*?)</h1>', re.IGNORECASE | re.DOTALL)
+_RX_BRAND_RE = _class_re('a', 'product-brand-name-with-link')
+_RX_SPAN_RE = re.compile(r'<span[^>]*>(.*?)</span>', re.IGNORECASE | re.DOTALL)
+_RX_TAG_RE = re.compile(r'<[^>]+>')
+_RX_BASKET_RE = re.compile(r'<button(\s[^>]*class="(?:[^"]*\s)?add-to-basket(?:\s[^"]*)?"[^>]*)>(.*?)</button>',
+                           re.IGNORECASE | re.DOTALL)
+_RX_SOLD_OUT_CLASS_RE = re.compile(r'class="(?:[^"]*\s)?(?:sold-out|stok-yok|out-of-stock)(?:\s[^"]*)?"')
+_RX_SOLD_OUT_TEXT_RE = re.compile(r'>[^<]*Tükendi')
+_RX_PRICE_RES = (_class_re('p', 'campaign-price'), _class_re('span', 'prc-dsc'))
+_RX_JSON_LD_RE = re.compile(r'<script[^>]*application/ld\+json[^>]*>(.*?)</script>', re.IGNORECASE | re.DOTALL)
+_RX_PRICE_TEXT_RE = re.compile(r'>([^<]*(?:\d+[,.]?\d*\s*TL|\d+[,.]?\d*\s*₺)[^<]*)<')
+
+def _rx_text(fragment):
+    """Text of an HTML fragment, like BeautifulSoup's .text."""
+    return html_lib.unescape(_RX_TAG_RE.sub('', fragment))
+
+def _rx_name(html):
+    match = _RX_PRODUCT_H1_RE.search(html)
+    if match:
+        content = match.group(1)
+        brand = _RX_BRAND_RE.search(content)
+        brand_name = _rx_text(brand.group(1)).strip() if brand else ""
+        desc = _RX_SPAN_RE.search(content)
+        product_desc = _rx_text(desc.group(1)).strip() if desc else ""
+        if brand_name and product_desc:
+            return f"{brand_name} {product_desc}"
+        if content:
+            return _rx_text(content).strip()
+    match = _RX_H1_RE.search(html)
+    if match:
+        return _rx_text(match.group(1)).strip()
+    match = _RX_TITLE_RE.search(html)
+    return _rx_text(match.group(1)).split('-')[0].strip() if match else None
+
+def _rx_sold_out(html):
+    basket = _RX_BASKET_RE.search(html)
+    if basket:
+        text = _rx_text(basket.group(2))
+        if 'Tükendi' in text or 'Stok' in text or re.search(r'\sdisabled\b', basket.group(1)):
+            return True
+    return bool(_RX_SOLD_OUT_CLASS_RE.search(html) or _RX_SOLD_OUT_TEXT_RE.search(html))
+
+def _rx_price(html):
+    for price_re in _RX_PRICE_RES:
+        match = price_re.search(html)
+        if match:
+            price = extract_price(_rx_text(match.group(1)))
+            if price:
+                return price
+    for match in _RX_JSON_LD_RE.finditer(html):
+        try:
+            data = json.loads(match.group(1))
+        except ValueError:
+            continue
+        if isinstance(data, dict) and isinstance(data.get('offers'), dict) and 'price' in data['offers']:
+            return float(data['offers']['price'])
+    winner = html.find('winnerVariant')
+    if winner != -1:
+        match = _WINNER_PRICE_RE.search(html, html.rfind('<script', 0, winner), html.find('</script>', winner))
+        if match:
+            return float(match.group(1))
+    for match in _RX_PRICE_TEXT_RE.finditer(html):
+        price = extract_price(match.group(1))
+        if price:
+            return price
+    return None
+
+def parse_product_page_regex(full_url, html):
+    """parse_product_page with regular expressions instead of a DOM; the shadow candidate.
+    
+    Checks the same places in a fixed order, without the strategy registry.
+    """
+    product_name = _rx_name(html) or None
+    if _rx_sold_out(html):
+        return product_name, 0, "Tükendi"
+    
+    price = _rx_price(html)
+    if not product_name:
+        return None, None, "Could not extract product name"
+    if not price:
+        return product_name, None, "Could not extract price"
+    return product_name, price, None
+
+# Candidate parser compared against parse_product_page on a sample of pages (SHADOW_SAMPLE)
+_shadow = ShadowRunner('regex', parse_product_page_regex, SHADOW_SAMPLE, SHADOW_CPU_BUDGET, SHADOW_DIR,
+                       SHADOW_MAX_CASES) if SHADOW_SAMPLE > 0 else None
+
+def get_shadow_stats():
+    """Return shadow comparison counters since start, or None when shadow parsing is off."""
+    return _shadow.get_stats() if _shadow else None
+
+# Search state embedded in listing pages; carries every card's content ID and price
+_LISTING_STATE_MARKER = '__SEARCH_APP_INITIAL_STATE__'
+
+# Card and price selectors of listing pages, newest markup first
+_LISTING_CARD_SELECTORS = ('div.p-card-wrppr', 'div.product-card')
+_LISTING_PRICE_SELECTORS = ('.prc-box-dscntd', '.prc-box-sllng', '.price-item', '.discounted-price')
+
+def _listing_page_url(url, page):
+    """Return the URL of a listing page number (pi query parameter)."""
+    if page == 1:
+        return url
+    parts = urlsplit(url)
+    params = [(key, value) for key, value in parse_qsl(parts.query) if key != 'pi']
+    params.append(('pi', str(page)))
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(params), ''))
+
+def _parse_listing_state(html):
+    """Extract {content_id: (price, in_stock)} from the embedded search state, or None."""
+    start = html.find(_LISTING_STATE_MARKER)
+    if start == -1:
+        return None
+    start = html.find('{', start)
+    try:
+        state, _ = json.JSONDecoder().raw_decode(html, start)
+    except ValueError:
+        return None
+    
+    results = {}
+    for product in state.get('products') or []:
+        try:
+            price_info = product.get('price') or {}
+            price = price_info.get('discountedPrice') or price_info.get('sellingPrice')
+            in_stock = not product.get('isSoldOut', False)
+            if in_stock and not price:
+                continue
+            results[str(product['id'])] = (float(price) if in_stock else 0, in_stock)
+        except (KeyError, TypeError, ValueError):
+            continue
+    return results
+
+def _parse_listing_cards(html):
+    """Extract {content_id: (price, in_stock)} from the product cards of a listing page."""
+    from bs4 import BeautifulSoup
+    
+    soup = BeautifulSoup(html, 'lxml')
+    results = {}
+    for selector in _LISTING_CARD_SELECTORS:
+        for card in soup.select(selector):
+            link = card.find('a', href=PRODUCT_ID_RE)
+            if not link:
+                continue
+            content_id = PRODUCT_ID_RE.search(link['href']).group(1)
             
-        if not price:
-            return product_name, None, "Could not extract price"
+            if 'Tükendi' in card.get_text():
+                results[content_id] = (0, False)
+                continue
             
-        return product_name, price, None
+            for price_selector in _LISTING_PRICE_SELECTORS:
+                price_tag = card.select_one(price_selector)
+                price = extract_price(price_tag.text) if price_tag else None
+                if price:
+                    results[content_id] = (price, True)
+                    break
+        if results:
+            break
+    return results
+
+def scrape_listing_page(url):
+    """Fetch one listing/search/brand page and return ({content_id: (price, in_stock)}, error)."""
+    import requests
+    
+    try:
+        response = http_request('GET', url, timeout=10)
+        if response.status_code != 200:
+            return {}, f"Failed to access the listing page. Status code: {response.status_code}"
         
-    except requests.RequestException as e:
-        return None, None, f"Request error: {str(e)}"
+        results = _parse_listing_state(response.text)
+        if not results:
+            results = _parse_listing_cards(response.text)
+        return results, None
+    except (requests.RequestException, NoEndpointAvailable) as e:
+        return {}, f"Request error: {str(e)}"
     except Exception as e:
-        logger.error(f"Error scraping {url}: {e}")
-        return None, None, f"Error scraping product: {str(e)}"
+        logger.error(f"Error scraping listing {url}: {e}")
+        return {}, f"Error scraping listing: {str(e)}"
 
+def scrape_listings(urls=None, pages=None):
+    """Collect prices from the configured listing pages as {content_id: (price, in_stock)}."""
+    urls = LISTING_URLS if urls is None else urls
+    pages = LISTING_PAGES if pages is None else pages
+    
+    results = {}
+    requests_made = 0
+    for url in urls:
+        for page in range(1, pages + 1):
+            page_results, error = scrape_listing_page(_listing_page_url(url, page))
+            requests_made += 1
+            if error:
+                logger.error(f"Error reading listing {url} page {page}: {error}")
+                break
+            if not page_results:
+                # Past the last page of this listing
+                break
+            results.update(page_results)
+    
+    if urls:
+        logger.info(f"Listing pages: {requests_made} requests, {len(results)} products priced")
+    return results
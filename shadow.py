@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+Shadow comparison of a candidate product page parser against the live one.
+
+With SHADOW_SAMPLE above zero, that fraction of parsed product pages is queued
+for a background thread, which runs the candidate parser on the same HTML and
+compares name, price and stock with what the live parser returned. The thread
+sleeps after every page so it uses at most SHADOW_CPU_BUDGET of one core, and
+pages arriving while its queue is full are skipped, so check cycles never wait
+for it. Disagreeing pages are saved with both results under SHADOW_DIR.
+
+Agreement rate and the candidate's speed relative to the live parser are logged
+after every check cycle. Run directly to inspect saved disagreements, or to
+compare both parsers offline over the HTTP archive:
+
+    python shadow.py cases
+    python shadow.py archive --limit 500
+"""
+
+import argparse
+import gzip
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Pages waiting for the shadow thread; more are skipped
+QUEUE_SIZE = 20
+
+# Prices closer than this count as equal
+PRICE_TOLERANCE = 0.005
+
+FIELDS = ('price', 'stock', 'name')
+
+_CASE_SUFFIX = '.json.gz'
+
+def _normal_name(name):
+    return ' '.join(name.split()).casefold() if name else None
+
+def disagreements(baseline, candidate):
+    """Fields ('price', 'stock', 'name') on which two (name, price, error) results differ."""
+    base_name, base_price, base_error = baseline
+    cand_name, cand_price, cand_error = candidate
+    fields = []
+    base_sold_out, cand_sold_out = base_error == "Tükendi", cand_error == "Tükendi"
+    if base_sold_out != cand_sold_out:
+        fields.append('stock')
+    elif not base_sold_out and (bool(base_price) != bool(cand_price) or
+                                (base_price and abs(base_price - cand_price) > PRICE_TOLERANCE)):
+        fields.append('price')
+    if _normal_name(base_name) != _normal_name(cand_name):
+        fields.append('name')
+    return fields
+
+def _empty_stats():
+    return {'compared': 0, 'agreed': 0, 'skipped': 0, 'errors': 0, 'saved': 0,
+            'baseline_cpu': 0.0, 'candidate_cpu': 0.0, **{field: 0 for field in FIELDS}}
+
+class ShadowRunner:
+    """Run a candidate parser over a sample of pages on a CPU-budgeted background thread."""
+
+    def __init__(self, name, candidate, sample_rate, cpu_budget, case_dir, max_cases):
+        self.name = name
+        self.candidate = candidate
+        self.sample_rate = sample_rate
+        self.cpu_budget = cpu_budget
+        self.case_dir = case_dir
+        self.max_cases = max_cases
+        self._queue = queue.Queue(QUEUE_SIZE)
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stats = _empty_stats()
+
+    def submit(self, full_url, html, result, cpu_time):
+        """Queue a parsed page for comparison if it falls in the sample; never blocks."""
+        if html is None or random.random() >= self.sample_rate:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='shadow-parser', daemon=True)
+                self._thread.start()
+        try:
+            self._queue.put_nowait((full_url, html, result, cpu_time))
+        except queue.Full:
+            with self._lock:
+                self._stats['skipped'] += 1
+
+    def _run(self):
+        while True:
+            full_url, html, baseline, baseline_cpu = self._queue.get()
+            # One bad page must not stop the thread for the rest of the process
+            try:
+                self._compare(full_url, html, baseline, baseline_cpu)
+            except Exception as e:
+                logger.error(f"Shadow parser {self.name} failed on {full_url}: {e}")
+
+    def _compare(self, full_url, html, baseline, baseline_cpu):
+        started = time.thread_time()
+        try:
+            candidate = self.candidate(full_url, html)
+        except Exception as e:
+            candidate = None, None, f"Error scraping product: {e}"
+            with self._lock:
+                self._stats['errors'] += 1
+        elapsed = time.thread_time() - started
+
+        fields = disagreements(baseline, candidate)
+        with self._lock:
+            stats = self._stats
+            stats['compared'] += 1
+            stats['agreed'] += not fields
+            stats['baseline_cpu'] += baseline_cpu
+            stats['candidate_cpu'] += elapsed
+            for field in fields:
+                stats[field] += 1
+        if fields:
+            logger.warning(f"Shadow parser {self.name} disagrees on {', '.join(fields)} for {full_url}: "
+                           f"live {baseline}, candidate {candidate}")
+            self._save_case(full_url, html, baseline, candidate, fields)
+
+        # Stay within the CPU budget: idle for the rest of this page's share
+        time.sleep(elapsed * (1 / self.cpu_budget - 1))
+
+    def _save_case(self, full_url, html, baseline, candidate, fields):
+        """Keep a disagreeing page with both results; the oldest cases go beyond max_cases."""
+        case = {'url': full_url, 'time': time.time(), 'fields': fields,
+                'baseline': list(baseline), 'candidate': list(candidate), 'html': html}
+        path = os.path.join(self.case_dir, f'{time.time_ns()}{_CASE_SUFFIX}')
+        try:
+            os.makedirs(self.case_dir, exist_ok=True)
+            with open(f'{path}.tmp', 'wb') as f:
+                f.write(gzip.compress(json.dumps(case, ensure_ascii=False).encode('utf-8')))
+            os.replace(f'{path}.tmp', path)
+            for old in case_files(self.case_dir)[self.max_cases:]:
+                os.remove(old)
+        except OSError as e:
+            logger.error(f"Error saving shadow case for {full_url}: {e}")
+            return
+        with self._lock:
+            self._stats['saved'] += 1
+
+    def get_stats(self, reset=False):
+        """Return comparison counters, optionally resetting them."""
+        with self._lock:
+            stats = dict(self._stats, parser=self.name)
+            if reset:
+                self._stats = _empty_stats()
+        return stats
+
+def case_files(case_dir):
+    """Saved disagreement files, newest first."""
+    try:
+        names = [name for name in os.listdir(case_dir) if name.endswith(_CASE_SUFFIX)]
+    except FileNotFoundError:
+        return []
+    return [os.path.join(case_dir, name) for name in sorted(names, reverse=True)]
+
+def read_case(path):
+    with gzip.open(path, 'rb') as f:
+        return json.loads(f.read().decode('utf-8'))
+
+def summary(stats):
+    """One-line report of shadow counters."""
+    compared = stats['compared']
+    agreement = stats['agreed'] / compared * 100 if compared else 0.0
+    speed = stats['baseline_cpu'] / stats['candidate_cpu'] if stats['candidate_cpu'] else 0.0
+    return (f"Shadow parser {stats['parser']}: {compared} pages compared, {agreement:.1f}% agreement "
+            f"({', '.join(f'{field} {stats[field]}' for field in FIELDS)} disagreements), "
+            f"{speed:.1f}x the live parser's speed, {stats['skipped']} skipped over budget")
+
+def compare_archive(archive, candidate, name, limit=None):
+    """Run the live and candidate parsers over archived pages; return the counters."""
+    from scraper import parse_product_page
+
+    stats = dict(_empty_stats(), parser=name)
+    for digest, entry in archive.entries()[:limit]:
+        html = archive.read(digest)
+        timings = []
+        results = []
+        for parse in (parse_product_page, candidate):
+            started = time.perf_counter()
+            try:
+                results.append(parse(entry['url'], html))
+            except Exception as e:
+                results.append((None, None, f"Error scraping product: {e}"))
+            timings.append(time.perf_counter() - started)
+        fields = disagreements(*results)
+        stats['compared'] += 1
+        stats['agreed'] += not fields
+        stats['baseline_cpu'] += timings[0]
+        stats['candidate_cpu'] += timings[1]
+        for field in fields:
+            stats[field] += 1
+            print(f"{field:6s} {entry['url']}  live: {results[0]}  candidate: {results[1]}")
+    return stats
+
+def main():
+    from config import SHADOW_DIR
+    from scraper import get_archive, parse_product_page_regex
+
+    parser = argparse.ArgumentParser(description='Inspect shadow parser disagreements.')
+    parser.add_argument('command', choices=('cases', 'archive'))
+    parser.add_argument('--limit', type=int, help='at most this many cases or archived pages, newest first')
+    args = parser.parse_args()
+
+    if args.command == 'cases':
+        paths = case_files(SHADOW_DIR)[:args.limit]
+        for path in paths:
+            case = read_case(path)
+            recorded = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(case['time']))
+            print(f"{recorded}  {','.join(case['fields']):16s} {case['url']}\n"
+                  f"    live: {case['baseline']}\n    candidate: {case['candidate']}")
+        print(f"{len(paths)} cases in {SHADOW_DIR}")
+    else:
+        archive = get_archive()
+        if archive is None:
+            parser.error('HTTP_ARCHIVE_DIR is not set')
+        print(summary(compare_archive(archive, parse_product_page_regex, 'regex', args.limit)))
+
+if __name__ == '__main__':
+    main()
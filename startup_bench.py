@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Startup benchmark: how long a (re)started bot takes to answer again.
+
+Starts main.py against the fake Telegram API with a synthetic store and a /start
+and /listele already waiting, as after a watchdog or systemd restart, and
+measures from process start to the first getUpdates call, the /start reply
+(time to first response) and the /listele reply (needs the loaded store).
+
+    python startup_bench.py --runs 5 --products 20000
+    python startup_bench.py --env RUNTIME=asyncio --baseline before.json
+
+Medians over the runs are reported per measurement.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_telegram import FakeTelegramAPI, start_bot_process, stop_bot_process
+from memory_bench import write_store
+
+def measure_once(store_file, extra_env, timeout=120):
+    """Return seconds from process start to (first getUpdates, /start reply, /listele reply)."""
+    api = FakeTelegramAPI().start()
+    with tempfile.TemporaryDirectory() as workdir:
+        with open(store_file, 'rb') as src, open(os.path.join(workdir, 'tracked_products.json'), 'wb') as dst:
+            dst.write(src.read())
+
+        api.inject_message('/start')
+        api.inject_message('/listele')
+        started = time.monotonic()
+        process = start_bot_process(api, workdir, extra_env)
+        try:
+            if not api.wait_for_call('getUpdates', timeout=timeout):
+                raise RuntimeError('Bot did not start polling')
+            ready = time.monotonic() - started
+
+            replies = []
+            start = 0
+            for _ in range(2):
+                reply = api.wait_for(lambda r: r['method'] == 'sendMessage', timeout=timeout, start=start)
+                if reply is None:
+                    raise RuntimeError('Bot did not answer the queued commands')
+                replies.append(reply)
+                start = api.sent.index(reply) + 1
+            return ready, replies[0]['time'] - started, replies[1]['time'] - started
+        finally:
+            stop_bot_process(process)
+            api.stop()
+
+def run(args):
+    store_dir = tempfile.mkdtemp(prefix='trendyol-startup-')
+    store_file = os.path.join(store_dir, 'tracked_products.json')
+    subscriptions = write_store(store_file, args.products, args.chats, args.shared, args.seed)
+    extra_env = dict(item.split('=', 1) for item in args.env)
+
+    samples = []
+    for index in range(args.runs):
+        samples.append(measure_once(store_file, extra_env))
+        print(f"run {index + 1}: polling {samples[-1][0]:.2f}s, /start {samples[-1][1]:.2f}s, "
+              f"/listele {samples[-1][2]:.2f}s", file=sys.stderr)
+    os.remove(store_file)
+    os.rmdir(store_dir)
+
+    ready, first_response, list_response = zip(*samples)
+    return {
+        'params': {key: value for key, value in vars(args).items() if key not in ('output', 'baseline')},
+        'subscriptions': subscriptions,
+        'summary': {
+            'first_poll_s': round(statistics.median(ready), 3),
+            'first_response_s': round(statistics.median(first_response), 3),
+            'list_response_s': round(statistics.median(list_response), 3),
+        },
+    }
+
+def compare(report, baseline):
+    """Print relative change of the medians against a baseline report."""
+    print(f"{'metric':18s} {'baseline':>10s} {'current':>10s} {'change':>9s}")
+    for name, new in report['summary'].items():
+        old = baseline['summary'].get(name)
+        change = f'{(new - old) / old * 100:+.1f}%' if old else 'n/a'
+        print(f'{name:18s} {old!s:>10s} {new:10} {change:>9s}')
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure time from bot start to its first replies.')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--products', type=int, default=20000, help='subscriptions in the synthetic store')
+    parser.add_argument('--chats', type=int, default=50)
+    parser.add_argument('--shared', type=float, default=0.3)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--env', action='append', default=[], metavar='KEY=VALUE',
+                        help='extra bot setting for this run, e.g. --env RUNTIME=asyncio')
+    parser.add_argument('--output', help='write the JSON report to this file')
+    parser.add_argument('--baseline', help='compare against a previous JSON report')
+    args = parser.parse_args()
+
+    report = run(args)
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    print(text)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            compare(report, json.load(f))
+
+if __name__ == '__main__':
+    main()
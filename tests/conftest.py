@@ -0,0 +1,18 @@
+import os
+import sys
+
+import pytest
+
+# The bot's modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture
+def product():
+    """Factory for a stored product entry as the store and handlers see it."""
+    def make(name='Gömlek', price=100.0, initial_price=None, targets=None):
+        entry = {'product_name': name, 'current_price': price,
+                 'initial_price': price if initial_price is None else initial_price}
+        if targets is not None:
+            entry['target_prices'] = targets
+        return entry
+    return make
@@ -0,0 +1,122 @@
+import pytest
+
+import main
+
+URL = 'https://www.trendyol.com/acme/gomlek-p-1'
+
+class FakeBot:
+    def __init__(self):
+        self.sent = []
+
+    def send_message(self, chat_id, text, **kwargs):
+        self.sent.append((chat_id, text))
+
+@pytest.fixture
+def bot(monkeypatch):
+    bot = FakeBot()
+    prices = []
+    monkeypatch.setattr(main, '_bot_instance', bot)
+    monkeypatch.setattr(main, 'update_product_price', lambda chat_id, url, price: prices.append(price))
+    monkeypatch.setattr(main, 'update_product_name', lambda chat_id, url, name: None)
+    bot.prices = prices
+    return bot
+
+def test_back_in_stock_sends_one_notification(bot, product):
+    assert main.handle_check_result(-100, URL, product(price=0, targets=[120.0]), 'Gömlek', 99.9, None) == 0
+    assert bot.prices == [99.9]
+    assert len(bot.sent) == 1
+    assert 'Tekrar Stokta' in bot.sent[0][1]
+    assert 'Hedef fiyata ulaşıldı' in bot.sent[0][1]
+
+def test_sold_out_then_still_sold_out(bot, product):
+    assert main.handle_check_result(-100, URL, product(price=99.9), 'Gömlek', 0, 'Tükendi') == 0
+    assert main.handle_check_result(-100, URL, product(price=0), 'Gömlek', 0, 'Tükendi') == 0
+    assert bot.prices == [0]
+    assert len(bot.sent) == 1
+    assert 'Tükendi' in bot.sent[0][1]
+
+def test_price_drop(bot, product):
+    assert main.handle_check_result(-100, URL, product(price=100.0), 'Gömlek', 80.0, None) == 0
+    assert bot.prices == [80.0]
+    assert 'Fiyat Düştü' in bot.sent[0][1]
+
+def test_unchanged_price_sends_nothing(bot, product):
+    assert main.handle_check_result(-100, URL, product(price=100.0), 'Gömlek', 100.0, None) == 0
+    assert bot.sent == []
+
+def test_error_counts(bot, product):
+    assert main.handle_check_result(-100, URL, product(price=100.0), None, None, 'Could not extract price') == 1
+    assert bot.sent == []
+
+class LostLease:
+    def held(self):
+        return False
+
+def test_no_notification_after_losing_the_leader_lease(bot, monkeypatch, product):
+    monkeypatch.setattr(main, '_lease', LostLease())
+    assert main.handle_check_result(-100, URL, product(price=100.0), 'Gömlek', 80.0, None) == 0
+    assert main.handle_check_result(-100, URL, product(price=0), 'Gömlek', 80.0, None) == 0
+    assert bot.sent == []
+    assert bot.prices == []
+
+def test_lease_lost_between_update_and_send(bot, monkeypatch, product):
+    class LosingLease:
+        def __init__(self):
+            self.checks = 0
+
+        def held(self):
+            self.checks += 1
+            return self.checks == 1
+    monkeypatch.setattr(main, '_lease', LosingLease())
+    assert main.handle_check_result(-100, URL, product(price=100.0), 'Gömlek', 80.0, None) == 0
+    assert bot.sent == []
+
+class FakeMessage:
+    def __init__(self):
+        self.texts = []
+
+    def reply_text(self, text, **kwargs):
+        self.texts.append(text)
+        return self
+
+    def edit_text(self, text, **kwargs):
+        self.texts.append(text)
+
+class FakeUpdate:
+    def __init__(self, chat_id=-100):
+        self.message = FakeMessage()
+        self.effective_chat = type('Chat', (), {'id': chat_id})()
+
+def test_batch_import_reports_the_failing_url(monkeypatch):
+    def resolve(url):
+        if url.endswith('-p-2'):
+            raise ValueError('kısa link çözülemedi')
+        return url, url.rsplit('-p-', 1)[1]
+
+    added = []
+    monkeypatch.setattr(main, 'resolve_product_url', resolve)
+    monkeypatch.setattr(main, 'find_product', lambda chat_id, product_id: None)
+    monkeypatch.setattr(main, 'scrape_product_info', lambda url: ('Gömlek', 99.9, None))
+    monkeypatch.setattr(main, 'add_products', lambda chat_id, products: added.extend(products) or True)
+    update = FakeUpdate()
+
+    main.batch_import(update, -100, [URL, 'https://www.trendyol.com/acme/etek-p-2'])
+
+    assert [product[0] for product in added] == [URL]
+    assert '• https://www.trendyol.com/acme/etek-p-2 - kısa link çözülemedi' in update.message.texts[-1]
+
+def test_variant_handler_without_a_product_name(monkeypatch):
+    variants = {'M': (99.9, True), 'L': (0, False)}
+    monkeypatch.setattr(main, 'is_allowed_chat', lambda chat_id: True)
+    monkeypatch.setattr(main, 'scrape_product_page', lambda url, with_variants: (None, 99.9, None, variants))
+    monkeypatch.setattr(main, 'find_product', lambda chat_id, product_id: None)
+    monkeypatch.setattr(main, 'add_products', lambda chat_id, products: True)
+
+    update = FakeUpdate()
+    main.variant_handler(update, type('Context', (), {'args': [URL]})())
+    assert update.message.texts[-1].startswith(URL)
+
+    update = FakeUpdate()
+    main.variant_handler(update, type('Context', (), {'args': [URL, 'M']})())
+    assert update.message.texts[-1].startswith(URL)
+    assert '• M: 99.90 TL' in update.message.texts[-1]
@@ -0,0 +1,32 @@
+from fair_queue import ChatCheckCap, fair_order
+
+def test_equal_weights_interleave_chats():
+    order = list(fair_order({1: ['a1', 'a2', 'a3'], 2: ['b1']}))
+    assert order == [(1, 'a1'), (2, 'b1'), (1, 'a2'), (1, 'a3')]
+
+def test_small_chat_is_not_starved_by_a_large_one():
+    order = [chat_id for chat_id, _ in fair_order({1: list(range(1000)), 2: [0, 1]})]
+    assert order.index(2) == 1
+    assert len(order) - order[::-1].index(2) - 1 == 3
+
+def test_weights_share_checks():
+    order = [chat_id for chat_id, _ in fair_order({1: list(range(30)), 2: list(range(30))}, {'1': 2.0})][:30]
+    assert order.count(1) == 20 and order.count(2) == 10
+
+def test_empty_and_zero_weight_chats_are_skipped():
+    assert list(fair_order({1: [], 2: ['b'], 3: ['c']}, {'3': 0})) == [(2, 'b')]
+
+def test_cap_within_sliding_window():
+    cap = ChatCheckCap(2, 60)
+    assert cap.allowance(1, now=0) == 2
+    cap.record(1, now=0)
+    cap.record(1, now=10)
+    assert cap.allowance(1, now=30) == 0
+    assert cap.allowance(2, now=30) == 2
+    assert cap.allowance(1, now=60) == 1
+    assert cap.allowance(1, now=70) == 2
+
+def test_zero_cap_is_unlimited():
+    cap = ChatCheckCap(0, 60)
+    cap.record(1, now=0)
+    assert cap.allowance(1, now=0) is None
@@ -0,0 +1,96 @@
+import time
+import types
+
+import pytest
+
+import http_archive
+from http_archive import HttpArchive, replay_archive
+
+PAGE = ('<html><head><title>Foo - Trendyol</title></head><body><h1 class="pr-new-br"><span>Foo</span></h1>'
+        '{price}<div class="product-button-container"><button class="add-to-basket">Sepete Ekle</button></div>'
+        '<!-- {marker} --></body></html>')
+
+def page(marker, price='<span class="prc-dsc">100,00 TL</span>'):
+    return PAGE.format(price=price, marker=marker)
+
+def url(name):
+    return f'https://www.trendyol.com/acme/{name}-p-1'
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(http_archive, 'time', types.SimpleNamespace(time=lambda: now[0], perf_counter=time.perf_counter))
+    return now
+
+@pytest.fixture
+def archive(tmp_path):
+    return HttpArchive(str(tmp_path), max_bytes=10 ** 9, max_age=10 ** 9, sample_rate=1.0)
+
+def test_lru_eviction_drops_successful_pages_first(archive, clock):
+    for name, error in (('a', None), ('failed', 'Price not found'), ('b', None), ('sold-out', 'Tükendi'),
+                        ('c', None)):
+        clock[0] += 1
+        assert archive.record(url(name), page(name), error)
+    # Replaying a page makes it recently used
+    clock[0] += 1
+    archive.replay(url('a'))
+
+    sizes = {entry['url']: entry['size'] for _, entry in archive.entries()}
+    archive.max_bytes = sizes[url('failed')] + sizes[url('c')] + sizes[url('a')]
+    clock[0] += 1
+    archive._evict(clock[0])
+
+    assert {entry['url'] for _, entry in archive.entries()} == {url('failed'), url('c'), url('a')}
+    assert archive.replay(url('b')) == (404, None)
+    assert archive.replay(url('sold-out')) == (404, None)
+
+def test_failures_are_evicted_only_after_every_success(archive, clock):
+    for name, error in (('failed', 'Price not found'), ('a', None)):
+        clock[0] += 1
+        archive.record(url(name), page(name), error)
+    for entry in archive._entries.values():
+        entry['size'] = 100
+    archive.max_bytes = 100
+    clock[0] += 1
+    archive.record(url('b'), page('b'), None)
+    assert [entry['url'] for _, entry in archive.entries()] == [url('failed')]
+
+def test_expired_pages_are_pruned_with_their_blobs(archive, clock):
+    archive.max_age = 60
+    archive.record(url('old'), page('old'), 'Price not found')
+    digest = archive._by_url[url('old')]
+    clock[0] += 61
+    archive.record(url('new'), page('new'), None)
+    assert [entry['url'] for _, entry in archive.entries()] == [url('new')]
+    with pytest.raises(OSError):
+        archive.read(digest)
+
+def test_index_survives_a_reload(archive, tmp_path):
+    archive.record(url('a'), page('a'), 'Price not found')
+    reloaded = HttpArchive(str(tmp_path), 10 ** 9, 10 ** 9, 1.0, replaying=True)
+    assert reloaded.replay(url('a')) == (200, page('a'))
+    assert not reloaded.record(url('b'), page('b'), 'Price not found')
+
+def test_replay_serves_the_latest_page_of_a_url(archive, clock):
+    archive.record(url('a'), page('first'), None)
+    clock[0] += 1
+    archive.record(url('a'), page('second'), None)
+    assert archive.replay(url('a')) == (200, page('second'))
+    assert archive.replay(url('missing')) == (404, None)
+
+def test_success_sample(tmp_path):
+    archive = HttpArchive(str(tmp_path), 10 ** 9, 10 ** 9, sample_rate=0.0)
+    assert not archive.record(url('a'), page('a'), None)
+    assert archive.record(url('b'), page('b'), 'Price not found')
+
+def test_replay_archive_reports_fixed_and_regressed_pages(archive, clock, capsys):
+    archive.record(url('fixed'), page('fixed'), 'Price not found')
+    archive.record(url('regressed'), page('regressed', price=''), None)
+    archive.record(url('ok'), page('ok'), None)
+    counts = replay_archive(archive)
+    assert counts == {'fixed': 1, 'still_failing': 0, 'regressed': 1, 'unchanged_ok': 1}
+    output = capsys.readouterr().out
+    assert f"fixed          {url('fixed')}" in output
+    assert url('regressed') in output
+
+    assert replay_archive(archive, failures_only=True)['fixed'] == 1
@@ -0,0 +1,29 @@
+import pytest
+
+import main
+
+@pytest.fixture(autouse=True)
+def fragments(monkeypatch):
+    monkeypatch.setattr(main, '_list_fragments', main.OrderedDict())
+    return main._list_fragments
+
+def test_fragment_is_reused_until_the_product_changes(fragments, product):
+    first = main.render_product_fragment(-100, 'https://a', product('Gömlek', 90.0))
+    assert main.render_product_fragment(-100, 'https://a', product('Gömlek', 90.0)) is first
+    changed = main.render_product_fragment(-100, 'https://a', product('Gömlek', 80.0))
+    assert '80.00 TL' in changed
+    assert len(fragments) == 1
+
+def test_cache_drops_least_recently_shown(monkeypatch, fragments, product):
+    monkeypatch.setattr(main, 'LIST_FRAGMENTS_MAX', 2)
+    main.render_product_fragment(-100, 'https://a', product('A', 90.0))
+    main.render_product_fragment(-100, 'https://b', product('B', 90.0))
+    main.render_product_fragment(-100, 'https://a', product('A', 90.0))
+    main.render_product_fragment(-100, 'https://c', product('C', 90.0))
+    assert list(fragments) == [('-100', 'https://a'), ('-100', 'https://c')]
+
+def test_forget_drops_only_that_chat(fragments, product):
+    main.render_product_fragment(-100, 'https://a', product('A', 90.0))
+    main.render_product_fragment(-200, 'https://a', product('A', 90.0))
+    main.forget_list_fragments(-100)
+    assert list(fragments) == [('-200', 'https://a')]
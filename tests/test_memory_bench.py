@@ -0,0 +1,17 @@
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def test_memory_bench_reports_both_layouts(tmp_path):
+    output = tmp_path / 'memory.json'
+    subprocess.run([sys.executable, os.path.join(ROOT, 'memory_bench.py'), '--products', '300', '--chats', '5',
+                    '--output', str(output)], check=True, cwd=tmp_path, capture_output=True, timeout=120)
+    report = json.loads(output.read_text(encoding='utf-8'))
+    for layout in ('dict', 'registry'):
+        assert report[layout]['queued'] == report['subscriptions']
+        assert set(report[layout]['bytes_per_product']) == {
+            'registry', 'with_check_state', 'with_search_index', 'check_queue_peak'}
+    assert report['registry']['bytes_per_product']['registry'] < report['dict']['bytes_per_product']['registry']
@@ -0,0 +1,42 @@
+import pytest
+
+from data_manager import crossed_target_prices
+from main import parse_price
+
+@pytest.mark.parametrize('text, price', [
+    ('1299', 1299.0),
+    ('1299.90', 1299.9),
+    ('1.299', 1299.0),
+    ('12.345.678', 12345678.0),
+    ('1.299,90', 1299.9),
+    ('1299,90 TL', 1299.9),
+    ('₺1.299', 1299.0),
+    ('0.500', 0.5),
+    ('1.29', 1.29),
+])
+def test_parse_price(text, price):
+    assert parse_price(text) == pytest.approx(price)
+
+@pytest.mark.parametrize('text', ['', 'abc', '0', '-5', '1.2.3'])
+def test_parse_price_rejects_invalid(text):
+    assert parse_price(text) is None
+
+def targets(*prices):
+    return {'target_prices': list(prices)}
+
+def test_crossed_targets_between_old_and_new_price():
+    assert crossed_target_prices(targets(100.0, 200.0, 300.0), 250.0, 150.0) == [200.0]
+    assert crossed_target_prices(targets(100.0, 200.0, 300.0), 350.0, 90.0) == [100.0, 200.0, 300.0]
+
+def test_crossed_targets_bounds():
+    # Reaching a target exactly counts; starting at a target does not
+    assert crossed_target_prices(targets(100.0, 200.0), 250.0, 200.0) == [200.0]
+    assert crossed_target_prices(targets(100.0, 200.0), 200.0, 150.0) == []
+
+def test_crossed_targets_without_a_drop():
+    assert crossed_target_prices(targets(100.0, 200.0), 150.0, 180.0) == []
+    assert crossed_target_prices(targets(100.0), 150.0, 0) == []
+    assert crossed_target_prices({'target_prices': None}, 150.0, 90.0) == []
+
+def test_crossed_targets_back_in_stock():
+    assert crossed_target_prices(targets(100.0, 200.0, 300.0), 0, 150.0) == [200.0, 300.0]
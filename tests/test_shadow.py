@@ -0,0 +1,26 @@
+import time
+
+from shadow import ShadowRunner, disagreements
+
+def test_agreeing_results():
+    assert disagreements(('Gömlek', 99.9, None), ('  gömlek ', 99.9001, None)) == []
+    assert disagreements((None, 0, 'Tükendi'), (None, None, 'Tükendi')) == []
+
+def test_price_stock_and_name_disagreements():
+    assert disagreements(('Gömlek', 99.9, None), ('Gömlek', 89.9, None)) == ['price']
+    assert disagreements(('Gömlek', 99.9, None), ('Gömlek', None, 'Error')) == ['price']
+    assert disagreements(('Gömlek', 99.9, None), ('Gömlek', 0, 'Tükendi')) == ['stock']
+    assert disagreements(('Gömlek', 99.9, None), ('Etek', 99.9, None)) == ['name']
+
+def test_runner_survives_a_failing_page(tmp_path):
+    runner = ShadowRunner('test', lambda url, html: ('Gömlek', 99.9, None), 1.0, 1.0, str(tmp_path), 10)
+    # A malformed live result makes the comparison itself raise
+    runner.submit('https://example.com/1', '<html>', None, 0.0)
+    runner.submit('https://example.com/2', '<html>', ('Gömlek', 89.9, None), 0.0)
+    deadline = time.monotonic() + 5
+    while runner.get_stats()['compared'] < 1 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    stats = runner.get_stats()
+    assert stats['compared'] == 1
+    assert stats['price'] == 1
+    assert stats['saved'] == 1
@@ -0,0 +1,123 @@
+import json
+import threading
+
+import pytest
+
+import data_manager
+from scraper import normalize_product_url, split_variant, variant_url
+
+SHORT_LINK = 'https://ty.gl/abc123'
+FULL_URL = 'https://m.trendyol.com/acme/gomlek-p-111?boutiqueId=61&utm_source=share'
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    """Point data_manager at an empty store in tmp_path; returns a function writing raw store JSON."""
+    path = tmp_path / 'tracked_products.json'
+    monkeypatch.setattr(data_manager, 'DATA_FILE', str(path))
+    monkeypatch.setattr(data_manager, 'PRICE_HISTORY_FILE', '')
+    monkeypatch.setattr(data_manager, '_data', None)
+    monkeypatch.setattr(data_manager, '_store_version', data_manager.STORE_VERSION)
+
+    def write(stored):
+        path.write_text(json.dumps(stored), encoding='utf-8')
+        data_manager._data = None
+    write.path = path
+    return write
+
+def test_normalize_product_url_drops_tracking_and_mobile_host():
+    assert normalize_product_url(FULL_URL) == (
+        'https://www.trendyol.com/acme/gomlek-p-111?boutiqueId=61', '111')
+    assert normalize_product_url('https://trendyol.com/acme/gomlek-p-111/yorumlar') == (
+        'https://www.trendyol.com/acme/gomlek-p-111', '111')
+
+def test_normalize_product_url_pins_merchant_and_variant():
+    url, product_id = normalize_product_url('https://www.trendyol.com/acme/gomlek-p-111?merchantId=968&v=M')
+    assert product_id == '111-m968-vM'
+    assert split_variant(url) == ('https://www.trendyol.com/acme/gomlek-p-111?merchantId=968', 'M')
+    assert variant_url(*split_variant(url)) == url
+
+def test_normalize_product_url_without_content_id():
+    assert normalize_product_url(SHORT_LINK) == (SHORT_LINK, None)
+
+def test_migration_resolves_short_links_once_outside_the_lock(store, product):
+    store({'-100': {SHORT_LINK: product('Gömlek'), FULL_URL: product('Gömlek')},
+           '-200': {'https://ty.gl/broken': product('Kazak')}})
+    calls = []
+
+    def resolve(url):
+        # Another thread can use the store while links are being resolved
+        other = threading.Thread(target=data_manager.product_count)
+        other.start()
+        other.join(timeout=2)
+        assert not other.is_alive()
+        calls.append(url)
+        return FULL_URL if url == SHORT_LINK else url
+
+    assert data_manager.migrate_product_keys(resolve) == 2
+    assert sorted(calls) == [SHORT_LINK, 'https://ty.gl/broken']
+    assert list(data_manager.get_all_products()[-100]) == ['https://www.trendyol.com/acme/gomlek-p-111?boutiqueId=61']
+
+    stored = json.loads(store.path.read_text(encoding='utf-8'))
+    assert stored['_version'] == data_manager.STORE_VERSION
+
+    # Reloaded, the migrated store is not migrated again, unresolvable links included
+    data_manager._data = None
+    calls.clear()
+    assert data_manager.migrate_product_keys(resolve) == 0
+    assert calls == []
+    assert 'https://ty.gl/broken' in data_manager.get_all_products()[-200]
+
+def test_price_history_rotates_past_its_size_limit(tmp_path, monkeypatch):
+    history = tmp_path / 'price_history.jsonl'
+    monkeypatch.setattr(data_manager, 'PRICE_HISTORY_FILE', str(history))
+    monkeypatch.setattr(data_manager, 'PRICE_HISTORY_MAX_MB', 1000 / 1024 / 1024)
+    for price in range(1, 41):
+        data_manager._record_prices([(-100, 'https://a', '1', float(price))])
+    assert history.stat().st_size <= 1000
+    assert (tmp_path / 'price_history.jsonl.1').stat().st_size > 1000
+    prices = [observation['price'] for observation in data_manager.iter_price_history(-100)]
+    # Both files are read, oldest first, and nothing beyond the two files is kept
+    assert prices == sorted(prices) and prices[-1] == 40.0 and len(prices) < 40
+
+def names(results):
+    return [info['product_name'] for _, info in results]
+
+def test_tokenize_folds_case_and_turkish_letters():
+    assert data_manager.tokenize('İPEK Şal, ÇANTA ığdır Gömlek-XL') == ['ipek', 'sal', 'canta', 'igdir', 'gomlek', 'xl']
+    assert data_manager.tokenize(None) == []
+
+def test_search_matches_word_prefixes_exact_words_first(store, product):
+    store({'-100': {
+        'https://www.trendyol.com/a/p-1': product('Kulaklık Bluetooth'),
+        'https://www.trendyol.com/a/p-2': product('Kulak Temizleyici'),
+        'https://www.trendyol.com/a/p-3': product('Mont'),
+    }, '-200': {'https://www.trendyol.com/a/p-4': product('Kulaklık')}})
+    assert names(data_manager.search_products(-100, 'kul')) == ['Kulak Temizleyici', 'Kulaklık Bluetooth']
+    assert names(data_manager.search_products(-100, 'kulak')) == ['Kulak Temizleyici', 'Kulaklık Bluetooth']
+    assert names(data_manager.search_products(-100, 'KULAKLIK')) == ['Kulaklık Bluetooth']
+    assert names(data_manager.search_products(-100, 'kul blue')) == ['Kulaklık Bluetooth']
+    assert names(data_manager.search_products(-100, 'kul mont')) == []
+    # Terms shorter than MIN_PREFIX_LENGTH match nothing
+    assert data_manager.search_products(-100, 'k') == []
+    # Other chats' products are never matched
+    assert names(data_manager.search_products(-100, 'kulaklik', limit=5)) == ['Kulaklık Bluetooth']
+
+def test_search_index_follows_add_rename_and_remove(store):
+    data_manager.add_product(-100, 'https://www.trendyol.com/a/p-1', 'Mavi Gömlek', 100.0, '1')
+    assert names(data_manager.search_products(-100, 'gomlek')) == ['Mavi Gömlek']
+
+    # The index built by the first search is kept up to date from then on
+    data_manager.add_product(-100, 'https://www.trendyol.com/a/p-2', 'Siyah Gömlek', 100.0, '2')
+    assert names(data_manager.search_products(-100, 'göm')) == ['Mavi Gömlek', 'Siyah Gömlek']
+
+    data_manager.update_product_name(-100, 'https://www.trendyol.com/a/p-1', 'Mavi Kazak')
+    assert names(data_manager.search_products(-100, 'gomlek')) == ['Siyah Gömlek']
+    assert names(data_manager.search_products(-100, 'kazak')) == ['Mavi Kazak']
+
+    data_manager.remove_product(-100, 'https://www.trendyol.com/a/p-2', '2')
+    assert data_manager.search_products(-100, 'gomlek') == []
+    assert data_manager.search_products(-100, 'siyah') == []
+
+    # Re-adding a product under another link replaces its old entry
+    data_manager.add_product(-100, 'https://www.trendyol.com/b/p-1', 'Yeşil Kazak', 100.0, '1')
+    assert names(data_manager.search_products(-100, 'kazak')) == ['Yeşil Kazak']
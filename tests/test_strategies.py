@@ -0,0 +1,105 @@
+import pytest
+
+import scraper
+from scraper import StrategyRegistry, parse_product_page
+
+# Pages the old registry needed before it disabled a strategy that never hit
+TRAINING_PAGES = 40
+
+URL = 'https://www.trendyol.com/acme/gomlek-p-1'
+KEY = ('trendyol.com', 'pdp-legacy')
+
+PAGE = '''<html><head><title>Foo - Trendyol</title>{ld}</head><body>
+<h1 class="pr-new-br"><span>Foo</span></h1>
+<div class="product-price-container">{price}</div>
+<div class="product-button-container">{button}</div>
+</body></html>'''
+
+LD_JSON = '<script type="application/ld+json">{{"offers": {{"price": "{}"}}}}</script>'
+
+def tl(price):
+    return f'{price:.2f}'.replace('.', ',') + ' TL'
+
+def page(button='<button class="add-to-basket">Sepete Ekle</button>', price=100.0, ld_price=None, campaign=None):
+    return PAGE.format(
+        ld=LD_JSON.format(ld_price) if ld_price else '',
+        price=(f'<p class="campaign-price">{tl(campaign)}</p>' if campaign else '') +
+              (f'<span class="prc-dsc">{tl(price)}</span>' if price else ''),
+        button=button,
+    )
+
+@pytest.fixture(autouse=True)
+def fresh_stats():
+    scraper.get_strategy_stats(reset=True)
+    yield
+    scraper.get_strategy_stats(reset=True)
+
+def test_sold_out_detected_after_many_in_stock_pages():
+    for _ in range(TRAINING_PAGES):
+        assert parse_product_page(URL, page()) == ('Foo', 100.0, None)
+    for disabled_button in ('<button class="add-to-basket" disabled>Sepete Ekle</button>',
+                            '<button class="add-to-basket" disabled="disabled">Sepete Ekle</button>'):
+        assert parse_product_page(URL, page(button=disabled_button)) == ('Foo', 0, 'Tükendi')
+
+def test_price_precedence_survives_training():
+    # prc-dsc comes before json-ld whatever their observed cost
+    for _ in range(TRAINING_PAGES):
+        assert parse_product_page(URL, page(price=100.0, ld_price=90.0))[1] == 100.0
+    assert parse_product_page(URL, page(price=None, ld_price=90.0))[1] == 90.0
+
+def test_campaign_price_wins_after_many_pages_without_one():
+    for _ in range(TRAINING_PAGES):
+        assert parse_product_page(URL, page(price=200.0)) == ('Foo', 200.0, None)
+    assert parse_product_page(URL, page(price=200.0, campaign=150.0)) == ('Foo', 150.0, None)
+
+def make_registry(kind, hits):
+    """Registry of strategies 'a', 'b', 'c' returning hits[name] and counting calls."""
+    registry = StrategyRegistry()
+    registry.set_kind('g', kind)
+    calls = []
+    for name in ('a', 'b', 'c'):
+        def strategy(soup, name=name):
+            calls.append(name)
+            return hits.get(name)
+        registry.register('g', name)(strategy)
+    return registry, calls
+
+def test_precedence_group_runs_in_registration_order():
+    registry, calls = make_registry('precedence', {'b': 2, 'c': 3})
+    for _ in range(TRAINING_PAGES):
+        assert registry.run('g', KEY, None) == ('b', 2)
+    assert set(calls) == {'a', 'b'}
+
+def test_precedence_group_never_skips_a_strategy_that_never_hit():
+    hits = {'b': 2, 'c': 3}
+    registry, calls = make_registry('precedence', hits)
+    for _ in range(TRAINING_PAGES):
+        registry.run('g', KEY, None)
+    calls.clear()
+    hits['a'] = 1
+    assert registry.run('g', KEY, None) == ('a', 1)
+    # A lower strategy still decides when every higher one misses
+    hits.clear()
+    hits['c'] = 3
+    assert registry.run('g', KEY, None) == ('c', 3)
+    assert calls == ['a', 'a', 'b', 'c']
+
+def test_detectors_are_never_disabled_and_misses_count_only_on_hits():
+    hits = {}
+    registry, calls = make_registry('detector', hits)
+    for _ in range(TRAINING_PAGES):
+        assert registry.run('g', KEY, None) == (None, None)
+    assert registry.get_stats() == {}
+
+    hits['c'] = True
+    assert registry.run('g', KEY, None) == ('c', True)
+    stats = {stat['name']: stat for stat in registry.get_stats()['trendyol.com/pdp-legacy']['g']}
+    assert stats['c']['hit_rate'] == 1
+
+def test_detectors_run_the_best_hitter_first():
+    registry, calls = make_registry('detector', {'c': True})
+    for _ in range(5):
+        registry.run('g', KEY, None)
+    calls.clear()
+    registry.run('g', KEY, None)
+    assert calls == ['c']
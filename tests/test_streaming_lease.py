@@ -0,0 +1,108 @@
+import pytest
+import requests
+
+import scraper
+from egress import EgressPool
+
+PAGE = ('<html><head><title>Foo - Trendyol</title></head><body><h1 class="pr-new-br"><span>Foo</span></h1>'
+        '<span class="prc-dsc">100,00 TL</span><div class="product-button-container">'
+        '<button class="add-to-basket">Sepete Ekle</button></div></body></html>').encode('utf-8')
+
+class FakeRaw:
+    def __init__(self):
+        self.position = 0
+
+    def tell(self):
+        return self.position
+
+class FakeResponse:
+    """Streamed response recording how many requests its endpoint had in flight while the body was read."""
+
+    def __init__(self, pool, status_code=200):
+        self.pool = pool
+        self.status_code = status_code
+        self.url = 'https://www.trendyol.com/acme/foo-p-1'
+        self.headers = {}
+        self.encoding = 'utf-8'
+        self.raw = FakeRaw()
+        self.inflight_during_body = []
+        self.closed = False
+
+    def iter_content(self, chunk_size):
+        for start in range(0, len(PAGE), 64):
+            self.inflight_during_body.append(self.pool.endpoints[0].inflight)
+            self.raw.position = start + 64
+            yield PAGE[start:start + 64]
+
+    def close(self):
+        self.closed = True
+
+@pytest.fixture
+def pool(monkeypatch):
+    pool = EgressPool(['direct'], ['test-agent'], max_inflight=1)
+    monkeypatch.setattr(scraper, '_egress', pool)
+    return pool
+
+def serve(monkeypatch, responses):
+    def request(method, url, **kwargs):
+        return responses.pop(0)
+    monkeypatch.setattr(requests, 'request', request)
+
+def test_streamed_body_is_read_under_the_lease(pool, monkeypatch):
+    response = FakeResponse(pool)
+    serve(monkeypatch, [response])
+    status_code, html = scraper._fetch_page_streaming(response.url)
+    assert status_code == 200 and 'prc-dsc' in html
+    assert response.inflight_during_body and set(response.inflight_during_body) == {1}
+    assert response.closed
+    assert pool.endpoints[0].inflight == 0
+    assert pool.endpoints[0].requests == 1
+
+def test_stock_probe_reads_under_the_lease(pool, monkeypatch):
+    response = FakeResponse(pool)
+    serve(monkeypatch, [response])
+    assert scraper.probe_stock(response.url) is True
+    assert set(response.inflight_during_body) == {1}
+    assert pool.endpoints[0].inflight == 0
+
+def test_blocked_response_is_not_read(pool, monkeypatch):
+    response = FakeResponse(pool, status_code=429)
+    serve(monkeypatch, [response])
+    assert scraper._fetch_page_streaming(response.url) == (429, None)
+    assert response.inflight_during_body == []
+    assert pool.endpoints[0].blocks == 1
+
+def test_savings_only_measured_with_a_content_length(pool, monkeypatch):
+    sized, chunked = FakeResponse(pool), FakeResponse(pool)
+    sized.headers = {'Content-Length': '100000'}
+    serve(monkeypatch, [sized, chunked])
+    scraper.get_stream_stats(reset=True)
+    scraper._fetch_page_streaming(sized.url)
+    scraper._fetch_page_streaming(chunked.url)
+    stats = scraper.get_stream_stats(reset=True)
+    assert stats['pages'] == 2 and stats['early_closed'] == 2
+    assert stats['measured'] == 1
+    assert stats['bytes_saved'] == 100000 - sized.raw.position
+
+SPLIT_PAGE = ('<html><h1 class="pr-new-br"><span>Foo</span></h1><div class="product-button-container">'
+              '<button class="add-to-basket">Sepete Ekle</button></div>'
+              '<span class="prc-dsc">1.299,90 TL</span><p>rest of the page</p></html>').encode('utf-8')
+
+@pytest.mark.parametrize('marker', [b'1.2', b'1.299,9', b'1.299,90 TL'])
+def test_price_split_across_chunks_is_read_whole(marker):
+    split = SPLIT_PAGE.index(marker) + len(marker)
+    extractor = scraper.StreamingExtractor()
+    extractor.feed(SPLIT_PAGE[:split])
+    assert not extractor.complete
+    extractor.feed(SPLIT_PAGE[split:])
+    assert extractor.complete
+    html = bytes(extractor.buffer).decode('utf-8')
+    assert scraper.parse_product_page('https://www.trendyol.com/acme/foo-p-1', html)[1] == 1299.9
+
+def test_winner_variant_price_split_across_chunks():
+    extractor = scraper.StreamingExtractor()
+    extractor.feed(b'<h1>Foo</h1><button class="add-to-basket">Sepete Ekle</button>'
+                   b'<script>{"winnerVariant": {"price": {"value": 12')
+    assert not extractor.has_price
+    extractor.feed(b'99.9, "currency": "TRY"}}}</script>')
+    assert extractor.has_price
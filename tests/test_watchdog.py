@@ -0,0 +1,54 @@
+import os
+
+import pytest
+
+os.environ.setdefault('WATCHDOG_LOG_FILE', '')
+
+import watchdog
+from leader import LeaderLease, default_node_id
+
+PID = 4242
+
+@pytest.fixture
+def lease_file(tmp_path, monkeypatch):
+    path = str(tmp_path / 'leader.db')
+    monkeypatch.setattr(watchdog, 'HA_LEASE_FILE', path)
+    monkeypatch.setattr(watchdog, 'HA_NODE_ID', '')
+    return path
+
+def take(path, node_id):
+    assert LeaderLease(path, node_id, 15).acquire()
+
+def test_configured_node_id_is_recognised_as_leader(lease_file, monkeypatch):
+    monkeypatch.setattr(watchdog, 'HA_NODE_ID', 'pi-salon')
+    take(lease_file, 'pi-salon')
+    dog = watchdog.TrendyolBotWatchdog()
+    assert dog.leader_status(PID).startswith('Bu örnek lider')
+    # A failed leader waits for the standby to take the lease over
+    assert not dog.restart_due(PID, watchdog.time.time())
+    assert dog.restart_due(PID, watchdog.time.time() - watchdog.HA_FAILOVER_GRACE)
+
+def test_default_node_id_is_recognised_as_leader(lease_file):
+    take(lease_file, default_node_id(PID))
+    assert watchdog.TrendyolBotWatchdog().leader_status(PID).startswith('Bu örnek lider')
+
+def test_standby_is_restarted_right_away(lease_file, monkeypatch):
+    monkeypatch.setattr(watchdog, 'HA_NODE_ID', 'pi-salon')
+    take(lease_file, 'pi-mutfak')
+    dog = watchdog.TrendyolBotWatchdog()
+    assert dog.leader_status(PID) == 'Lider: pi-mutfak (dönem 1), bu örnek yedek olarak dönecek'
+    assert dog.restart_due(PID, watchdog.time.time())
+
+def test_free_lease_waits_for_the_standby(lease_file):
+    lease = LeaderLease(lease_file, default_node_id(PID), 15)
+    lease.acquire()
+    lease.release()
+    dog = watchdog.TrendyolBotWatchdog()
+    assert dog.leader_status(PID).startswith('Lider kira boşta')
+    assert not dog.restart_due(PID, watchdog.time.time())
+
+def test_without_ha_the_watchdog_restarts(monkeypatch):
+    monkeypatch.setattr(watchdog, 'HA_LEASE_FILE', '')
+    dog = watchdog.TrendyolBotWatchdog()
+    assert dog.leader_status(PID) is None
+    assert dog.restart_due(PID, watchdog.time.time())
@@ -11,30 +11,65 @@ import subprocess
 import logging
 import os
 from datetime import datetime
-from config import TELEGRAM_BOT_TOKEN, ADMIN_CHAT_ID
-
-# Logging konfigürasyonu
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('watchdog.log'),
-        logging.StreamHandler()
-    ]
+import signal
+from collections import deque
+from config import (
+    TELEGRAM_BOT_TOKEN, ADMIN_CHAT_ID, LOG_FORMAT, LOG_MAX_BYTES, LOG_BACKUP_COUNT, HA_LEASE_FILE, HA_LEASE_TTL, HA_NODE_ID
 )
+from heartbeat import read_pid, read_heartbeat, is_process_alive
+from leader import read_lease, default_node_id
+from log_setup import setup_logging
+
+# Logging konfigürasyonu: watchdog.log boyuta göre döndürülür, yazma arka plan thread'inde yapılır
+WATCHDOG_LOG_FILE = os.getenv('WATCHDOG_LOG_FILE', 'watchdog.log')
+setup_logging(WATCHDOG_LOG_FILE, LOG_FORMAT, LOG_MAX_BYTES, LOG_BACKUP_COUNT)
 logger = logging.getLogger(__name__)
 
 # Watchdog ayarları
-PROCESS_NAME = "python"
-SCRIPT_NAME = "main.py"
-CHECK_INTERVAL = 300  # 5 dakika
+CHECK_INTERVAL = 15  # saniye; heartbeat okuması O(1) olduğu için sık kontrol ucuz
+SCHEDULER_STALL_TIMEOUT = 300  # Zamanlayıcı bu kadar saniye sessiz kalırsa takılmış sayılır
+DISPATCHER_STALL_TIMEOUT = 180  # Dispatcher bu kadar saniye sessiz kalırsa takılmış sayılır
 MAX_RESTART_ATTEMPTS = 3
 RESTART_DELAY = 30  # 30 saniye
+# HA modunda lider kira yedeğe geçmezse bu kadar saniye sonra yine de yeniden başlat
+HA_FAILOVER_GRACE = 4 * HA_LEASE_TTL
+
+# Kaynak izleme ayarları
+SAMPLE_INTERVAL = 60  # saniye; kaynak örnekleme aralığı
+SAMPLE_WINDOW = 360  # halka tampon boyutu (60 sn ile 6 saat)
+MIN_TREND_SAMPLES = 30  # trend hesaplamak için gereken en az örnek
+MIN_TREND_R2 = 0.6  # trendin gürültü değil gerçek büyüme sayılması için uyum eşiği
+RSS_GROWTH_LIMIT = 2 * 1024 * 1024  # byte/saat; üzeri sızıntı şüphesi
+HANDLE_GROWTH_LIMIT = 5  # FD/soket/thread artışı (adet/saat); üzeri sızıntı şüphesi
+EXHAUSTION_HORIZON_HOURS = 24  # bellek bu süre içinde bitecekse yeniden başlatma planla
+URGENT_HORIZON_HOURS = 1  # bellek bu süre içinde bitecekse sessiz pencereyi bekleme
+QUIET_HOURS = (3, 6)  # planlı yeniden başlatma penceresi (03:00-06:00)
+
+def fit_trend(samples, key):
+    """Örneklerdeki bir alan için en küçük kareler eğimi (birim/saat) ve R² değeri döndür."""
+    n = len(samples)
+    xs = [(sample['time'] - samples[0]['time']) / 3600 for sample in samples]
+    ys = [sample[key] for sample in samples]
+    mean_x = sum(xs) / n
+    mean_y = sum(ys) / n
+    sxx = sum((x - mean_x) ** 2 for x in xs)
+    if sxx == 0:
+        return 0.0, 0.0
+    sxy = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys))
+    slope = sxy / sxx
+    syy = sum((y - mean_y) ** 2 for y in ys)
+    r2 = (sxy * sxy) / (sxx * syy) if syy else 0.0
+    return slope, r2
 
 class TrendyolBotWatchdog:
     def __init__(self):
         self.restart_attempts = 0
         self.last_restart_time = 0
+        self.samples = deque(maxlen=SAMPLE_WINDOW)
+        self.sampled_pid = None
+        self.last_sample_time = 0
+        self.last_heartbeat = None
+        self.leak_restart_pending = False
         
     def send_telegram_message(self, message):
         """Telegram mesajı gönder"""
@@ -62,18 +97,202 @@ class TrendyolBotWatchdog:
             logger.error(f"Telegram mesaj gönderilemedi: {e}")
             return False
 
+    def check_bot_health(self):
+        """PID dosyası ve heartbeat kaydı ile bot durumunu kontrol et.
+
+        (durum, pid, detay) döner; durum 'running', 'dead' veya 'stalled' olur.
+        """
+        pid = read_pid()
+        if not is_process_alive(pid):
+            return 'dead', None, "Process bulunamadı"
+
+        record = read_heartbeat()
+        if not record or record['pid'] != pid:
+            return 'dead', pid, "Heartbeat kaydı bulunamadı"
+        self.last_heartbeat = record
+
+        now = time.time()
+        scheduler_age = now - record['scheduler_beat']
+        dispatcher_age = now - record['dispatcher_beat']
+
+        if scheduler_age > SCHEDULER_STALL_TIMEOUT:
+            detail = f"Zamanlayıcı {int(scheduler_age)} saniyedir yanıt vermiyor"
+            if record['cycle_started_at']:
+                detail += f" (kontrol: {record['cycle_checked']}/{record['cycle_total']})"
+            return 'stalled', pid, detail
+
+        if dispatcher_age > DISPATCHER_STALL_TIMEOUT:
+            return 'stalled', pid, f"Dispatcher {int(dispatcher_age)} saniyedir yanıt vermiyor"
+
+        return 'running', pid, None
+
+    def lease_state(self, pid):
+        """HA modunda (durum, kira) döndür; durum 'self', 'other' veya 'free', HA_LEASE_FILE yoksa (None, None).
+
+        Bu makinedeki bot HA_NODE_ID ile, yoksa varsayılan host:pid adıyla tanınır.
+        """
+        if not HA_LEASE_FILE:
+            return None, None
+        lease = read_lease(HA_LEASE_FILE)
+        if not lease or lease['expires_at'] <= time.time():
+            return 'free', lease
+        pid = pid or read_pid()
+        node_id = HA_NODE_ID or (default_node_id(pid) if pid else None)
+        return ('self' if lease['holder'] == node_id else 'other'), lease
+
+    def leader_status(self, pid):
+        """HA modunda lider kira durumunu açıklayan satır; HA_LEASE_FILE yoksa None."""
+        state, lease = self.lease_state(pid)
+        if state is None:
+            return None
+        if state == 'free':
+            return "Lider kira boşta, yedek örnek devralmak üzere"
+        if state == 'self':
+            return f"Bu örnek lider (dönem {lease['term']}), yedeğin devralması bekleniyor"
+        return f"Lider: {lease['holder']} (dönem {lease['term']}), bu örnek yedek olarak dönecek"
+
+    def restart_due(self, pid, failing_since):
+        """Sorunlu bot şimdi yeniden başlatılsın mı?
+
+        HA modunda asıl devir yolu lider kirasıdır: kira başka örneğe geçince bu bot
+        yedek olarak yeniden başlatılır. Kira HA_FAILOVER_GRACE içinde geçmezse
+        (yedek yok ya da takılan lider kirayı yeniliyor) yine de yeniden başlatılır.
+        """
+        state, _ = self.lease_state(pid)
+        if state in (None, 'other'):
+            return True
+        return time.time() - failing_since >= HA_FAILOVER_GRACE
+
     def is_bot_running(self):
         """Bot'un çalışıp çalışmadığını kontrol et"""
-        for proc in psutil.process_iter(['pid', 'name', 'cmdline']):
-            try:
-                if proc.info['name'] == PROCESS_NAME:
-                    cmdline = ' '.join(proc.info['cmdline']) if proc.info['cmdline'] else ''
-                    if SCRIPT_NAME in cmdline and 'watchdog.py' not in cmdline:
-                        logger.debug(f"Bot process bulundu: PID {proc.info['pid']}")
-                        return True, proc.info['pid']
-            except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
-                continue
-        return False, None
+        status, pid, _ = self.check_bot_health()
+        return status == 'running', pid
+
+    def sample_resources(self, pid):
+        """Bot process'inin kaynak kullanımını halka tampona ekle"""
+        if pid != self.sampled_pid:
+            # Yeni process: eski trend geçersiz
+            self.samples.clear()
+            self.sampled_pid = pid
+            self.leak_restart_pending = False
+
+        try:
+            proc = psutil.Process(pid)
+            with proc.oneshot():
+                cpu = proc.cpu_times()
+                sample = {
+                    'time': time.time(),
+                    'rss': proc.memory_info().rss,
+                    'cpu_time': cpu.user + cpu.system,
+                    'fds': proc.num_fds(),
+                    'threads': proc.num_threads(),
+                }
+            sample['sockets'] = len(proc.connections(kind='inet'))
+        except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess) as e:
+            logger.warning(f"Kaynak örneği alınamadı: {e}")
+            return
+
+        self.samples.append(sample)
+        self.last_sample_time = sample['time']
+
+    def analyze_trends(self):
+        """Örneklerden trendleri hesapla; (özet, sızıntı bulguları, bellek bitişine kalan saat) döndür"""
+        samples = list(self.samples)
+        if len(samples) < MIN_TREND_SAMPLES:
+            return None, [], None
+
+        first, last = samples[0], samples[-1]
+        elapsed = last['time'] - first['time']
+        cpu_percent = (last['cpu_time'] - first['cpu_time']) / elapsed * 100 if elapsed > 0 else 0.0
+
+        trends = {key: fit_trend(samples, key) for key in ('rss', 'fds', 'threads', 'sockets')}
+        findings = []
+        hours_left = None
+
+        rss_slope, rss_r2 = trends['rss']
+        if rss_slope > RSS_GROWTH_LIMIT and rss_r2 >= MIN_TREND_R2:
+            hours_left = psutil.virtual_memory().available / rss_slope
+            findings.append(f"RSS sürekli artıyor (+{rss_slope / 1024 / 1024:.1f} MB/saat)")
+
+        labels = {'fds': 'Açık dosya', 'threads': 'Thread', 'sockets': 'Soket'}
+        for key, label in labels.items():
+            slope, r2 = trends[key]
+            if slope > HANDLE_GROWTH_LIMIT and r2 >= MIN_TREND_R2:
+                findings.append(f"{label} sayısı birikiyor (+{slope:.1f}/saat)")
+
+        summary = (
+            f"<b>Örnek:</b> {len(samples)} ({elapsed / 3600:.1f} saat)\n"
+            f"<b>RSS:</b> {last['rss'] / 1024 / 1024:.1f} MB ({rss_slope / 1024 / 1024:+.2f} MB/saat)\n"
+            f"<b>CPU:</b> %{cpu_percent:.1f}\n"
+            f"<b>FD:</b> {last['fds']} ({trends['fds'][0]:+.1f}/saat)\n"
+            f"<b>Thread:</b> {last['threads']} ({trends['threads'][0]:+.1f}/saat)\n"
+            f"<b>Soket:</b> {last['sockets']} ({trends['sockets'][0]:+.1f}/saat)"
+        )
+        return summary, findings, hours_left
+
+    def is_quiet_window(self):
+        """Bot boşta mı ve planlı yeniden başlatma saatlerinde miyiz"""
+        idle = bool(self.last_heartbeat) and not self.last_heartbeat['cycle_started_at']
+        start_hour, end_hour = QUIET_HOURS
+        return idle and start_hour <= datetime.now().hour < end_hour
+
+    def check_resource_trends(self, pid):
+        """Kaynak örneği al, sızıntı varsa sessiz pencerede planlı restart yap"""
+        if time.time() - self.last_sample_time >= SAMPLE_INTERVAL or pid != self.sampled_pid:
+            self.sample_resources(pid)
+
+        summary, findings, hours_left = self.analyze_trends()
+        if not findings:
+            return
+
+        if hours_left is not None and hours_left > EXHAUSTION_HORIZON_HOURS and len(findings) == 1:
+            # Yalnızca yavaş bellek artışı var; henüz müdahale gerekmiyor
+            return
+
+        if not self.leak_restart_pending:
+            self.leak_restart_pending = True
+            remaining = f"~{hours_left:.1f} saat" if hours_left is not None else "bilinmiyor"
+            logger.warning(f"Kaynak sızıntısı şüphesi: {', '.join(findings)}")
+            self.send_telegram_message(
+                f"📈 <b>Kaynak Sızıntısı Şüphesi</b>\n\n"
+                f"{chr(10).join('• ' + finding for finding in findings)}\n\n"
+                f"{summary}\n"
+                f"<b>Belleğin bitmesine:</b> {remaining}\n\n"
+                f"Sessiz pencerede ({QUIET_HOURS[0]:02d}:00-{QUIET_HOURS[1]:02d}:00) yeniden başlatılacak."
+            )
+
+        urgent = hours_left is not None and hours_left < URGENT_HORIZON_HOURS
+        idle = bool(self.last_heartbeat) and not self.last_heartbeat['cycle_started_at']
+        if self.is_quiet_window() or (urgent and idle):
+            self.graceful_restart(summary)
+
+    def graceful_restart(self, summary):
+        """Sızıntı nedeniyle planlı (SIGTERM ile) yeniden başlatma"""
+        logger.info("Planlı yeniden başlatma yapılıyor (kaynak sızıntısı)")
+        self.send_telegram_message(
+            f"🔄 <b>Planlı Yeniden Başlatma</b>\n\n"
+            f"<b>Zaman:</b> {datetime.now().strftime('%d.%m.%Y %H:%M:%S')}\n"
+            f"<b>Sebep:</b> Kaynak sızıntısı\n\n"
+            f"{summary}"
+        )
+        try:
+            result = subprocess.run(
+                ['sudo', 'systemctl', 'restart', 'trendyol-bot.service'],
+                capture_output=True,
+                text=True,
+                timeout=60
+            )
+            if result.returncode != 0:
+                logger.error(f"Planlı restart hatası: {result.stderr}")
+                return False
+        except Exception as e:
+            logger.error(f"Planlı restart hatası: {e}")
+            return False
+
+        self.samples.clear()
+        self.leak_restart_pending = False
+        time.sleep(RESTART_DELAY)
+        return True
 
     def restart_bot(self):
         """Bot'u yeniden başlat"""
@@ -119,6 +338,12 @@ class TrendyolBotWatchdog:
         try:
             logger.info("Manuel başlatma deneniyor...")
             
+            # Takılmış eski process varsa önce sonlandır
+            old_pid = read_pid()
+            if is_process_alive(old_pid):
+                logger.info(f"Takılmış process sonlandırılıyor (PID: {old_pid})")
+                os.kill(old_pid, signal.SIGKILL)
+            
             # Mevcut dizini al
             script_dir = os.path.dirname(os.path.abspath(__file__))
             main_script = os.path.join(script_dir, 'main.py')
@@ -148,6 +373,43 @@ class TrendyolBotWatchdog:
             
         return False
 
+    def restart_and_report(self):
+        """Bot'u yeniden başlat ve sonucu bildir; bot yeniden çalışıyorsa True döndür"""
+        if not self.restart_bot():
+            self.send_telegram_message(f"""
+❌ <b>Bot Restart Başarısız!</b>
+
+<b>Zaman:</b> {datetime.now().strftime('%d.%m.%Y %H:%M:%S')}
+<b>Restart Denemesi:</b> {self.restart_attempts}/{MAX_RESTART_ATTEMPTS}
+
+Logları kontrol edin. Manuel müdahale gerekebilir.
+            """)
+            return False
+        
+        # Restart sonrası kontrol et
+        time.sleep(10)
+        is_running_after_restart, new_pid = self.is_bot_running()
+        
+        if is_running_after_restart:
+            self.send_telegram_message(f"""
+✅ <b>Bot Başarıyla Yeniden Başlatıldı!</b>
+
+<b>Zaman:</b> {datetime.now().strftime('%d.%m.%Y %H:%M:%S')}
+<b>Yeni PID:</b> {new_pid}
+<b>Restart Denemesi:</b> {self.restart_attempts}/{MAX_RESTART_ATTEMPTS}
+            """)
+            return True
+        
+        self.send_telegram_message(f"""
+❌ <b>Bot Yeniden Başlatılamadı!</b>
+
+<b>Zaman:</b> {datetime.now().strftime('%d.%m.%Y %H:%M:%S')}
+<b>Restart Denemesi:</b> {self.restart_attempts}/{MAX_RESTART_ATTEMPTS}
+
+{'Manuel müdahale gerekli!' if self.restart_attempts >= MAX_RESTART_ATTEMPTS else 'Tekrar denenecek...'}
+        """)
+        return False
+
     def reset_restart_counter(self):
         """Restart sayacını sıfırla"""
         if self.restart_attempts > 0:
@@ -162,72 +424,52 @@ class TrendyolBotWatchdog:
         self.send_telegram_message(
             f"🤖 <b>Trendyol Bot Watchdog Başlatıldı</b>\n\n"
             f"<b>Zaman:</b> {datetime.now().strftime('%d.%m.%Y %H:%M:%S')}\n"
-            f"<b>Kontrol Aralığı:</b> {CHECK_INTERVAL // 60} dakika\n"
+            f"<b>Kontrol Aralığı:</b> {CHECK_INTERVAL} saniye\n"
             f"<b>Durum:</b> İzleme aktif"
         )
         
         consecutive_failures = 0
+        failing_since = None
+        restart_tried = False
         
         while True:
             try:
-                is_running, pid = self.is_bot_running()
+                status, pid, detail = self.check_bot_health()
                 
-                if is_running:
+                if status == 'running':
                     logger.debug(f"Bot çalışıyor (PID: {pid})")
                     self.reset_restart_counter()
                     consecutive_failures = 0
+                    self.check_resource_trends(pid)
                 else:
                     consecutive_failures += 1
-                    logger.error(f"Bot çalışmıyor! (Ardışık hata: {consecutive_failures})")
+                    logger.error(f"Bot çalışmıyor! ({detail}) (Ardışık hata: {consecutive_failures})")
                     
-                    # İlk hatada hemen bildir ve restart dene
+                    # İlk hatada hemen bildir; HA modunda restart kira yedeğe geçene kadar bekleyebilir
                     if consecutive_failures == 1:
+                        failing_since = time.time()
+                        restart_tried = self.restart_due(pid, failing_since)
+                        title = "Trendyol Bot Takıldı!" if status == 'stalled' else "Trendyol Bot Durdu!"
+                        leader = self.leader_status(pid)
                         message = f"""
-🚨 <b>Trendyol Bot Durdu!</b>
+🚨 <b>{title}</b>
 
 <b>Zaman:</b> {datetime.now().strftime('%d.%m.%Y %H:%M:%S')}
-<b>Durum:</b> Process bulunamadı
+<b>Durum:</b> {detail}
 <b>Restart Denemesi:</b> {self.restart_attempts + 1}/{MAX_RESTART_ATTEMPTS}
+{f'<b>HA:</b> {leader}' if leader else ''}
 
-Yeniden başlatılıyor...
+{'Yeniden başlatılıyor...' if restart_tried else f'Kira yedeğe geçince (en fazla {int(HA_FAILOVER_GRACE)} saniye sonra) yeniden başlatılacak.'}
                         """
                         self.send_telegram_message(message)
                         
-                        if self.restart_bot():
-                            # Restart sonrası kontrol et
-                            time.sleep(10)
-                            is_running_after_restart, new_pid = self.is_bot_running()
-                            
-                            if is_running_after_restart:
-                                success_message = f"""
-✅ <b>Bot Başarıyla Yeniden Başlatıldı!</b>
-
-<b>Zaman:</b> {datetime.now().strftime('%d.%m.%Y %H:%M:%S')}
-<b>Yeni PID:</b> {new_pid}
-<b>Restart Denemesi:</b> {self.restart_attempts}/{MAX_RESTART_ATTEMPTS}
-                                """
-                                self.send_telegram_message(success_message)
-                                consecutive_failures = 0
-                            else:
-                                error_message = f"""
-❌ <b>Bot Yeniden Başlatılamadı!</b>
-
-<b>Zaman:</b> {datetime.now().strftime('%d.%m.%Y %H:%M:%S')}
-<b>Restart Denemesi:</b> {self.restart_attempts}/{MAX_RESTART_ATTEMPTS}
-
-{'Manuel müdahale gerekli!' if self.restart_attempts >= MAX_RESTART_ATTEMPTS else 'Tekrar denenecek...'}
-                                """
-                                self.send_telegram_message(error_message)
-                        else:
-                            error_message = f"""
-❌ <b>Bot Restart Başarısız!</b>
-
-<b>Zaman:</b> {datetime.now().strftime('%d.%m.%Y %H:%M:%S')}
-<b>Restart Denemesi:</b> {self.restart_attempts}/{MAX_RESTART_ATTEMPTS}
-
-Logları kontrol edin. Manuel müdahale gerekebilir.
-                            """
-                            self.send_telegram_message(error_message)
+                        if restart_tried and self.restart_and_report():
+                            consecutive_failures = 0
+                    elif not restart_tried and self.restart_due(pid, failing_since):
+                        logger.info(f"HA: {self.leader_status(pid)}, bot yeniden başlatılıyor")
+                        restart_tried = True
+                        if self.restart_and_report():
+                            consecutive_failures = 0
                 
                 # Kontrol aralığı bekle
                 time.sleep(CHECK_INTERVAL)
@@ -0,0 +1,88 @@
+import hmac
+import json
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from telegram import Update
+
+logger = logging.getLogger(__name__)
+
+# Largest update body we accept; Telegram updates are a few KB at most
+MAX_BODY_SIZE = 1024 * 1024
+
+class _WebhookRequestHandler(BaseHTTPRequestHandler):
+    """Accept Telegram update POSTs and hand them to the dispatcher queue."""
+
+    server_version = 'TrendyolBotWebhook'
+
+    def do_POST(self):
+        server = self.server
+        if self.path != server.url_path:
+            self._reply(404)
+            return
+
+        token = self.headers.get('X-Telegram-Bot-Api-Secret-Token', '')
+        if server.secret_token and not hmac.compare_digest(token, server.secret_token):
+            logger.warning(f"Webhook request with invalid secret token from {self.client_address[0]}")
+            self._reply(403)
+            return
+
+        try:
+            length = int(self.headers.get('Content-Length', '0'))
+        except ValueError:
+            length = 0
+        if length <= 0 or length > MAX_BODY_SIZE:
+            self._reply(400)
+            return
+
+        try:
+            data = json.loads(self.rfile.read(length))
+            update = Update.de_json(data, server.bot)
+        except Exception as e:
+            logger.error(f"Invalid webhook update: {e}")
+            self._reply(400)
+            return
+
+        # Reply immediately; the dispatcher workers process the update
+        server.update_queue.put(update)
+        self._reply(200)
+
+    def do_GET(self):
+        self._reply(404)
+
+    def _reply(self, status):
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+class WebhookServer:
+    """Local HTTP server that receives Telegram updates behind a reverse proxy."""
+
+    def __init__(self, bot, update_queue, listen, port, url_path, secret_token):
+        self.httpd = ThreadingHTTPServer((listen, port), _WebhookRequestHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.bot = bot
+        self.httpd.update_queue = update_queue
+        self.httpd.url_path = url_path
+        self.httpd.secret_token = secret_token
+        self._thread = None
+
+    @property
+    def port(self):
+        return self.httpd.server_address[1]
+
+    def start(self):
+        """Serve requests in a background thread."""
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name='webhook', daemon=True)
+        self._thread.start()
+        logger.info(f"Webhook server listening on {self.httpd.server_address[0]}:{self.port}{self.httpd.url_path}")
+
+    def stop(self):
+        """Stop accepting updates and close the socket."""
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread:
+            self._thread.join(timeout=5)